@@ -39,10 +39,19 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   event SetTvlCap(uint tvlCap);
   event SetLiquidityPerTick(uint8 liquidityPerTick);
   event SetFullRangeShare(uint8 fullRangeShare);
+  event SetIncrementalRebalance(bool incrementalRebalance);
+  event SetQueue(address queue);
+  event SetRebalanceThresholds(uint16 idleThresholdX4, uint16 fullRangeThresholdX4);
+  event SettleQueue(uint amount0, uint amount1, uint liquidity0, uint liquidity1);
   event DepositedFees(address token, uint amount, uint value);
 
-  /// @notice Ticks properly ordered in ascending price order
-  TokenisableRange[] public ticks;
+  /// @notice Ticks properly ordered in ascending price order, stored by slot so that ticks can be added at both ends in O(1)
+  mapping(int => TokenisableRange) private tickSlots;
+  /// @notice Slot of the first tick, decremented when shifting a tick
+  int private firstTickSlot;
+  uint private tickCount;
+  /// @notice Lending pool aToken of each tick, cached when the tick is added
+  mapping(address => address) public tickATokens;
   /// @notice Full range position
   TokenisableRange public immutable fullRange;
 
@@ -50,6 +59,8 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @notice Pair tokens
   ERC20 public immutable token0;
   ERC20 public immutable token1;
+  uint8 internal immutable token0Decimals;
+  uint8 internal immutable token1Decimals;
   bool public isEnabled = true;
   bool private baseTokenIsToken0;
   /// @notice Pool base fee 
@@ -57,6 +68,16 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   // Split underlying liquidity on X ticks below and X above current price. More volatile assets would benefit from being spread out
   uint8 public liquidityPerTick = 3;
   uint8 public fullRangeShare = 20;
+  /// @notice Only move assets in ticks whose holdings differ from their target allocation
+  bool public incrementalRebalance;
+  /// @notice Tick index around which assets were last deployed
+  uint public lastTickIndex;
+  /// @notice Drift of idle assets from their target, as a share of TVL, above which a rebalancing is needed
+  uint16 public idleThresholdX4 = 200;
+  /// @notice Drift of the full range from its target, as a share of TVL, above which a rebalancing is needed
+  uint16 public fullRangeThresholdX4 = 200;
+  /// @notice Epoch queue allowed to settle batched deposits and withdrawals
+  address public queue;
   /// @notice Max vault TVL with 8 decimals
   uint96 public tvlCap = 1e12;
   address public treasury;
@@ -66,11 +87,22 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   IPriceOracle public oracle;
   IWETH private WETH;
   
+  /// @notice Vault reserves and oracle prices, computed once and shared by the valuation and fee calculations of a call
+  struct Reserves {
+    uint amount0;
+    uint amount1;
+    uint price0;
+    uint price1;
+    uint valueX8;
+  }
+  
   /// CONSTANTS 
   uint256 internal constant Q96 = 0x1000000000000000000000000;
   uint internal constant UINT256MAX = type(uint256).max;
   int24 internal constant MIN_TICK = -887272;
   int24 internal constant MAX_TICK = -MIN_TICK;
+  /// @notice Holdings within 1% of their target aren't modified during incremental rebalancing
+  uint internal constant REBALANCE_TOLERANCE_X4 = 100;
 
   constructor(
     address _treasury, 
@@ -92,6 +124,8 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     (address lpap, address _token0, address _token1,, ) = RoeRouter(roeRouter).pools(poolId);
     token0 = ERC20(_token0);
     token1 = ERC20(_token1);
+    token0Decimals = ERC20(_token0).decimals();
+    token1Decimals = ERC20(_token1).decimals();
     
     TokenisableRange t = TokenisableRange(fullRange_);
     (ERC20 t0,) = t.TOKEN0();
@@ -146,6 +180,33 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     fullRangeShare = _fullRangeShare; 
     emit SetLiquidityPerTick(_fullRangeShare);
   }
+  
+  
+  /// @notice Set incremental rebalancing mode
+  /// @param _incrementalRebalance If true, rebalance/deposit/withdraw only touch ticks whose allocation changes
+  function setIncrementalRebalance(bool _incrementalRebalance) public onlyOwner {
+    incrementalRebalance = _incrementalRebalance;
+    emit SetIncrementalRebalance(_incrementalRebalance);
+  }
+  
+  
+  /// @notice Set the thresholds used by needsRebalance
+  /// @param _idleThresholdX4 Max drift of idle assets from their target, in E4 of TVL
+  /// @param _fullRangeThresholdX4 Max drift of the full range from its target, in E4 of TVL
+  function setRebalanceThresholds(uint16 _idleThresholdX4, uint16 _fullRangeThresholdX4) public onlyOwner {
+    require(_idleThresholdX4 < 1e4 && _fullRangeThresholdX4 < 1e4, "GEV: Invalid Threshold");
+    idleThresholdX4 = _idleThresholdX4;
+    fullRangeThresholdX4 = _fullRangeThresholdX4;
+    emit SetRebalanceThresholds(_idleThresholdX4, _fullRangeThresholdX4);
+  }
+  
+  
+  /// @notice Set the epoch queue, or disable queued mode with address 0
+  /// @param _queue Queue address
+  function setQueue(address _queue) public onlyOwner {
+    queue = _queue;
+    emit SetQueue(_queue);
+  }
 
 
   /// @notice Add a new ticker to the list
@@ -155,16 +216,16 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     (ERC20 t0,) = t.TOKEN0();
     (ERC20 t1,) = t.TOKEN1();
     require(t0 == token0 && t1 == token1, "GEV: Invalid TR");
-    if (ticks.length == 0) ticks.push(t);
-    else {
+    refreshAToken(tr);
+    if (tickCount > 0) {
       // Check that tick is properly ordered
       if (baseTokenIsToken0) 
-        require( t.lowerTick() > ticks[ticks.length-1].upperTick(), "GEV: Push Tick Overlap");
+        require( t.lowerTick() > ticks(tickCount-1).upperTick(), "GEV: Push Tick Overlap");
       else 
-        require( t.upperTick() < ticks[ticks.length-1].lowerTick(), "GEV: Push Tick Overlap");
-      
-      ticks.push(TokenisableRange(tr));
+        require( t.upperTick() < ticks(tickCount-1).lowerTick(), "GEV: Push Tick Overlap");
     }
+    tickSlots[firstTickSlot + int(tickCount)] = t;
+    tickCount++;
     emit PushTick(tr);
   }  
 
@@ -176,24 +237,20 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     (ERC20 t0,) = t.TOKEN0();
     (ERC20 t1,) = t.TOKEN1();
     require(t0 == token0 && t1 == token1, "GEV: Invalid TR");
-    if (ticks.length == 0) ticks.push(t);
-    else {
+    refreshAToken(tr);
+    if (tickCount > 0) {
       // Check that tick is properly ordered
       if (!baseTokenIsToken0) 
-        require( t.lowerTick() > ticks[0].upperTick(), "GEV: Shift Tick Overlap");
+        require( t.lowerTick() > ticks(0).upperTick(), "GEV: Shift Tick Overlap");
       else 
-        require( t.upperTick() < ticks[0].lowerTick(), "GEV: Shift Tick Overlap");
-      
-      // extend array by pushing last elt
-      ticks.push(ticks[ticks.length-1]);
-      // shift each element
-      if (ticks.length > 2){
-        for (uint k = 0; k < ticks.length - 2; k++) 
-          ticks[ticks.length - 2 - k] = ticks[ticks.length - 3 - k];
-        }
-      // add new tick in first place
-      ticks[0] = t;
+        require( t.upperTick() < ticks(0).lowerTick(), "GEV: Shift Tick Overlap");
+      // deployed ticks moved up by one
+      lastTickIndex++;
     }
+    // add new tick in first place
+    firstTickSlot--;
+    tickSlots[firstTickSlot] = t;
+    tickCount++;
     emit ShiftTick(tr);
   }
 
@@ -206,15 +263,38 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     (ERC20 t1,) = TokenisableRange(tr).TOKEN1();
     require(t0 == token0 && t1 == token1, "GEV: Invalid TR");
     removeFromAllRanges();
-    ticks[index] = TokenisableRange(tr);
+    refreshAToken(tr);
+    require(index < tickCount, "GEV: Invalid Tick");
+    tickSlots[firstTickSlot + int(index)] = TokenisableRange(tr);
     if (isEnabled) deployAssets();
     emit ModifyTick(tr, index);
   }
   
+  
+  /// @notice Update the cached aToken of all ticks, in case a reserve was reinitialized in the lending pool
+  function refreshATokens() public {
+    for (uint k = 0; k < tickCount; k++) refreshAToken(address(ticks(k)));
+  }
+  
+  
+  /// @notice Cache the lending pool aToken of a tick
+  /// @param tr Tick address
+  function refreshAToken(address tr) internal {
+    tickATokens[tr] = lendingPool.getReserveData(tr).aTokenAddress;
+  }
+  
+  /// @notice Ticks getter
+  /// @param index Tick index
+  /// @return tick Tick address
+  function ticks(uint index) public view returns (TokenisableRange tick){
+    require(index < tickCount, "GEV: Invalid Tick");
+    tick = tickSlots[firstTickSlot + int(index)];
+  }
+  
   /// @notice Ticks length getter
   /// @return len Ticks length
   function getTickLength() public view returns(uint len){
-    len = ticks.length;
+    len = tickCount;
   }
   
   /// @notice Set the base fee
@@ -240,8 +320,41 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @dev Provide the list of tickers from 
   function rebalance() public {
     require(poolMatchesOracle(), "GEV: Oracle Error");
-    removeFromAllRanges();
-    if (isEnabled) deployAssets();
+    if (incrementalRebalance && isEnabled) deployAssetsIncremental(0, 0);
+    else {
+      removeFromAllRanges();
+      if (isEnabled) deployAssets();
+    }
+  }
+  
+  
+  /// @notice Rebalance only if needed
+  /// @return isRebalanced Whether the vault was rebalanced
+  function rebalanceIfNeeded() public returns (bool isRebalanced) {
+    if (!needsRebalance()) return false;
+    rebalance();
+    isRebalanced = true;
+  }
+  
+  
+  /// @notice Whether rebalancing would significantly modify the vault positions
+  /// @dev True if the active tick moved, or if idle assets or the full range drifted from their target allocation beyond thresholds
+  function needsRebalance() public view returns (bool) {
+    if (tickCount == 0 || !isEnabled) return false;
+    uint tickIndex = getActiveTickIndex();
+    if (tickIndex != lastTickIndex) return true;
+    Reserves memory r = getReservesSnapshot();
+    if (r.valueX8 == 0) return false;
+    
+    (uint fr0, uint fr1) = fullRange.getTokenAmounts(fullRange.balanceOf(address(this)));
+    // deployAssets pairs the full range share of each token, so the full range is limited by the scarcer token
+    uint value0 = getTokenValue(r, address(token0), r.amount0);
+    uint value1 = getTokenValue(r, address(token1), r.amount1);
+    uint frTargetX8 = 2 * (value0 < value1 ? value0 : value1) * fullRangeShare / 100;
+    uint frValueX8 = getTokenValue(r, address(token0), fr0) + getTokenValue(r, address(token1), fr1);
+    if (isDrifted(frValueX8, frTargetX8, fullRangeThresholdX4, r.valueX8)) return true;
+    
+    return isIdleDrifted(r, true, r.amount0 - fr0, tickIndex) || isIdleDrifted(r, false, r.amount1 - fr1, tickIndex);
   }
   
 
@@ -250,19 +363,48 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @param token Address of the token redeemed for
   /// @return amount Total token returned
   /// @dev For simplicity+efficieny, withdrawal is like a rebalancing, but a subset of the tokens are sent back to the user before redeploying
+  /// @dev In incremental mode, only the necessary assets are freed from the active ticks, falling back to a full rebalancing if not enough
   function withdraw(uint liquidity, address token) public nonReentrant returns (uint amount) {
+    amount = _withdraw(liquidity, token, false);
+  }
+  
+  
+  /// @notice Withdraw assets by only pulling the needed amount from the most liquid active ticks, without rebalancing
+  /// @param liquidity Amount of GEV tokens to redeem; if 0, redeem all
+  /// @param token Address of the token redeemed for
+  /// @return amount Total token returned
+  /// @dev Falls back to a full withdrawal if the active ticks don't hold enough token, or if the active tick moved since the last rebalance
+  function withdrawLight(uint liquidity, address token) public nonReentrant returns (uint amount) {
+    amount = _withdraw(liquidity, token, true);
+  }
+  
+  
+  /// @notice Withdraw assets from the ticker
+  /// @param liquidity Amount of GEV tokens to redeem; if 0, redeem all
+  /// @param token Address of the token redeemed for
+  /// @param isLight Only pull the needed amount from the active ticks
+  /// @return amount Total token returned
+  function _withdraw(uint liquidity, address token, bool isLight) internal returns (uint amount) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
     require(poolMatchesOracle(), "GEV: Oracle Error");
     if (liquidity == 0) liquidity = balanceOf(msg.sender);
     require(liquidity <= balanceOf(msg.sender), "GEV: Insufficient Balance");
     require(liquidity > 0, "GEV: Withdraw Zero");
     
-    uint vaultValueX8 = getTVL();
-    uint valueX8 = vaultValueX8 * liquidity / totalSupply();
-    amount = valueX8 * 10**ERC20(token).decimals() / oracle.getAssetPrice(token);
-    uint fee = amount * getAdjustedBaseFee(token == address(token1)) / 1e4;
+    // free the needed assets from the active ticks if possible, else remove everything
+    bool isFullCycle = !isEnabled || !(isLight || incrementalRebalance);
+    // pending fees belong to the withdrawer pro-rata, collect them before the snapshot
+    if (!isFullCycle) claimAllFees();
+    uint fee;
+    (amount, fee) = getWithdrawAmount(getReservesSnapshot(), token, liquidity, totalSupply());
     
     _burn(msg.sender, liquidity);
-    removeFromAllRanges();
+    if (!isFullCycle) {
+      if (isLight) isFullCycle = !withdrawFromActiveTicks(token, amount);
+      else deployAssetsIncremental(token == address(token0) ? amount : 0, token == address(token1) ? amount : 0);
+      isFullCycle = isFullCycle || ERC20(token).balanceOf(address(this)) < amount;
+    }
+    if (isFullCycle) removeFromAllRanges();
     ERC20(token).safeTransfer(treasury, fee);
     uint bal = amount - fee;
 
@@ -276,7 +418,7 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     }
     
     // if pool enabled, deploy assets in ticks, otherwise just let assets sit here until totally withdrawn
-    if (isEnabled) deployAssets();
+    if (isEnabled && isFullCycle) deployAssets();
     emit Withdraw(msg.sender, token, amount, liquidity);
   }
 
@@ -297,6 +439,41 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @param token Token address
   /// @param amount Amount of token deposited
   function deposit(address token, uint amount) public payable nonReentrant returns (uint liquidity) 
+  {
+    (liquidity, ) = _deposit(token, amount, 0, false);
+  }
+  
+  
+  /// @notice deposit the amount of tokens needed to mint an exact amount of GEV tokens
+  /// @param liquidity Amount of GEV tokens minted
+  /// @param token Token address
+  /// @param maxAmount Max amount of token deposited
+  /// @return amount Amount of token deposited
+  function mint(uint liquidity, address token, uint maxAmount) public nonReentrant returns (uint amount) 
+  {
+    require(liquidity > 0, "GEV: Deposit Zero");
+    (, amount) = _deposit(token, maxAmount, liquidity, false);
+  }
+  
+  
+  /// @notice deposit tokens pro-rata in the currently active ticks and the full range, without rebalancing
+  /// @param token Token address
+  /// @param amount Amount of token deposited
+  /// @dev Falls back to a full deposit if the active tick moved since the last rebalance
+  function depositLight(address token, uint amount) public payable nonReentrant returns (uint liquidity) 
+  {
+    (liquidity, ) = _deposit(token, amount, 0, true);
+  }
+  
+  
+  /// @notice deposit tokens in the pool, convert to WETH if necessary
+  /// @param token Token address
+  /// @param amount Amount of token deposited
+  /// @param mintLiquidity If not 0, amount of GEV tokens minted, and amount is the max amount of token deposited
+  /// @param isLight Only deposit in the active ticks, without rebalancing
+  /// @return liquidity Amount of GEV tokens minted
+  /// @return depositAmount Amount of token deposited
+  function _deposit(address token, uint amount, uint mintLiquidity, bool isLight) internal returns (uint liquidity, uint depositAmount) 
   {
     require(amount > 0 || msg.value > 0, "GEV: Deposit Zero");
     require(isEnabled, "GEV: Pool Disabled");
@@ -304,10 +481,16 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     require(poolMatchesOracle(), "GEV: Oracle Error");
     
     // first remove all liquidity so as to force pending fees transfer
-    removeFromAllRanges();
+    // in incremental and light modes, only collect pending fees so that the snapshot includes them
+    if (!isLight && !incrementalRebalance) removeFromAllRanges();
+    else claimAllFees();
     
-    uint vaultValueX8 = getTVL();   
-    uint adjBaseFee = getAdjustedBaseFee(token == address(token0));
+    Reserves memory r = getReservesSnapshot();
+    if (mintLiquidity > 0) {
+      uint maxAmount = amount;
+      amount = getMintAmount(r, token, mintLiquidity, totalSupply());
+      require(amount <= maxAmount, "GEV: Max Amount Exceeded");
+    }
     // Wrap if necessary and deposit here
     if (msg.value > 0){
       require(token == address(WETH), "GEV: Invalid Weth");
@@ -320,27 +503,145 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
     }
     
     // Send deposit fee to treasury
-    uint fee = amount * adjBaseFee / 1e4;
+    uint fee;
+    uint valueX8;
+    (liquidity, fee, valueX8) = getDepositLiquidity(r, token, amount, totalSupply());
     ERC20(token).safeTransfer(treasury, fee);
-    uint valueX8 = oracle.getAssetPrice(token) * (amount - fee) / 10**ERC20(token).decimals();
-
-    require(tvlCap > valueX8 + vaultValueX8, "GEV: Max Cap Reached");
-
-    uint tSupply = totalSupply();
-    // initial liquidity at 1e18 token ~ $1
-    if (tSupply == 0 || vaultValueX8 == 0)
-      liquidity = valueX8 * 1e10;
-    else {
-      liquidity = tSupply * valueX8 / vaultValueX8;
+    require(tvlCap > valueX8 + r.valueX8, "GEV: Max Cap Reached");
+    if (mintLiquidity > 0) {
+      // rounding dust stays in the vault
+      require(liquidity >= mintLiquidity, "GEV: Mint Error");
+      liquidity = mintLiquidity;
     }
+    depositAmount = amount;
     
-    deployAssets();
+    // light deposits fall back to the full path if the active tick moved since the last rebalance
+    if (!isLight || !depositInActiveTicks(token, amount - fee)) {
+      if (incrementalRebalance) deployAssetsIncremental(0, 0);
+      else {
+        if (isLight) removeFromAllRanges();
+        deployAssets();
+      }
+    }
     require(liquidity > 0, "GEV: No Liquidity Added");
     _mint(msg.sender, liquidity);    
     emit Deposit(msg.sender, token, amount, liquidity);
   }
   
   
+  /// @notice Settle a batch of queued deposits and withdrawals with a single remove/deploy cycle
+  /// @param amounts Amounts of token0 and token1 deposited, pulled from the queue
+  /// @param liquidities GEV tokens redeemed for token0 and for token1, burnt from the queue
+  /// @return shares GEV tokens minted to the queue for the token0 and token1 deposits
+  /// @return redeemed Amounts of token0 and token1 sent to the queue
+  /// @dev All entries are priced at the same reserves snapshot, and pay the same fees as immediate deposits and withdrawals
+  function settleQueue(uint[2] memory amounts, uint[2] memory liquidities) external nonReentrant returns (uint[2] memory shares, uint[2] memory redeemed) {
+    require(msg.sender == queue, "GEV: Unauthorized");
+    require(isEnabled, "GEV: Pool Disabled");
+    require(poolMatchesOracle(), "GEV: Oracle Error");
+    removeFromAllRanges();
+    
+    Reserves memory r = getReservesSnapshot();
+    uint tSupply = totalSupply();
+    uint depositValueX8;
+    for (uint i = 0; i < 2; i++){
+      uint valueX8;
+      (shares[i], valueX8) = settleQueuedDeposit(i == 0 ? token0 : token1, amounts[i], r, tSupply);
+      depositValueX8 += valueX8;
+      redeemed[i] = settleQueuedWithdrawal(i == 0 ? token0 : token1, liquidities[i], r, tSupply);
+    }
+    require(tvlCap > depositValueX8 + r.valueX8, "GEV: Max Cap Reached");
+    
+    deployAssets();
+    emit SettleQueue(amounts[0], amounts[1], liquidities[0], liquidities[1]);
+  }
+  
+  
+  /// @notice Pull queued deposits and mint the corresponding GEV tokens to the queue
+  /// @param token Token deposited
+  /// @param amount Amount deposited
+  /// @param r Reserves snapshot before settlement
+  /// @param tSupply Total supply before settlement
+  /// @return liquidity GEV tokens minted
+  /// @return valueX8 Value deposited, after fees
+  function settleQueuedDeposit(ERC20 token, uint amount, Reserves memory r, uint tSupply) internal returns (uint liquidity, uint valueX8) {
+    if (amount == 0) return (0, 0);
+    token.safeTransferFrom(msg.sender, address(this), amount);
+    uint fee;
+    (liquidity, fee, valueX8) = getDepositLiquidity(r, address(token), amount, tSupply);
+    token.safeTransfer(treasury, fee);
+    require(liquidity > 0, "GEV: No Liquidity Added");
+    _mint(msg.sender, liquidity);
+    emit Deposit(msg.sender, address(token), amount, liquidity);
+  }
+  
+  
+  /// @notice Burn queued GEV tokens and send the corresponding amount of token to the queue
+  /// @param token Token redeemed for
+  /// @param liquidity GEV tokens redeemed
+  /// @param r Reserves snapshot before settlement
+  /// @param tSupply Total supply before settlement
+  /// @return amount Amount of token sent, after fees
+  function settleQueuedWithdrawal(ERC20 token, uint liquidity, Reserves memory r, uint tSupply) internal returns (uint amount) {
+    if (liquidity == 0) return 0;
+    uint fee;
+    (amount, fee) = getWithdrawAmount(r, address(token), liquidity, tSupply);
+    _burn(msg.sender, liquidity);
+    token.safeTransfer(treasury, fee);
+    token.safeTransfer(msg.sender, amount - fee);
+    emit Withdraw(msg.sender, address(token), amount, liquidity);
+    amount -= fee;
+  }
+  
+  
+  /// @notice Preview the GEV tokens minted for a deposit
+  /// @param token Token address
+  /// @param amount Amount of token deposited
+  /// @return liquidity Amount of GEV tokens minted
+  /// @dev Pending fees collected by the deposit can slightly increase the TVL, hence reduce the GEV tokens minted
+  function previewDeposit(address token, uint amount) public view returns (uint liquidity) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
+    (liquidity,,) = getDepositLiquidity(getReservesSnapshot(), token, amount, totalSupply());
+  }
+  
+  
+  /// @notice Preview the amount of token needed to mint an amount of GEV tokens
+  /// @param liquidity Amount of GEV tokens minted
+  /// @param token Token address
+  /// @return amount Amount of token deposited
+  function previewMint(uint liquidity, address token) public view returns (uint amount) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
+    amount = getMintAmount(getReservesSnapshot(), token, liquidity, totalSupply());
+  }
+  
+  
+  /// @notice Preview the amount of token received for redeeming GEV tokens
+  /// @param liquidity Amount of GEV tokens redeemed
+  /// @param token Token address
+  /// @return amount Amount of token received, net of fees
+  function previewWithdraw(uint liquidity, address token) public view returns (uint amount) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
+    uint tSupply = totalSupply();
+    if (tSupply == 0) return 0;
+    uint fee;
+    (amount, fee) = getWithdrawAmount(getReservesSnapshot(), token, liquidity, tSupply);
+    amount -= fee;
+  }
+  
+  
+  /// @notice Max amount of token that can be deposited before reaching the TVL cap
+  /// @param token Token address
+  /// @return amount Max amount of token
+  function maxDeposit(address token) public view returns (uint amount) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
+    if (!isEnabled) return 0;
+    Reserves memory r = getReservesSnapshot();
+    if (r.valueX8 + 1 >= tvlCap) return 0;
+    // fees aren't counted in the TVL
+    amount = getTokenAmount(r, token, tvlCap - r.valueX8 - 1) * 1e4 / (1e4 - getAdjustedBaseFee(token == address(token0), r));
+  }
+  
+  
   /// @notice Get value of 1e18 GEV tokens
   /// @return priceX8 price of 1e18 tokens with 8 decimals
   function latestAnswer() external view returns (uint256 priceX8) {
@@ -357,19 +658,40 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   function removeFromAllRanges() internal {
     uint fullRangeBal = fullRange.balanceOf(address(this));
     if (fullRangeBal > 0) fullRange.withdraw(fullRangeBal, 0, 0);
-    for (uint k = 0; k < ticks.length; k++){
+    for (uint k = 0; k < tickCount; k++){
       removeFromTick(k);
     }    
   }
   
   
+  /// @notice Collect the pending fees of the full range and of the ticks active since the last rebalance
+  /// @dev Much cheaper than removing all liquidity, used before a reserves snapshot when the ticks aren't all unwound
+  /// @dev Only the active ticks hold assets: leftovers of ticks that couldn't be fully withdrawn because of outstanding debt
+  /// keep their fees until the next full cycle
+  function claimAllFees() internal {
+    if (fullRange.balanceOf(address(this)) > 0) fullRange.claimFee();
+    (uint start, uint end) = getActiveRange(lastTickIndex);
+    for (uint k = start; k < end; k++)
+      if (getTickBalance(k) > 0) ticks(k).claimFee();
+  }
+  
+  
   /// @notice Remove from tick
   function removeFromTick(uint index) internal {
-    TokenisableRange tr = ticks[index];
-    address aTokenAddress = lendingPool.getReserveData(address(tr)).aTokenAddress;
+    removeFromTick(index, UINT256MAX);
+  }
+  
+  
+  /// @notice Remove up to amount from tick
+  /// @param index Tick index
+  /// @param amount Max amount of tick tokens removed
+  function removeFromTick(uint index, uint amount) internal {
+    TokenisableRange tr = ticks(index);
+    address aTokenAddress = tickATokens[address(tr)];
     uint aBal = ERC20(aTokenAddress).balanceOf(address(this));
     uint sBal = tr.balanceOf(aTokenAddress);
 
+    if (aBal > amount) aBal = amount;
     // if there are less tokens available than the balance (because of outstanding debt), withdraw what's available
     if (aBal > sBal) aBal = sBal;
     if (aBal > 0){
@@ -381,58 +703,293 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   
   /// @notice 
   function deployAssets() internal { 
-    if (ticks.length == 0) return;
+    if (tickCount == 0) return;
     uint newTickIndex = getActiveTickIndex();
     uint availToken0 = token0.balanceOf(address(this));
     uint availToken1 = token1.balanceOf(address(this));
     
-    // deposit a part of the assets in the full range. No slippage control in TR since we already checked here for sandwich
-    if (availToken0 > 0 && availToken1 > 0) {
-      uint amount0 = availToken0 * fullRangeShare / 100;
-      uint amount1 = availToken1 * fullRangeShare / 100;
-      checkSetApprove(address(token0), address(fullRange), amount0);
-      checkSetApprove(address(token1), address(fullRange), amount1);
-      fullRange.depositExactly(amount0, amount1, 0, 0);
-    }
+    // deposit a part of the assets in the full range
+    depositInFullRange(availToken0 * fullRangeShare / 100, availToken1 * fullRangeShare / 100);
     availToken0 = token0.balanceOf(address(this));
     availToken1 = token1.balanceOf(address(this));
 
     // if base token is token0, ticks above only contain base token = token0 and ticks below only hold quote token = token1
     if (newTickIndex > 1) 
       depositAndStash(
-        ticks[newTickIndex-2], 
+        ticks(newTickIndex-2), 
         baseTokenIsToken0 ? 0 : availToken0 / liquidityPerTick,
         baseTokenIsToken0 ? availToken1 / liquidityPerTick : 0
       );
     if (newTickIndex > 0) 
       depositAndStash(
-        ticks[newTickIndex-1], 
+        ticks(newTickIndex-1), 
         baseTokenIsToken0 ? 0 : availToken0 / liquidityPerTick,
         baseTokenIsToken0 ? availToken1 / liquidityPerTick : 0
       );
-    if (newTickIndex < ticks.length) 
+    if (newTickIndex < tickCount) 
       depositAndStash(
-        ticks[newTickIndex], 
+        ticks(newTickIndex), 
         baseTokenIsToken0 ? availToken0 / liquidityPerTick : 0,
         baseTokenIsToken0 ? 0 : availToken1 / liquidityPerTick
       );
-    if (newTickIndex+1 < ticks.length) 
+    if (newTickIndex+1 < tickCount) 
       depositAndStash(
-        ticks[newTickIndex+1], 
+        ticks(newTickIndex+1), 
         baseTokenIsToken0 ? availToken0 / liquidityPerTick : 0,
         baseTokenIsToken0 ? 0 : availToken1 / liquidityPerTick
       );
 
+    lastTickIndex = newTickIndex;
     emit Rebalance(newTickIndex);
   }
   
   
+  /// @notice Deploy assets incrementally: only ticks whose holdings differ from their target allocation are modified
+  /// @param keep0 Amount of token0 that must remain available in the vault
+  /// @param keep1 Amount of token1 that must remain available in the vault
+  /// @dev The full range is only modified if it drifted from its share of the assets
+  function deployAssetsIncremental(uint keep0, uint keep1) internal {
+    if (tickCount == 0) return;
+    uint newTickIndex = getActiveTickIndex();
+    if (newTickIndex != lastTickIndex) removeFromInactiveTicks(lastTickIndex, newTickIndex);
+    lastTickIndex = newTickIndex;
+    
+    (uint start, uint end) = getActiveRange(newTickIndex);
+    // targets start from the total amounts held in active ticks
+    (uint[] memory held, uint target0, uint target1) = getActiveTicksHoldings(start, end, newTickIndex);
+    rebalanceFullRange(target0, target1, keep0, keep1);
+    
+    // each active tick targets the same share of the assets available for ticks, like deployAssets
+    target0 += token0.balanceOf(address(this));
+    target1 += token1.balanceOf(address(this));
+    target0 = target0 > keep0 ? (target0 - keep0) / liquidityPerTick : 0;
+    target1 = target1 > keep1 ? (target1 - keep1) / liquidityPerTick : 0;
+    
+    // remove excess assets first, so that they are available for ticks below their target
+    for (uint k = start; k < end; k++){
+      uint target = isToken0Tick(k, newTickIndex) ? target0 : target1;
+      uint h = held[k - start];
+      if (h > target + target * REBALANCE_TOLERANCE_X4 / 1e4) removeFromTick(k, getTickBalance(k) * (h - target) / h);
+    }
+    for (uint k = start; k < end; k++){
+      bool isToken0 = isToken0Tick(k, newTickIndex);
+      uint target = isToken0 ? target0 : target1;
+      uint h = held[k - start];
+      if (h + target * REBALANCE_TOLERANCE_X4 / 1e4 < target) depositInTick(k, isToken0, target - h, isToken0 ? keep0 : keep1);
+    }
+    emit Rebalance(newTickIndex);
+  }
+  
+  
+  /// @notice Deposit a single token in the full range and the active ticks, in the same proportions as deployAssets
+  /// @param token Token deposited
+  /// @param amount Amount of token deposited
+  /// @return isDeposited False if the active tick moved since the last rebalance, in which case nothing is deposited
+  /// @dev The full range share is paired with idle assets of the other token, unused assets are refunded by the full range
+  function depositInActiveTicks(address token, uint amount) internal returns (bool isDeposited) {
+    uint tickIndex = getActiveTickIndex();
+    if (tickIndex != lastTickIndex) return false;
+    bool isToken0 = token == address(token0);
+    uint frAmount = amount * fullRangeShare / 100;
+    uint otherBal = (isToken0 ? token1 : token0).balanceOf(address(this));
+    depositInFullRange(isToken0 ? frAmount : otherBal, isToken0 ? otherBal : frAmount);
+    
+    amount = (amount - frAmount) / liquidityPerTick;
+    (uint start, uint end) = getActiveRange(tickIndex);
+    for (uint k = start; k < end; k++)
+      if (isToken0Tick(k, tickIndex) == isToken0) depositInTick(k, isToken0, amount, 0);
+    isDeposited = true;
+  }
+  
+  
+  /// @notice Free an amount of token by withdrawing from the most liquid active ticks first
+  /// @param token Token needed
+  /// @param amount Amount of token needed in the vault
+  /// @return isActive False if the active tick moved since the last rebalance, in which case nothing is withdrawn
+  function withdrawFromActiveTicks(address token, uint amount) internal returns (bool isActive) {
+    uint bal = ERC20(token).balanceOf(address(this));
+    if (bal >= amount) return true;
+    uint tickIndex = getActiveTickIndex();
+    if (tickIndex != lastTickIndex) return false;
+    isActive = true;
+    (uint start, uint end) = getActiveRange(tickIndex);
+    uint[] memory held = new uint[](end - start);
+    for (uint k = start; k < end; k++){
+      (uint amt0, uint amt1) = ticks(k).getTokenAmounts(getTickBalance(k));
+      held[k - start] = token == address(token0) ? amt0 : amt1;
+    }
+    
+    while (bal < amount) {
+      (uint index, uint tickHeld) = getMostLiquidTick(held);
+      if (tickHeld == 0) return;
+      held[index] = 0;
+      uint missing = amount - bal;
+      uint aBal = getTickBalance(start + index);
+      // round up, possibly withdrawing the whole tick
+      removeFromTick(start + index, missing >= tickHeld ? aBal : (aBal * missing + tickHeld - 1) / tickHeld);
+      bal = ERC20(token).balanceOf(address(this));
+    }
+  }
+  
+  
+  /// @notice Get the position of the largest amount in a list
+  /// @param held List of tick holdings
+  /// @return index Position of the most liquid tick in the list
+  /// @return amount Largest amount
+  function getMostLiquidTick(uint[] memory held) internal pure returns (uint index, uint amount) {
+    for (uint k = 0; k < held.length; k++){
+      if (held[k] > amount) {
+        index = k;
+        amount = held[k];
+      }
+    }
+  }
+  
+  
+  /// @notice Remove assets from ticks that were active around a previous tick index but aren't anymore
+  /// @param oldTickIndex Previous active tick index
+  /// @param newTickIndex New active tick index
+  function removeFromInactiveTicks(uint oldTickIndex, uint newTickIndex) internal {
+    (uint start, uint end) = getActiveRange(oldTickIndex);
+    for (uint k = start; k < end; k++)
+      if (k + 2 < newTickIndex || k >= newTickIndex + 2) removeFromTick(k);
+  }
+  
+  
+  /// @notice Bring the full range back to its share of the vault assets
+  /// @param held0 Amount of token0 held in active ticks
+  /// @param held1 Amount of token1 held in active ticks
+  /// @param keep0 Amount of token0 that must remain available in the vault
+  /// @param keep1 Amount of token1 that must remain available in the vault
+  /// @dev Full range is balanced: it is trimmed if one asset is above target, topped up only if both assets are below target
+  function rebalanceFullRange(uint held0, uint held1, uint keep0, uint keep1) internal {
+    uint frBal = fullRange.balanceOf(address(this));
+    (uint fr0, uint fr1) = fullRange.getTokenAmounts(frBal);
+    uint avail0 = token0.balanceOf(address(this));
+    uint avail1 = token1.balanceOf(address(this));
+    avail0 = avail0 > keep0 ? avail0 - keep0 : 0;
+    avail1 = avail1 > keep1 ? avail1 - keep1 : 0;
+    
+    uint amount0 = (avail0 + held0 + fr0) * fullRangeShare / 100;
+    uint amount1 = (avail1 + held1 + fr1) * fullRangeShare / 100;
+    if (fr0 > amount0 + amount0 * REBALANCE_TOLERANCE_X4 / 1e4 || fr1 > amount1 + amount1 * REBALANCE_TOLERANCE_X4 / 1e4) {
+      // remove the largest excess share, freed assets go to the ticks
+      uint excessX4 = fr0 > amount0 ? (fr0 - amount0) * 1e4 / fr0 : 0;
+      uint excess1X4 = fr1 > amount1 ? (fr1 - amount1) * 1e4 / fr1 : 0;
+      if (excess1X4 > excessX4) excessX4 = excess1X4;
+      fullRange.withdraw(frBal * excessX4 / 1e4, 0, 0);
+    }
+    else if (fr0 + amount0 * REBALANCE_TOLERANCE_X4 / 1e4 < amount0 && fr1 + amount1 * REBALANCE_TOLERANCE_X4 / 1e4 < amount1) {
+      amount0 -= fr0;
+      amount1 -= fr1;
+      depositInFullRange(amount0 > avail0 ? avail0 : amount0, amount1 > avail1 ? avail1 : amount1);
+    }
+  }
+  
+  
+  /// @notice Deposit assets in the full range
+  /// @param amount0 Amount of token0
+  /// @param amount1 Amount of token1
+  /// @dev No slippage control in TR since we already checked here for sandwich
+  function depositInFullRange(uint amount0, uint amount1) internal {
+    if (amount0 > 0 && amount1 > 0) {
+      checkSetApprove(address(token0), address(fullRange), amount0);
+      checkSetApprove(address(token1), address(fullRange), amount1);
+      fullRange.depositExactly(amount0, amount1, 0, 0);
+    }
+  }
+  
+  
+  /// @notice Deposit up to amount of a single token in a tick, keeping a minimum balance in the vault
+  /// @param index Tick index
+  /// @param isToken0 Whether the tick receives token0 or token1
+  /// @param amount Amount deposited
+  /// @param keep Amount of token that must remain available in the vault
+  function depositInTick(uint index, bool isToken0, uint amount, uint keep) internal {
+    uint bal = (isToken0 ? token0 : token1).balanceOf(address(this));
+    if (bal <= keep) return;
+    if (amount > bal - keep) amount = bal - keep;
+    depositAndStash(ticks(index), isToken0 ? amount : 0, isToken0 ? 0 : amount);
+  }
+  
+  
+  /// @notice Get the underlying amounts held by the active ticks
+  /// @param start First active tick
+  /// @param end Last active tick, excluded
+  /// @param tickIndex Active tick index
+  /// @return held Amount of its single underlying token held by each active tick
+  /// @return held0 Total token0 held in active ticks
+  /// @return held1 Total token1 held in active ticks
+  function getActiveTicksHoldings(uint start, uint end, uint tickIndex) internal view returns (uint[] memory held, uint held0, uint held1) {
+    held = new uint[](end - start);
+    for (uint k = start; k < end; k++){
+      (uint amt0, uint amt1) = ticks(k).getTokenAmounts(getTickBalance(k));
+      if (isToken0Tick(k, tickIndex)) {
+        held[k - start] = amt0;
+        held0 += amt0;
+      }
+      else {
+        held[k - start] = amt1;
+        held1 += amt1;
+      }
+    }
+  }
+  
+  
+  /// @notice Whether the idle balance of a token drifted from its target
+  /// @param r Reserves snapshot
+  /// @param isToken0 Whether checking token0 or token1
+  /// @param avail Amount of token outside of the full range
+  /// @param tickIndex Active tick index
+  /// @dev Each active tick of the token gets 1/liquidityPerTick of the assets outside of the full range, the rest stays idle
+  function isIdleDrifted(Reserves memory r, bool isToken0, uint avail, uint tickIndex) internal view returns (bool) {
+    (uint start, uint end) = getActiveRange(tickIndex);
+    uint tickNum;
+    for (uint k = start; k < end; k++) 
+      if (isToken0Tick(k, tickIndex) == isToken0) tickNum++;
+    address token = isToken0 ? address(token0) : address(token1);
+    uint idleTarget = avail - avail * tickNum / liquidityPerTick;
+    return isDrifted(
+      getTokenValue(r, token, ERC20(token).balanceOf(address(this))), 
+      getTokenValue(r, token, idleTarget), 
+      idleThresholdX4, 
+      r.valueX8
+    );
+  }
+  
+  
+  /// @notice Whether a value is further than a threshold from its target
+  /// @param valueX8 Current value
+  /// @param targetX8 Target value
+  /// @param thresholdX4 Threshold in E4 of the TVL
+  /// @param tvlX8 Vault TVL
+  function isDrifted(uint valueX8, uint targetX8, uint thresholdX4, uint tvlX8) internal pure returns (bool) {
+    uint diff = valueX8 > targetX8 ? valueX8 - targetX8 : targetX8 - valueX8;
+    return diff * 1e4 > thresholdX4 * tvlX8;
+  }
+  
+  
+  /// @notice Get the range of ticks that hold assets around a tick index: 2 ticks below and 2 ticks above
+  /// @param tickIndex Active tick index
+  /// @return start First active tick
+  /// @return end Last active tick, excluded
+  function getActiveRange(uint tickIndex) internal view returns (uint start, uint end) {
+    start = tickIndex > 1 ? tickIndex - 2 : 0;
+    end = tickIndex + 2 < tickCount ? tickIndex + 2 : tickCount;
+  }
+  
+  
+  /// @notice Whether a tick holds token0 or token1 given the active tick index
+  /// @dev If base token is token0, ticks above only contain base token = token0 and ticks below only hold quote token = token1
+  function isToken0Tick(uint index, uint tickIndex) internal view returns (bool) {
+    return (index < tickIndex) != baseTokenIsToken0;
+  }
+  
+  
   /// @notice Checks that the pool price isn't manipulated
   function poolMatchesOracle() public view returns (bool matches){
     (uint160 sqrtPriceX96,,,,,,) = uniswapPool.slot0();
     
-    uint token0Decimals = token0.decimals();
-    uint token1Decimals = token1.decimals();
     uint priceX8;
 
     // Based on https://github.com/rysk-finance/dynamic-hedging/blob/HOTFIX-14-08-23/packages/contracts/contracts/vendor/uniswap/RangeOrderUtils.sol
@@ -465,37 +1022,111 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @notice Calculate the vault total ticks value
   /// @return valueX8 Total value of the vault with 8 decimals
   function getTVL() public view returns (uint valueX8){
-    (,, valueX8) = getReserves();
+    valueX8 = getReservesSnapshot().valueX8;
   }
   
   
   /// @notice Get vault underlying assets
   function getReserves() public view returns (uint amount0, uint amount1, uint valueX8){
+    Reserves memory r = getReservesSnapshot();
+    (amount0, amount1, valueX8) = (r.amount0, r.amount1, r.valueX8);
+  }
+  
+  
+  /// @notice Get vault underlying assets and oracle prices
+  /// @return r Reserves snapshot, to be passed along instead of calling getReserves() again
+  function getReservesSnapshot() internal view returns (Reserves memory r){
     // full range amounts
-    (amount0, amount1) = fullRange.getTokenAmounts(fullRange.balanceOf(address(this)));
+    (r.amount0, r.amount1) = fullRange.getTokenAmounts(fullRange.balanceOf(address(this)));
     // undeposited tokens
-    amount0 += token0.balanceOf(address(this));
-    amount1 += token1.balanceOf(address(this));
+    r.amount0 += token0.balanceOf(address(this));
+    r.amount1 += token1.balanceOf(address(this));
     // ticks amounts
-    for (uint k = 0; k < ticks.length; k++){
-      TokenisableRange t = ticks[k];
-      address aTick = lendingPool.getReserveData(address(t)).aTokenAddress;
-      uint bal = ERC20(aTick).balanceOf(address(this));
+    for (uint k = 0; k < tickCount; k++){
+      TokenisableRange t = ticks(k);
+      uint bal = ERC20(tickATokens[address(t)]).balanceOf(address(this));
       (uint amt0, uint amt1) = t.getTokenAmounts(bal);
-      amount0 += amt0;
-      amount1 += amt1;
+      r.amount0 += amt0;
+      r.amount1 += amt1;
     }
-    valueX8 = amount0 * oracle.getAssetPrice(address(token0)) / 10**token0.decimals() 
-            + amount1 * oracle.getAssetPrice(address(token1)) / 10**token1.decimals();
+    r.price0 = oracle.getAssetPrice(address(token0));
+    r.price1 = oracle.getAssetPrice(address(token1));
+    r.valueX8 = r.amount0 * r.price0 / 10**token0Decimals + r.amount1 * r.price1 / 10**token1Decimals;
+  }
+  
+  
+  /// @notice Get the value of an amount of token at the snapshot prices
+  /// @param r Reserves snapshot
+  /// @param token Token address, token0 or token1
+  /// @param amount Amount of token
+  /// @return valueX8 Value with 8 decimals
+  function getTokenValue(Reserves memory r, address token, uint amount) internal view returns (uint valueX8){
+    if (token == address(token0)) valueX8 = amount * r.price0 / 10**token0Decimals;
+    else valueX8 = amount * r.price1 / 10**token1Decimals;
+  }
+  
+  
+  /// @notice Get the GEV tokens minted for a deposit at the snapshot reserves
+  /// @param r Reserves snapshot
+  /// @param token Token address, token0 or token1
+  /// @param amount Amount of token deposited
+  /// @param tSupply Total supply of GEV tokens
+  /// @return liquidity GEV tokens minted
+  /// @return fee Deposit fee, in token
+  /// @return valueX8 Value deposited net of fees, with 8 decimals
+  function getDepositLiquidity(Reserves memory r, address token, uint amount, uint tSupply) internal view returns (uint liquidity, uint fee, uint valueX8){
+    fee = amount * getAdjustedBaseFee(token == address(token0), r) / 1e4;
+    valueX8 = getTokenValue(r, token, amount - fee);
+    // initial liquidity at 1e18 token ~ $1
+    if (tSupply == 0 || r.valueX8 == 0) liquidity = valueX8 * 1e10;
+    else liquidity = tSupply * valueX8 / r.valueX8;
+  }
+  
+  
+  /// @notice Get the amount of token to deposit to mint GEV tokens at the snapshot reserves, rounded up
+  /// @param r Reserves snapshot
+  /// @param token Token address, token0 or token1
+  /// @param liquidity GEV tokens minted
+  /// @param tSupply Total supply of GEV tokens
+  /// @return amount Amount of token deposited, including fees
+  function getMintAmount(Reserves memory r, address token, uint liquidity, uint tSupply) internal view returns (uint amount){
+    uint valueX8;
+    if (tSupply == 0 || r.valueX8 == 0) valueX8 = (liquidity + 1e10 - 1) / 1e10;
+    else valueX8 = (liquidity * r.valueX8 + tSupply - 1) / tSupply;
+    amount = getTokenAmount(r, token, valueX8) + 1;
+    uint feeX4 = getAdjustedBaseFee(token == address(token0), r);
+    amount = (amount * 1e4 + 1e4 - feeX4 - 1) / (1e4 - feeX4);
+  }
+  
+  
+  /// @notice Get the amount of token received for redeeming GEV tokens at the snapshot reserves
+  /// @param r Reserves snapshot
+  /// @param token Token address, token0 or token1
+  /// @param liquidity GEV tokens redeemed
+  /// @param tSupply Total supply of GEV tokens
+  /// @return amount Amount of token withdrawn, including fees
+  /// @return fee Withdrawal fee, in token
+  function getWithdrawAmount(Reserves memory r, address token, uint liquidity, uint tSupply) internal view returns (uint amount, uint fee){
+    amount = getTokenAmount(r, token, r.valueX8 * liquidity / tSupply);
+    fee = amount * getAdjustedBaseFee(token == address(token1), r) / 1e4;
+  }
+  
+  
+  /// @notice Get the amount of token worth a value at the snapshot prices
+  /// @param r Reserves snapshot
+  /// @param token Token address, token0 or token1
+  /// @param valueX8 Value with 8 decimals
+  /// @return amount Amount of token
+  function getTokenAmount(Reserves memory r, address token, uint valueX8) internal view returns (uint amount){
+    if (token == address(token0)) amount = valueX8 * 10**token0Decimals / r.price0;
+    else amount = valueX8 * 10**token1Decimals / r.price1;
   }
   
   /// @notice Get balance of tick deposited in GE
   /// @param index Tick index
   /// @return liquidity Amount of Ticker
   function getTickBalance(uint index) public view returns (uint liquidity) {
-    TokenisableRange t = ticks[index];
-    address aTokenAddress = lendingPool.getReserveData(address(t)).aTokenAddress;
-    liquidity = ERC20(aTokenAddress).balanceOf(address(this));
+    liquidity = ERC20(tickATokens[address(ticks(index))]).balanceOf(address(this));
   }
   
   
@@ -522,15 +1153,27 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
 
   
   /// @notice Return first valid tick
+  /// @dev Ticks are ordered, so the first tick above price (ie its only underlying is the base token) is found by binary search
   function getActiveTickIndex() public view returns (uint activeTickIndex) {
-    // loop on all ticks, if underlying is only base token then we are above, and tickIndex is 2 below
-    for (uint tickIndex = 0; tickIndex < ticks.length; tickIndex++){
-      (uint amt0, uint amt1) = ticks[tickIndex].getTokenAmountsExcludingFees(1e18);
-      // found a tick that's above price (ie its only underlying is the base token)
-      if( (baseTokenIsToken0 && amt1 == 0) || (!baseTokenIsToken0 && amt0 == 0) ) return tickIndex;
+    (uint160 sqrtPriceX96,,,,,,) = uniswapPool.slot0();
+    uint low = 0;
+    // if all ticks are below price, returns tickCount
+    uint high = tickCount;
+    while (low < high) {
+      uint mid = (low + high) / 2;
+      if (isAbovePrice(ticks(mid), sqrtPriceX96)) high = mid;
+      else low = mid + 1;
     }
-    // all ticks are below price
-    return ticks.length;
+    activeTickIndex = low;
+  }
+  
+  
+  /// @notice Whether a tick only contains base token at a given price
+  /// @param t Tick
+  /// @param sqrtPriceX96 Pool price
+  function isAbovePrice(TokenisableRange t, uint160 sqrtPriceX96) internal view returns (bool) {
+    if (baseTokenIsToken0) return sqrtPriceX96 <= TickMath.getSqrtRatioAtTick(t.lowerTick());
+    else return sqrtPriceX96 >= TickMath.getSqrtRatioAtTick(t.upperTick());
   }
 
 
@@ -539,10 +1182,17 @@ contract GeVault is ERC20, Ownable, ReentrancyGuard {
   /// @dev Simple linear model: from baseFeeX4 / 2 to baseFeeX4 * 3 / 2
   /// @dev Call before withdrawing from ticks or reserves will both be 0
   function getAdjustedBaseFee(bool increaseToken0) public view returns (uint adjustedBaseFeeX4) {
+    adjustedBaseFeeX4 = getAdjustedBaseFee(increaseToken0, getReservesSnapshot());
+  }
+  
+  
+  /// @notice Get deposit fee from a reserves snapshot
+  /// @param increaseToken0 Whether (token0 added || token1 removed) or not
+  /// @param r Reserves snapshot
+  function getAdjustedBaseFee(bool increaseToken0, Reserves memory r) internal view returns (uint adjustedBaseFeeX4) {
     uint baseFeeX4_ = uint(baseFeeX4);
-    (uint res0, uint res1, ) = getReserves();
-    uint value0 = res0 * oracle.getAssetPrice(address(token0)) / 10**token0.decimals();
-    uint value1 = res1 * oracle.getAssetPrice(address(token1)) / 10**token1.decimals();
+    uint value0 = r.amount0 * r.price0 / 10**token0Decimals;
+    uint value1 = r.amount1 * r.price1 / 10**token1Decimals;
 
     if (increaseToken0)
       adjustedBaseFeeX4 = baseFeeX4_ * value0 / (value1 + 1);
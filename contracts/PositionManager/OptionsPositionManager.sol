@@ -4,11 +4,6 @@ pragma solidity 0.8.19;
 import "./PositionManager.sol";
 import "../TokenisableRange.sol";
 
-interface  AmountsRouter {
-  function getAmountsOut(uint256 amountIn, address[] calldata path) external returns (uint256[] memory amounts);
-  function getAmountsIn(uint256 amountOut, address[] calldata path) external returns (uint256[] memory amounts);
-}
-
 contract OptionsPositionManager is PositionManager {
   using SafeERC20 for IERC20;
 
@@ -18,6 +13,16 @@ contract OptionsPositionManager is PositionManager {
   event ClosePosition(address indexed user, address indexed asset, uint amount, uint amount0, uint amount1);
   event LiquidatePosition(address indexed user, address indexed asset, uint amount, uint amount0, uint amount1);
   event ReducedPosition(address indexed user, address indexed asset, uint amount);
+  event LiquidationSkipped(address indexed user, address indexed asset);
+
+  /// @notice Debts and underlying amounts of a multi-position close
+  struct CloseAmounts {
+    uint[] debts;
+    uint[] amounts0;
+    uint[] amounts1;
+    uint needed0;
+    uint needed1;
+  }
 
 
   /// @param roerouter Address of Roe whitelist router
@@ -33,6 +38,8 @@ contract OptionsPositionManager is PositionManager {
    * @param initiator The address of the flashloan initiator
    * @param params The byte-encoded params passed when initiating the flashloan
    * @return result True if the execution of the operation succeeds, false otherwise
+   * @dev The entry points pass the pool addresses they resolved in params, so they are only trusted if the flashloan was
+   * initiated by this contract, and called by that pool
    */
   function executeOperation(
     address[] calldata assets,
@@ -41,54 +48,77 @@ contract OptionsPositionManager is PositionManager {
     address initiator,
     bytes calldata params
   ) override external returns (bool result) {
+    require( initiator == address(this), "OPM: Call Unallowed");
     uint8 mode = abi.decode(params, (uint8) );
     // Buy options
     if ( mode == 0 ){
-      (, uint poolId, address user, address[] memory sourceSwap) = abi.decode(params, (uint8, uint, address, address[]));
-      executeBuyOptions(poolId, assets, amounts, user, sourceSwap);
+      (, PoolAddresses memory pool, address user, address[] memory sourceSwap) = abi.decode(params, (uint8, PoolAddresses, address, address[]));
+      executeBuyOptions(pool, assets, amounts, user, sourceSwap);
     }
     // Liquidate
-    else {
-      (, uint poolId, address user, address collateral) = abi.decode(params, (uint8, uint, address, address));
-      executeLiquidation(poolId, assets, amounts, user, collateral);
+    else if ( mode == 1 ){
+      (, PoolAddresses memory pool, address user, address collateral) = abi.decode(params, (uint8, PoolAddresses, address, address));
+      executeLiquidation(pool, assets, amounts, user, collateral);
+    }
+    // Liquidate several users
+    else if ( mode == 2 ){
+      executeBatchLiquidation(assets, amounts, premiums, params);
     }
+    else revert("OPM: Invalid Mode");
     result = true;
   }
   
   
   /// @notice Buy each flashloaned option
+  /// @dev Swaps are netted: all the options swapping the same token are swapped at once, and each gets a share of the output
   function executeBuyOptions(
-    uint poolId,
+    PoolAddresses memory pool,
     address[] calldata assets,
     uint256[] calldata amounts,
     address user,
     address[] memory sourceSwap
   ) internal {
-    (ILendingPool lendingPool,,, address token0, address token1 ) = getPoolAddresses(poolId);
-    require( address(lendingPool) == msg.sender, "OPM: Call Unallowed");
+    require( address(pool.lp) == msg.sender, "OPM: Call Unallowed");
     
+    uint[] memory amounts0 = new uint[](assets.length);
+    uint[] memory amounts1 = new uint[](assets.length);
+    // total amounts of token0 and token1 to swap
+    uint[2] memory swapped;
     for ( uint8 k = 0; k<assets.length; k++){
-      address asset = assets[k];
-      uint amount = amounts[k];
-      withdrawOptionAssets(poolId, asset, amount, sourceSwap[k], user);
+      (amounts0[k], amounts1[k]) = withdrawOptionAssets(pool, assets[k], amounts[k], sourceSwap[k]);
+      if (sourceSwap[k] == pool.token0) swapped[0] += amounts0[k];
+      else if (sourceSwap[k] == pool.token1) swapped[1] += amounts1[k];
+    }
+    uint[2] memory received = [swapExactAmount(pool, pool.token0, swapped[0]), swapExactAmount(pool, pool.token1, swapped[1])];
+
+    for ( uint8 k = 0; k<assets.length; k++){
+      // if swap underlying, then sourceSwap amount is 0 and the other amount is amount withdrawn + share of the amount received from swap
+      if (sourceSwap[k] == pool.token0) {
+        if (swapped[0] > 0) amounts1[k] += received[0] * amounts0[k] / swapped[0];
+        amounts0[k] = 0;
+      }
+      else if (sourceSwap[k] == pool.token1) {
+        if (swapped[1] > 0) amounts0[k] += received[1] * amounts1[k] / swapped[1];
+        amounts1[k] = 0;
+      }
+      emit BuyOptions(user, assets[k], amounts[k], amounts0[k], amounts1[k]);
     }
     // send all tokens to lendingPool
-    cleanup(lendingPool, user, token0);
-    cleanup(lendingPool, user, token1);
+    cleanup(pool.lp, user, pool.token0);
+    cleanup(pool.lp, user, pool.token1);
   }
   
   
   /// @notice Execute operation liquidation
   function executeLiquidation(
-    uint poolId,
+    PoolAddresses memory pool,
     address[] calldata assets,
     uint256[] calldata amounts,
     address user,
     address collateral
   ) internal {
-    (ILendingPool lendingPool,,, address token0, address token1) = getPoolAddresses(poolId);
-    require( address(lendingPool) == msg.sender, "OPM: Call Unallowed");
-    uint[2] memory amts = [ERC20(token0).balanceOf(address(this)), ERC20(token1).balanceOf(address(this))];
+    require( address(pool.lp) == msg.sender, "OPM: Call Unallowed");
+    uint[2] memory amts = [ERC20(pool.token0).balanceOf(address(this)), ERC20(pool.token1).balanceOf(address(this))];
     for ( uint8 k =0; k<assets.length; k++){
       address debtAsset = assets[k];
       
@@ -96,12 +126,12 @@ contract OptionsPositionManager is PositionManager {
       uint amount = amounts[k];
       
       // liquidate and send assets here
-      checkSetAllowance(debtAsset, address(lendingPool), amount);
-      lendingPool.liquidationCall(collateral, debtAsset, user, amount, false);
+      checkSetAllowance(debtAsset, address(pool.lp), amount);
+      pool.lp.liquidationCall(collateral, debtAsset, user, amount, false);
       // repay tokens
-      uint debt = closeDebt(poolId, address(this), debtAsset, amount, collateral);
-      uint amt0 = ERC20(token0).balanceOf(address(this));
-      uint amt1 = ERC20(token1).balanceOf(address(this));
+      uint debt = closeDebt(pool, address(this), debtAsset, amount, collateral);
+      uint amt0 = ERC20(pool.token0).balanceOf(address(this));
+      uint amt1 = ERC20(pool.token1).balanceOf(address(this));
       emit LiquidatePosition(user, debtAsset, debt, amt0 - amts[0], amt1 - amts[1]);
       amts[0] = amt0;
       amts[1] = amt1;
@@ -110,42 +140,54 @@ contract OptionsPositionManager is PositionManager {
   }
 
 
+
+  /// @notice Execute operation batch liquidation: liquidate each user, then mint back the flashloaned TRs that were used
+  function executeBatchLiquidation(
+    address[] calldata assets,
+    uint256[] calldata amounts,
+    uint256[] calldata premiums,
+    bytes calldata params
+  ) internal {
+    PoolAddresses memory pool = liquidateUsers(params);
+    repayFlashloans(pool, assets, amounts, premiums);
+  }
+
+
+  /// @notice Liquidate each user of a batch liquidation
+  function liquidateUsers(bytes calldata params) internal returns (PoolAddresses memory pool) {
+    address[] memory users;
+    address[][] memory options;
+    uint[][] memory optionAmounts;
+    address[] memory collaterals;
+    (, pool, users, options, optionAmounts, collaterals) = abi.decode(params, (uint8, PoolAddresses, address[], address[][], uint[][], address[]));
+    require( address(pool.lp) == msg.sender, "OPM: Call Unallowed");
+    for ( uint k = 0; k < users.length; k++ )
+      liquidateUser(pool, users[k], options[k], optionAmounts[k], collaterals[k]);
+  }
+
+
   ////////////////////// BUY OPTIONS
   
-  /// @notice Withdraw underlying option assets and swap if necessary
-  /// @param poolId ID of the ROE lending pool
+  /// @notice Withdraw underlying option assets
+  /// @param pool ROE pool addresses
   /// @param flashAsset Option asset to borrow
   /// @param flashAmount Amount to borrow
   /// @param sourceSwap Asset to swap (put-call parity)
-  /// @param user Address of option buyer
-  /// @dev Only withdraws the tokens and swap, doesnt deposit, as this is done afterwards to avoid doing multiple times
+  /// @return amount0 Amount of token0 withdrawn
+  /// @return amount1 Amount of token1 withdrawn
+  /// @dev Only withdraws the tokens, swap and deposit are done afterwards for all options to avoid doing multiple times
   function withdrawOptionAssets(
-    uint poolId,
+    PoolAddresses memory pool,
     address flashAsset,
     uint256 flashAmount,
-    address sourceSwap,
-    address user
+    address sourceSwap
   ) 
-    private returns (bool result)
+    private returns (uint256 amount0, uint256 amount1)
   {
-    (, IPriceOracle oracle, IUniswapV2Router01 router, address token0, address token1) = getPoolAddresses(poolId);
-    sanityCheckUnderlying(flashAsset, token0, token1);
+    sanityCheckUnderlying(flashAsset, pool.token0, pool.token1);
     // Remove Liquidity and get underlying tokens
-    (uint256 amount0, uint256 amount1) = TokenisableRange(flashAsset).withdraw(flashAmount, 0, 0);
-    if (sourceSwap != address(0) ){
-      require(sourceSwap == token0 || sourceSwap == token1, "OPM: Invalid Swap Token");
-      address[] memory path = new address[](2);
-      path[0] = sourceSwap ;
-      path[1] = sourceSwap == token0 ? token1 : token0;
-      uint amount = sourceSwap == token0 ? amount0 : amount1;
-
-      uint received = swapExactTokensForTokens(router, oracle, amount, path);
-      // if swap underlying, then sourceSwap amount is 0 and the other amount is amount withdrawn + amount received from swap
-      amount0 = sourceSwap == token0 ? 0 : amount0 + received;
-      amount1 = sourceSwap == token1 ? 0 : amount1 + received;
-    }
-    emit BuyOptions(user, flashAsset, flashAmount, amount0, amount1);
-    result = true;
+    (amount0, amount1) = TokenisableRange(flashAsset).withdraw(flashAmount, 0, 0);
+    require(sourceSwap == address(0) || sourceSwap == pool.token0 || sourceSwap == pool.token1, "OPM: Invalid Swap Token");
   }
 
   
@@ -164,15 +206,15 @@ contract OptionsPositionManager is PositionManager {
     external
   {
     require(options.length == amounts.length && sourceSwap.length == options.length, "OPM: Array Length Mismatch");
-    bytes memory params = abi.encode(0, poolId, msg.sender, sourceSwap);
-    (ILendingPool LP,,,, ) = getPoolAddresses(poolId);
+    PoolAddresses memory pool = getPool(poolId);
+    bytes memory params = abi.encode(0, pool, msg.sender, sourceSwap);
 
     uint[] memory flashtype = new uint[](options.length);
     for (uint8 i = 0; i< options.length; ){
       flashtype[i] = 2;
       unchecked { i+=1; }
     }
-    LP.flashLoan( address(this), options, amounts, flashtype, msg.sender, params, 0);
+    pool.lp.flashLoan( address(this), options, amounts, flashtype, msg.sender, params, 0);
   }
 
   
@@ -195,15 +237,153 @@ contract OptionsPositionManager is PositionManager {
     external
   {
     require(options.length == amounts.length, "ARRAY_LEN_MISMATCH");
-    bytes memory params = abi.encode(1, poolId, user, collateralAsset); // mode = 1 -> liquidation
-    (ILendingPool LP,,, address token0, address token1) = getPoolAddresses(poolId);
+    PoolAddresses memory pool = getPool(poolId);
+    bytes memory params = abi.encode(1, pool, user, collateralAsset); // mode = 1 -> liquidation
     
     uint[] memory flashtype = new uint[](options.length);
-    LP.flashLoan( address(this), options, amounts, flashtype, msg.sender, params, 0);
+    pool.lp.flashLoan( address(this), options, amounts, flashtype, msg.sender, params, 0);
 
     // send all tokens to liquidator
-    cleanup(LP, msg.sender, token0);
-    cleanup(LP, msg.sender, token1);
+    cleanup(pool.lp, msg.sender, pool.token0);
+    cleanup(pool.lp, msg.sender, pool.token1);
+  }
+
+
+  /// @notice Liquidate several unhealthy positions with a single flashloan
+  /// @param poolId ID of the ROE lending pool
+  /// @param users The owners of the loans to liquidate
+  /// @param options For each user, array of borrowed Ticker assets to repay
+  /// @param amounts For each user, array of borrowed Ticker assets amounts to repay
+  /// @param collateralAssets For each user, collateral asset to receive
+  /// @dev Flashloan the union of the debt tokens, liquidate each user in turn, then swap once for all the tokens needed to repay the flashloan.
+  /// Users that are not liquidatable anymore, eg because someone else liquidated them first, are skipped
+  function liquidateMany(
+    uint poolId,
+    address[] calldata users,
+    address[][] calldata options,
+    uint[][] calldata amounts,
+    address[] calldata collateralAssets
+  )
+    external
+  {
+    require(users.length == options.length && users.length == amounts.length && users.length == collateralAssets.length, "ARRAY_LEN_MISMATCH");
+    (address[] memory assets, uint[] memory totals) = mergeAssets(options, amounts);
+    PoolAddresses memory pool = getPool(poolId);
+    bytes memory params = abi.encode(2, pool, users, options, amounts, collateralAssets); // mode = 2 -> batch liquidation
+
+    uint[] memory flashtype = new uint[](assets.length);
+    pool.lp.flashLoan( address(this), assets, totals, flashtype, msg.sender, params, 0);
+
+    // send all tokens to liquidator
+    cleanup(pool.lp, msg.sender, pool.token0);
+    cleanup(pool.lp, msg.sender, pool.token1);
+  }
+
+
+  /// @notice Union of the assets to liquidate, with the total amount of each
+  function mergeAssets(address[][] calldata options, uint[][] calldata amounts) 
+    internal pure returns (address[] memory assets, uint[] memory totals)
+  {
+    uint count;
+    for ( uint i = 0; i < options.length; i++ ){
+      require(options[i].length == amounts[i].length, "ARRAY_LEN_MISMATCH");
+      count += options[i].length;
+    }
+    address[] memory allAssets = new address[](count);
+    uint[] memory allTotals = new uint[](count);
+    count = 0;
+    for ( uint i = 0; i < options.length; i++ ){
+      for ( uint j = 0; j < options[i].length; j++ ){
+        uint k = 0;
+        while ( k < count && allAssets[k] != options[i][j] ) k++;
+        if ( k == count ) {
+          allAssets[k] = options[i][j];
+          count++;
+        }
+        allTotals[k] += amounts[i][j];
+      }
+    }
+    assets = new address[](count);
+    totals = new uint[](count);
+    for ( uint k = 0; k < count; k++ ){
+      assets[k] = allAssets[k];
+      totals[k] = allTotals[k];
+    }
+  }
+
+
+  /// @notice Liquidate a user with the flashloaned TRs, underlying collateral is sent here
+  /// @dev Doesn't revert if the user is healthy or a liquidation call fails, so that the rest of the batch proceeds
+  function liquidateUser(
+    PoolAddresses memory pool,
+    address user,
+    address[] memory options,
+    uint[] memory amounts,
+    address collateral
+  ) 
+    internal
+  {
+    require(collateral == pool.token0 || collateral == pool.token1, "OPM: Invalid Collateral Asset");
+    (,,,,,uint256 hf) = pool.lp.getUserAccountData(user);
+    if (hf >= 1e18) {
+      emit LiquidationSkipped(user, address(0x0));
+      return;
+    }
+    for ( uint k = 0; k < options.length; k++ ){
+      uint[3] memory bals = [ERC20(options[k]).balanceOf(address(this)), ERC20(pool.token0).balanceOf(address(this)), ERC20(pool.token1).balanceOf(address(this))];
+      checkSetAllowance(options[k], address(pool.lp), amounts[k]);
+      try pool.lp.liquidationCall(collateral, options[k], user, amounts[k], false) {
+        emit LiquidatePosition(
+          user, 
+          options[k], 
+          bals[0] - ERC20(options[k]).balanceOf(address(this)), 
+          ERC20(pool.token0).balanceOf(address(this)) - bals[1], 
+          ERC20(pool.token1).balanceOf(address(this)) - bals[2]
+        );
+      }
+      catch {
+        emit LiquidationSkipped(user, options[k]);
+      }
+    }
+  }
+
+
+  /// @notice Mint back the flashloaned TRs consumed by liquidations and the flashloan premiums, with at most one swap for all of them
+  function repayFlashloans(PoolAddresses memory pool, address[] calldata assets, uint256[] calldata amounts, uint256[] calldata premiums) internal {
+    CloseAmounts memory c = getRepayAmounts(pool, assets, amounts, premiums);
+    swapForNeededAmounts(pool, ERC20(pool.token0).balanceOf(address(this)), ERC20(pool.token1).balanceOf(address(this)), c.needed0, c.needed1);
+    for ( uint k = 0; k < assets.length; k++ ){
+      if (c.debts[k] > 0) {
+        checkSetAllowance(pool.token0, assets[k], c.amounts0[k]);
+        checkSetAllowance(pool.token1, assets[k], c.amounts1[k]);
+        TokenisableRange(assets[k]).depositExactly(c.amounts0[k], c.amounts1[k], c.debts[k], 95);
+      }
+      checkSetAllowance(assets[k], address(pool.lp), amounts[k] + premiums[k]);
+    }
+  }
+
+
+  /// @notice Get the TR amounts owed to the flashloan that are missing, and the underlying amounts needed to mint them
+  function getRepayAmounts(PoolAddresses memory pool, address[] calldata assets, uint256[] calldata amounts, uint256[] calldata premiums) 
+    internal view returns (CloseAmounts memory c)
+  {
+    c.debts = new uint[](assets.length);
+    c.amounts0 = new uint[](assets.length);
+    c.amounts1 = new uint[](assets.length);
+    for ( uint k = 0; k < assets.length; k++ ){
+      sanityCheckUnderlying(assets[k], pool.token0, pool.token1);
+      uint bal = ERC20(assets[k]).balanceOf(address(this));
+      uint owed = amounts[k] + premiums[k];
+      if (bal >= owed) continue;
+      uint used = owed - bal;
+      (uint token0Amount, uint token1Amount) = TokenisableRange(assets[k]).getTokenAmounts(used);
+      checkExpectedBalances(assets[k], used, token0Amount, token1Amount);
+      c.debts[k] = used;
+      c.amounts0[k] = token0Amount;
+      c.amounts1[k] = token1Amount;
+      c.needed0 += token0Amount;
+      c.needed1 += token1Amount;
+    }
   }
 
 
@@ -224,30 +404,162 @@ contract OptionsPositionManager is PositionManager {
   ) 
     external
   {
-    (ILendingPool LP,,, address token0, address token1) = getPoolAddresses(poolId);
-    uint debt = ERC20(LP.getReserveData(debtAsset).variableDebtTokenAddress).balanceOf(user);
+    PoolAddresses memory pool = getPool(poolId);
+    uint debt = ERC20(pool.lp.getReserveData(debtAsset).variableDebtTokenAddress).balanceOf(user);
     if ( repayAmount > 0 && repayAmount < debt ) debt = repayAmount;
     require(debt > 0, "OPM: No Debt");
-    debt = closeDebt(poolId, user, debtAsset, debt, collateralAsset);
+    debt = closeDebt(pool, user, debtAsset, debt, collateralAsset);
 
-    cleanup(LP, user, token0);
-    cleanup(LP, user, token1);
+    cleanup(pool.lp, user, pool.token0);
+    cleanup(pool.lp, user, pool.token1);
     if (msg.sender == user){
-      (,,,,,uint256 hf) = LP.getUserAccountData(msg.sender);
+      (,,,,,uint256 hf) = pool.lp.getUserAccountData(msg.sender);
       require(hf > 1e18, "Health factor too low");
     }
     emit ReducedPosition(user, debtAsset, debt);
   }
 
 
-  /// @notice Repays a TR debt
+  /// @notice Repays several TR debts at once and send tokens back to user
   /// @param poolId ID of the ROE lending pool
+  /// @param user Owner of the debt
+  /// @param debtAssets the borrowed LP token addresses
+  /// @param repayAmounts amounts of borrowed tokens to repay; 0 or higher than current debt will repay all
+  /// @param collateralAsset Asset used for liquidation fee
+  /// @dev Same as calling close for each debt, but user collateral is withdrawn once, token needs are netted across all debts
+  /// so there is at most one swap, and cleanup and health factor check are done once at the end.
+  /// Each debt asset must appear once: a duplicate would be repaid twice from a single debt balance
+  function closeMany(
+    uint poolId,
+    address user,
+    address[] calldata debtAssets,
+    uint[] calldata repayAmounts,
+    address collateralAsset
+  )
+    external
+  {
+    require(debtAssets.length == repayAmounts.length, "OPM: Array Length Mismatch");
+    require(debtAssets.length > 0, "OPM: No Debt");
+    PoolAddresses memory pool = getPool(poolId);
+    CloseAmounts memory c = getCloseAmounts(pool, user, debtAssets, repayAmounts);
+    withdrawForClose(pool, user, collateralAsset, c.needed0, c.needed1);
+    for (uint k = 0; k < debtAssets.length; k++)
+      repayDebt(pool, user, debtAssets[k], c.debts[k], c.amounts0[k], c.amounts1[k]);
+
+    // Swap other token back to collateral: this allows to control exposure
+    if (user == msg.sender && collateralAsset != address(0x0)) swapAll(pool, collateralAsset == pool.token0 ? pool.token1 : pool.token0);
+    cleanup(pool.lp, user, pool.token0);
+    cleanup(pool.lp, user, pool.token1);
+    if (msg.sender == user){
+      (,,,,,uint256 hf) = pool.lp.getUserAccountData(msg.sender);
+      require(hf > 1e18, "Health factor too low");
+    }
+  }
+
+
+  /// @notice Get the debts to repay and the underlying amounts needed for each, and in total
+  function getCloseAmounts(
+    PoolAddresses memory pool,
+    address user,
+    address[] calldata debtAssets,
+    uint[] calldata repayAmounts
+  )
+    internal view returns (CloseAmounts memory c)
+  {
+    c.debts = new uint[](debtAssets.length);
+    c.amounts0 = new uint[](debtAssets.length);
+    c.amounts1 = new uint[](debtAssets.length);
+    for (uint k = 0; k < debtAssets.length; k++){
+      address debtAsset = debtAssets[k];
+      for (uint j = 0; j < k; j++) require(debtAssets[j] != debtAsset, "OPM: Duplicate Debt Asset");
+      sanityCheckUnderlying(debtAsset, pool.token0, pool.token1);
+      uint debt = ERC20(pool.lp.getReserveData(debtAsset).variableDebtTokenAddress).balanceOf(user);
+      if ( repayAmounts[k] > 0 && repayAmounts[k] < debt ) debt = repayAmounts[k];
+      require(debt > 0, "OPM: No Debt");
+      (uint token0Amount, uint token1Amount) = TokenisableRange(debtAsset).getTokenAmounts(debt);
+      checkExpectedBalances(debtAsset, debt, token0Amount, token1Amount);
+      c.debts[k] = debt;
+      c.amounts0[k] = token0Amount;
+      c.amounts1[k] = token1Amount;
+      c.needed0 += token0Amount;
+      c.needed1 += token1Amount;
+    }
+  }
+
+
+  /// @notice Withdraw all user collateral, take the soft liquidation fee and swap if one token is missing
+  /// @param pool ROE pool addresses
+  /// @param user Owner of the debt
+  /// @param collateralAsset Asset used for liquidation fee
+  /// @param needed0 Amount of token0 needed to repay all debts
+  /// @param needed1 Amount of token1 needed to repay all debts
+  function withdrawForClose(PoolAddresses memory pool, address user, address collateralAsset, uint needed0, uint needed1) internal {
+    require(collateralAsset == pool.token0 || collateralAsset == pool.token1 || collateralAsset == address(0x0), "OPM: Invalid Collateral Asset");
+    uint amtA = IERC20(pool.lp.getReserveData(pool.token0).aTokenAddress ).balanceOf(user);
+    uint amtB = IERC20(pool.lp.getReserveData(pool.token1).aTokenAddress ).balanceOf(user);
+    PMWithdraw(pool.lp, user, pool.token0, amtA );
+    PMWithdraw(pool.lp, user, pool.token1, amtB );
+    // If another user softLiquidates a share of the liquidation goes to the treasury
+    if (user != msg.sender ) {
+      uint feeAmount = calculateAndSendFee(pool, needed0, needed1, collateralAsset);
+      if (collateralAsset == pool.token0) amtA -= feeAmount;
+      else amtB -= feeAmount;
+    }
+    swapForNeededAmounts(pool, amtA, amtB, needed0, needed1);
+  }
+
+
+  /// @notice Swap if one token is missing - consider that there is enough of the other one
+  /// @param pool ROE pool addresses
+  /// @param amtA Available amount of token0
+  /// @param amtB Available amount of token1
+  /// @param needed0 Amount of token0 needed
+  /// @param needed1 Amount of token1 needed
+  function swapForNeededAmounts(PoolAddresses memory pool, uint amtA, uint amtB, uint needed0, uint needed1) internal {
+    address[] memory path = new address[](2);
+    if ( amtA < needed0 ){
+      path[0] = pool.token1;
+      path[1] = pool.token0;
+      swapTokensForExactTokens(pool.router, pool.oracle, needed0 - amtA, amtB, path); 
+    }
+    else if ( amtB < needed1 ){
+      path[0] = pool.token0;
+      path[1] = pool.token1;
+      swapTokensForExactTokens(pool.router, pool.oracle, needed1 - amtB, amtA, path); 
+    }
+  }
+
+
+  /// @notice Deposit underlying tokens in a TR and repay the user debt with the TR tokens
+  /// @dev Pool tokens are the TR underlying tokens, checked in getCloseAmounts
+  function repayDebt(
+    PoolAddresses memory pool,
+    address user,
+    address debtAsset,
+    uint repayAmount,
+    uint token0Amount,
+    uint token1Amount
+  )
+    internal
+  {
+    checkSetAllowance(pool.token0, debtAsset, token0Amount);
+    checkSetAllowance(pool.token1, debtAsset, token1Amount);
+    uint debt = TokenisableRange(debtAsset).depositExactly(token0Amount, token1Amount, repayAmount, 95);
+    checkSetAllowance(debtAsset, address(pool.lp), debt);
+    pool.lp.repay( debtAsset, debt, 2, user);
+    emit ClosePosition(user, debtAsset, debt, token0Amount, token1Amount);
+    emit ReducedPosition(user, debtAsset, debt);
+  }
+
+
+  /// @notice Repays a TR debt
+  /// @param pool ROE pool addresses
   /// @param user Owner of the debt to close. If user is address(this), we dont repay but just recreate tokens, flashloan will take care of getting them back
   /// @param debtAsset the borrowed LP token address
   /// @param repayAmount amount of borrowed tokens to repay; 0 or higher than current debt will repay all
   /// @param collateralAsset Asset used for liquidation fee
   function closeDebt(
-    uint poolId, 
+    PoolAddresses memory pool,
     address user,
     address debtAsset, 
     uint repayAmount,
@@ -255,57 +567,56 @@ contract OptionsPositionManager is PositionManager {
   ) 
     internal returns (uint debt)
   {
-    (ILendingPool LP,,IUniswapV2Router01 ammRouter, address token0, address token1) = getPoolAddresses(poolId);
-    sanityCheckUnderlying(debtAsset, token0, token1);
-    require(collateralAsset == token0 || collateralAsset == token1 || collateralAsset == address(0x0), "OPM: Invalid Collateral Asset");
+    sanityCheckUnderlying(debtAsset, pool.token0, pool.token1);
+    require(collateralAsset == pool.token0 || collateralAsset == pool.token1 || collateralAsset == address(0x0), "OPM: Invalid Collateral Asset");
     uint amtA;
     uint amtB;
     
     { //localize vars
       (uint token0Amount, uint token1Amount) = TokenisableRange(debtAsset).getTokenAmounts(repayAmount);
       checkExpectedBalances(debtAsset, repayAmount, token0Amount, token1Amount);
-      checkSetAllowance(token0, debtAsset, token0Amount);
-      checkSetAllowance(token1, debtAsset, token1Amount);
+      checkSetAllowance(pool.token0, debtAsset, token0Amount);
+      checkSetAllowance(pool.token1, debtAsset, token1Amount);
       // If called by this contract himself this is a liquidation, skip that step
       if (user != address(this) ){
-        amtA = IERC20(LP.getReserveData(token0).aTokenAddress ).balanceOf(user);
-        amtB = IERC20(LP.getReserveData(token1).aTokenAddress ).balanceOf(user);
-        PMWithdraw(LP, user, token0, amtA );
-        PMWithdraw(LP, user, token1, amtB );
+        amtA = IERC20(pool.lp.getReserveData(pool.token0).aTokenAddress ).balanceOf(user);
+        amtB = IERC20(pool.lp.getReserveData(pool.token1).aTokenAddress ).balanceOf(user);
+        PMWithdraw(pool.lp, user, pool.token0, amtA );
+        PMWithdraw(pool.lp, user, pool.token1, amtB );
         // If another user softLiquidates a share of the liquidation goes to the treasury
         if (user != msg.sender ) {
-          uint feeAmount = calculateAndSendFee(poolId, token0Amount, token1Amount, collateralAsset);
-          if (collateralAsset == token0) amtA -= feeAmount;
+          uint feeAmount = calculateAndSendFee(pool, token0Amount, token1Amount, collateralAsset);
+          if (collateralAsset == pool.token0) amtA -= feeAmount;
           else amtB -= feeAmount;
         }
       }
       else {
         // Assets are already present from liquidation
-        amtA = ERC20(token0).balanceOf(user);
-        amtB = ERC20(token1).balanceOf(user);
+        amtA = ERC20(pool.token0).balanceOf(user);
+        amtB = ERC20(pool.token1).balanceOf(user);
       }
 
       // swap if one token is missing - consider that there is enough 
       address[] memory path = new address[](2);
       if ( amtA < token0Amount ){
-        path[0] = token1;
-        path[1] = token0;
-        swapTokensForExactTokens(ammRouter, token0Amount - amtA, amtB, path); 
+        path[0] = pool.token1;
+        path[1] = pool.token0;
+        swapTokensForExactTokens(pool.router, pool.oracle, token0Amount - amtA, amtB, path); 
       }
       else if ( amtB < token1Amount ){
-        path[0] = token0;
-        path[1] = token1;
-        swapTokensForExactTokens(ammRouter, token1Amount - amtB, amtA, path); 
+        path[0] = pool.token0;
+        path[1] = pool.token1;
+        swapTokensForExactTokens(pool.router, pool.oracle, token1Amount - amtB, amtA, path); 
       }
       debt = TokenisableRange(debtAsset).depositExactly(token0Amount, token1Amount, repayAmount, 95);
     }
-    checkSetAllowance(debtAsset, address(LP), debt);
+    checkSetAllowance(debtAsset, address(pool.lp), debt);
     
     // If user closes, repay debt, else tokens will be taken back by the flashloan
-    if (user != address(this) ) LP.repay( debtAsset, debt, 2, user);
+    if (user != address(this) ) pool.lp.repay( debtAsset, debt, 2, user);
     {
-      uint amt0 = ERC20(token0).balanceOf(address(this));
-      uint amt1 = ERC20(token1).balanceOf(address(this));
+      uint amt0 = ERC20(pool.token0).balanceOf(address(this));
+      uint amt1 = ERC20(pool.token1).balanceOf(address(this));
       // edge case where after swapping exactly the tokens and repaying debt, dust causes remaining asset balance to be slightly higher than before repaying
       if (amtA > amt0) 
         amt0 = amtA - amt0;
@@ -319,7 +630,7 @@ contract OptionsPositionManager is PositionManager {
     }
     
     // Swap other token back to collateral: this allows to control exposure
-    if (user == msg.sender && collateralAsset != address(0x0)) swapAll(poolId, collateralAsset == token0 ? token1 : token0);
+    if (user == msg.sender && collateralAsset != address(0x0)) swapAll(pool, collateralAsset == pool.token0 ? pool.token1 : pool.token0);
   }
   
   
@@ -345,20 +656,19 @@ contract OptionsPositionManager is PositionManager {
 
   
   /// @notice Calculates the liquidation fee and sends it to the treasury
-  /// @param poolId ROE pool Id
+  /// @param pool ROE pool addresses
   /// @param token0Amount Amount of token0 used to liquidate the debt
   /// @param token1Amount Amount of token1 used to liquidate the debt
   /// @param collateralAsset Asset used for liquidation fee
   function calculateAndSendFee(
-    uint poolId, 
+    PoolAddresses memory pool,
     uint token0Amount, 
     uint token1Amount, 
     address collateralAsset
   ) internal returns (uint feeAmount) {
-    (, IPriceOracle oracle,, address token0, address token1) = getPoolAddresses(poolId);
-    
-    uint feeValueE8 = token0Amount * oracle.getAssetPrice(token0) / 10**ERC20(token0).decimals()
-                    + token1Amount * oracle.getAssetPrice(token1) / 10**ERC20(token1).decimals() ;
+    IPriceOracle oracle = pool.oracle;
+    uint feeValueE8 = token0Amount * oracle.getAssetPrice(pool.token0) / 10**ERC20(pool.token0).decimals()
+                    + token1Amount * oracle.getAssetPrice(pool.token1) / 10**ERC20(pool.token1).decimals() ;
     feeAmount = feeValueE8 * 10**ERC20(collateralAsset).decimals() / 100 / oracle.getAssetPrice(collateralAsset);
     
     require(feeAmount <= IERC20(collateralAsset).balanceOf(address(this)), "OPM: Insufficient Collateral");
@@ -427,19 +737,26 @@ contract OptionsPositionManager is PositionManager {
   ////////////////////// HELPERS
   
   /// @notice Swap user assets; useful to change user risk profile
-  /// @param poolId Id of the pool
+  /// @param pool ROE pool addresses
   /// @param sourceAsset Asset to be swapped
   /// @return received Amount of target token received
-  function swapAll(uint poolId, address sourceAsset) internal returns (uint received) {
-    (ILendingPool LP, IPriceOracle oracle,IUniswapV2Router01 router, address token0, address token1) = getPoolAddresses(poolId);
-    require(sourceAsset == token0 || sourceAsset == token1, "OPM: Invalid Swap Asset");
-    uint amount = ERC20(sourceAsset).balanceOf(address(this));
+  function swapAll(PoolAddresses memory pool, address sourceAsset) internal returns (uint received) {
+    require(sourceAsset == pool.token0 || sourceAsset == pool.token1, "OPM: Invalid Swap Asset");
+    received = swapExactAmount(pool, sourceAsset, ERC20(sourceAsset).balanceOf(address(this)));
+  }
+
+  /// @notice Swap an exact amount of one pool token for the other
+  /// @param pool ROE pool addresses
+  /// @param sourceAsset Asset to be swapped
+  /// @param amount Amount of source asset to swap
+  /// @return received Amount of target token received
+  function swapExactAmount(PoolAddresses memory pool, address sourceAsset, uint amount) internal returns (uint received) {
     if (amount == 0) return 0;
 
     address[] memory path = new address[](2);
     path[0] = sourceAsset ;
-    path[1] = sourceAsset == token0 ? token1 : token0;
-    received = swapExactTokensForTokens(router, oracle, amount, path);
+    path[1] = sourceAsset == pool.token0 ? pool.token1 : pool.token0;
+    received = swapExactTokensForTokens(pool.router, pool.oracle, amount, path);
   }
   
   /// @notice Swaps assets for exact assets
@@ -448,14 +765,17 @@ contract OptionsPositionManager is PositionManager {
   /// @param amount Amount of target token received
   /// @param path The path [source, target] of the swap
   /// @return received Amount of target tokens received
+  /// @dev No router quote beforehand, the oracle based minimum output protects the swap, and dust amounts worth nothing are skipped
   function swapExactTokensForTokens(IUniswapV2Router01 ammRouter, IPriceOracle oracle, uint amount, address[] memory path) 
     internal returns (uint256 received)
   {
-    if (amount > 0 && AmountsRouter(address(ammRouter)).getAmountsOut(amount, path)[1] > 0){
+    if (amount == 0) return 0;
+    uint minAmount = getOracleAmount(oracle, path[0], amount, path[1]) * 99 / 100; // allow 1% slippage 
+    if (minAmount > 0){
       checkSetAllowance(path[0], address(ammRouter), amount);
       uint[] memory amounts = ammRouter.swapExactTokensForTokens(
         amount, 
-        getTargetAmountFromOracle(oracle, path[0], amount, path[1]) * 99 / 100, // allow 1% slippage 
+        minAmount,
         path, 
         address(this), 
         block.timestamp
@@ -466,16 +786,21 @@ contract OptionsPositionManager is PositionManager {
   
   /// @notice Swaps assets for exact assets
   /// @param ammRouter AMM router
+  /// @param oracle Price oracle
   /// @param recvAmount Amount of target token received
   /// @param maxAmount Amount of source token allowed to be spent minus margin
   /// @param path The path [source, target] of the swap
-  function swapTokensForExactTokens(IUniswapV2Router01 ammRouter, uint recvAmount, uint maxAmount, address[] memory path) internal {
+  /// @dev No router quote beforehand: the router reverts if it needs more than maxAmount, capped to the available balance
+  /// and to the oracle value of the amount received plus 1% slippage
+  function swapTokensForExactTokens(IUniswapV2Router01 ammRouter, IPriceOracle oracle, uint recvAmount, uint maxAmount, address[] memory path) internal {
+    uint balance = ERC20(path[0]).balanceOf(address(this));
+    require( balance > 0, "OPM: Insufficient Token Amount" );
+    // rounded up so that dust amounts worth less than 1 unit of source token can be bought
+    uint oracleMax = getOracleAmount(oracle, path[1], recvAmount, path[0]) * 101 / 100 + 1; // allow 1% slippage
+    if (maxAmount > oracleMax) maxAmount = oracleMax;
+    if (maxAmount > balance) maxAmount = balance;
     checkSetAllowance(path[0], address(ammRouter), maxAmount);
-    uint [] memory amountsIn = AmountsRouter(address(ammRouter)).getAmountsIn(recvAmount, path);
-        
-    require( amountsIn[0] <= maxAmount && amountsIn[0] > 0, "OPM: Invalid Swap Amounts" );
-    require( amountsIn[0] <= ERC20(path[0]).balanceOf(address(this)), "OPM: Insufficient Token Amount" );
-    amountsIn = ammRouter.swapTokensForExactTokens(
+    ammRouter.swapTokensForExactTokens(
       recvAmount,
       maxAmount,
       path,
@@ -485,25 +810,19 @@ contract OptionsPositionManager is PositionManager {
   }
   
 
-  /// @notice Calculate a target swap amount based on oracle-provided token prices
+  /// @notice Convert an amount of token A to token B based on oracle-provided token prices, rounds down to 0 for dust
   /// @param oracle Price oracle
   /// @param assetA address of token A
   /// @param amountA Amount of toke A
   /// @param assetB address of token B
   /// @return amountB Amount of target token
-  function getTargetAmountFromOracle(IPriceOracle oracle, address assetA, uint amountA, address assetB) 
+  function getOracleAmount(IPriceOracle oracle, address assetA, uint amountA, address assetB) 
     internal view returns (uint amountB) 
   {
-    /**
-      uint valueA = amountA * oracle.getAssetPrice(assetA) / 10**ERC20(assetA).decimals();
-      uint valueB = amountB * oracle.getAssetPrice(assetB) / 10**ERC20(assetB).decimals();
-      We expect valueA == valueB
-    */
     uint priceAssetA = oracle.getAssetPrice(assetA);
     uint priceAssetB = oracle.getAssetPrice(assetB);
     require ( priceAssetA > 0 && priceAssetB > 0, "OPM: Invalid Oracle Price");
     amountB = amountA * priceAssetA * 10**ERC20(assetB).decimals() / 10**ERC20(assetA).decimals() / priceAssetB;
-    require( amountB > 0, "OPM: Target Amount Too Low");
   }
   
   
@@ -23,6 +23,15 @@ contract PositionManager is IFlashLoanReceiver {
   ILendingPoolAddressesProvider public ADDRESSES_PROVIDER; // IFlashLoanReceiver  requirement
   ILendingPool public LENDING_POOL; // IFlashLoanReceiver  requirement
   RoeRouter public immutable ROEROUTER; 
+
+  /// @notice ROE pool addresses, resolved once per operation and passed down the call tree
+  struct PoolAddresses {
+    ILendingPool lp;
+    IPriceOracle oracle;
+    IUniswapV2Router01 router;
+    address token0;
+    address token1;
+  }
   
   
   ////////////////////// GENERAL   
@@ -73,6 +82,14 @@ contract PositionManager is IFlashLoanReceiver {
     oracle = IPriceOracle(ILendingPoolAddressesProvider(lpap).getPriceOracle());
     router = IUniswapV2Router01(r);
   }
+
+  
+  /// @notice Get pool addresses from RoeRouter in a struct
+  /// @param poolId Id of the ROE pool
+  /// @return pool ROE Lending pool, oracle, LP asset router and underlying tokens
+  function getPool(uint poolId) internal view returns (PoolAddresses memory pool) {
+    (pool.lp, pool.oracle, pool.router, pool.token0, pool.token1) = getPoolAddresses(poolId);
+  }
   
   
   /// @notice Check and set allowance
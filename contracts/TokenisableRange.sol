@@ -23,6 +23,8 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
   event Deposit(address sender, uint trAmount);
   event Withdraw(address sender, uint trAmount);
   event ClaimFees(uint fee0, uint fee1);
+  event SetCompounding(bool isCompounding, uint32 compoundInterval);
+  event CompoundFees(uint amount0, uint amount1, uint128 liquidity);
   
   /// VARIABLES
 
@@ -54,6 +56,19 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
   // @notice deprecated, keep to avoid beacon storage slot overwriting errors
   address public TREASURY_DEPRECATED = 0x22Cc3f665ba4C898226353B672c5123c58751692;
   uint public treasuryFee_deprecated = 20;
+  /// @notice Cached Uniswap pool and sqrt prices of the range bounds, set at init or by cacheRangeParameters for older proxies
+  IUniswapV3Pool public uniswapPool;
+  uint160 public sqrtRatioLowerX96;
+  uint160 public sqrtRatioUpperX96;
+  /// @notice Vault receiving the fees, cached once resolved from the router
+  address public feeVault;
+  /// @notice Block of the last fee claim, later claims in the same block only collect owed fees
+  uint64 public lastClaimBlock;
+  /// @notice If true, fees are kept as fee0/fee1 and periodically added to the position liquidity instead of being sent to the vault
+  bool public isCompounding;
+  /// @notice Min time between 2 compoundings
+  uint32 public compoundInterval;
+  uint64 public lastCompoundTime;
   
   // These are constant across chains - https://docs.uniswap.org/protocol/reference/deployments
   INonfungiblePositionManager constant public POS_MGR = INonfungiblePositionManager(0xC36442b4a4522E871399CD717aBDD847Ab11FE88); 
@@ -107,6 +122,7 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
     }
     lowerTick = _lowerTick;
     upperTick = _upperTick;
+    _cacheRangeParameters();
     emit InitTR(address(asset0), address(asset1), startX10, endX10);
   }
   
@@ -128,6 +144,7 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
     feeTier = 5;
     upperTick = TickMath.MAX_TICK - TickMath.MAX_TICK % int24(feeTier);
     lowerTick = -upperTick;
+    _cacheRangeParameters();
     _name   = string(abi.encodePacked("Ranger full ", baseSymbol, " ", quoteSymbol));
     _symbol = string(abi.encodePacked("R-full-",baseSymbol,"-",quoteSymbol));
     emit InitTR(address(asset0), address(asset1), 0, UINT128MAX);
@@ -135,6 +152,38 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
   
 
   
+  
+  /// @notice Cache the pool address and range bounds sqrt prices, for proxies initialized before they were stored
+  function cacheRangeParameters() external {
+    require(status != ProxyState.INIT_PROXY, "!InitProxy");
+    _cacheRangeParameters();
+  }
+  
+  
+  function _cacheRangeParameters() internal {
+    uniswapPool = IUniswapV3Pool(V3_FACTORY.getPool(address(TOKEN0.token), address(TOKEN1.token), feeTier * 100));
+    sqrtRatioLowerX96 = TickMath.getSqrtRatioAtTick(lowerTick);
+    sqrtRatioUpperX96 = TickMath.getSqrtRatioAtTick(upperTick);
+  }
+  
+  
+  /// @notice Get the Uniswap pool, from cache if available
+  function getPool() internal view returns (IUniswapV3Pool pool) {
+    pool = uniswapPool;
+    if (address(pool) == address(0x0)) pool = IUniswapV3Pool(V3_FACTORY.getPool(address(TOKEN0.token), address(TOKEN1.token), feeTier * 100));
+  }
+  
+  
+  /// @notice Get the sqrt prices of the range bounds, from cache if available
+  function getSqrtRatios() internal view returns (uint160 sqrtRatioAX96, uint160 sqrtRatioBX96) {
+    sqrtRatioAX96 = sqrtRatioLowerX96;
+    sqrtRatioBX96 = sqrtRatioUpperX96;
+    if (sqrtRatioBX96 == 0) {
+      sqrtRatioAX96 = TickMath.getSqrtRatioAtTick(lowerTick);
+      sqrtRatioBX96 = TickMath.getSqrtRatioAtTick(upperTick);
+    }
+  }
+  
 
   /// @notice Get the name of this contract token
   /// @dev Override name, symbol and decimals from ERC20 inheritance
@@ -191,10 +240,28 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
 
   
   /// @notice Claim the accumulated Uniswap V3 trading fees
-  /// @dev In this version, bc compounding fees prevents depositing a fixed liquidity amount, fees arent compounded
-  /// but fully sent to a vault if it exists, else sent to treasury
+  /// @dev By default, bc compounding fees prevents depositing a fixed liquidity amount, fees arent compounded
+  /// but fully sent to a vault if it exists, else sent to treasury. In compounding mode, they are periodically added to the liquidity
+  /// @dev Only the first claim of a block collects: later claims in the same block only collect if the position owes tokens.
+  /// tokensOwed is only updated when the position is poked (collect, mint, burn), so fees of swaps that happened earlier
+  /// in the block aren't seen: they aren't lost but stay out of fee0/fee1, hence out of the TR value, until the next block's claim
   function claimFee() public {
-    (uint256 newFee0, uint256 newFee1) = POS_MGR.collect( 
+    // fees already claimed in this block: skip unless the position owes tokens, eg after a withdrawal
+    if (lastClaimBlock == block.number) {
+      (,,,,,,,,,, uint128 owed0, uint128 owed1) = POS_MGR.positions(tokenId);
+      if (owed0 == 0 && owed1 == 0) return;
+    }
+    (uint256 newFee0, uint256 newFee1) = collectAll();
+    // If there's no new fees generated, skip compounding logic;
+    //if ((newFee0 == 0) && (newFee1 == 0)) return;  // dont skip for now as remaining fees need to be moved out
+    handleFees(newFee0, newFee1, 0, 0);
+    if (isCompounding && block.timestamp >= lastCompoundTime + compoundInterval) compoundFees();
+  }
+  
+  
+  /// @notice Collect everything the position owes to the TR
+  function collectAll() internal returns (uint256 collected0, uint256 collected1) {
+    (collected0, collected1) = POS_MGR.collect( 
       INonfungiblePositionManager.CollectParams({
         tokenId: tokenId,
         recipient: address(this),
@@ -202,14 +269,92 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
         amount1Max: UINT128MAX
       })
     );
-    // If there's no new fees generated, skip compounding logic;
-    //if ((newFee0 == 0) && (newFee1 == 0)) return;  // dont skip for now as remaining fees need to be moved out
+  }
+  
+  
+  /// @notice Send the treasury share of collected fees, then hold the rest for compounding or send it to the vault
+  /// @param newFee0 Fees collected in token0
+  /// @param newFee1 Fees collected in token1
+  /// @param reserved0 Amount of token0 held by the TR that isn't fees, ie assets being withdrawn
+  /// @param reserved1 Amount of token1 held by the TR that isn't fees
+  function handleFees(uint newFee0, uint newFee1, uint reserved0, uint reserved1) internal {
+    lastClaimBlock = uint64(block.number);
     uint tf0 = newFee0 * treasuryFee / 100;
     uint tf1 = newFee1 * treasuryFee / 100;
     if (tf0 > 0) TOKEN0.token.safeTransfer(treasury, tf0);
     if (tf1 > 0) TOKEN1.token.safeTransfer(treasury, tf1);
     
-    address vault;
+    if (isCompounding) {
+      // remaining fees are held by the TR until compounded: only collected amounts count, tokens sent to the TR aren't fees
+      fee0 += newFee0 - tf0;
+      fee1 += newFee1 - tf1;
+    }
+    else {
+      address vault = feeVault;
+      if (vault == address(0x0)) {
+        vault = getRouterVault();
+        if (vault == address(0x0)) vault = treasury; // if case vault doesnt exist send to treasury
+        else feeVault = vault;
+      }
+      tf0 = TOKEN0.token.balanceOf(address(this)) - reserved0;
+      if (tf0 > 0) TOKEN0.token.safeTransfer(vault, tf0);
+      fee0 = 0;
+      tf1 = TOKEN1.token.balanceOf(address(this)) - reserved1;
+      if (tf1 > 0) TOKEN1.token.safeTransfer(vault, tf1);
+      fee1 = 0;
+    }
+    emit ClaimFees(newFee0, newFee1);
+  }
+  
+  
+  /// @notice Add the held fees to the position liquidity, without minting TR tokens
+  /// @dev Whatever can't be added at the current price ratio stays in fee0/fee1 until the next compounding
+  function compoundFees() internal {
+    lastCompoundTime = uint64(block.timestamp);
+    if (fee0 == 0 && fee1 == 0) return;
+    TOKEN0.token.safeIncreaseAllowance(address(POS_MGR), fee0);
+    TOKEN1.token.safeIncreaseAllowance(address(POS_MGR), fee1);
+    // fails if the fees are too small to add any liquidity, or are only in the token not used by the range at current price
+    try POS_MGR.increaseLiquidity(
+      INonfungiblePositionManager.IncreaseLiquidityParams({
+        tokenId: tokenId,
+        amount0Desired: fee0,
+        amount1Desired: fee1,
+        amount0Min: 0,
+        amount1Min: 0,
+        deadline: block.timestamp
+      })
+    ) returns (uint128 newLiquidity, uint256 added0, uint256 added1) {
+      liquidity = liquidity + newLiquidity;
+      fee0 -= added0;
+      fee1 -= added1;
+      emit CompoundFees(added0, added1, newLiquidity);
+    }
+    catch {}
+  }
+  
+  
+  /// @notice Set fees compounding mode
+  /// @param _isCompounding If true, fees are added to the position liquidity instead of being sent to the vault
+  /// @param _compoundInterval Min time between 2 compoundings, fees are held as fee0/fee1 in between
+  /// @dev Pending fees are claimed according to the previous mode
+  function setCompounding(bool _isCompounding, uint32 _compoundInterval) external {
+    require(msg.sender == creator, "Unallowed call");
+    if (status == ProxyState.READY) claimFee();
+    isCompounding = _isCompounding;
+    compoundInterval = _compoundInterval;
+    emit SetCompounding(_isCompounding, _compoundInterval);
+  }
+  
+  
+  /// @notice Update the cached fee vault, in case the router vault changed
+  function refreshFeeVault() external {
+    feeVault = getRouterVault();
+  }
+  
+  
+  /// @notice Get the vault for the TR tokens from the router
+  function getRouterVault() internal view returns (address vault) {
     // Call vault address in a try/catch structure as it's defined as a constant, not available in testing
     if (roerouter.code.length > 0) {
       try RoeRouter(roerouter).getVault(address(TOKEN0.token), address(TOKEN1.token)) returns (address _vault) {
@@ -217,15 +362,6 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
       }
       catch {}
     }
-    
-    if (vault == address(0x0)) vault = treasury; // if case vault doesnt exist send to treasury
-    tf0 = TOKEN0.token.balanceOf(address(this));
-    if (tf0 > 0) TOKEN0.token.safeTransfer(vault, tf0);
-    fee0 = 0;
-    tf1 = TOKEN1.token.balanceOf(address(this));
-    if (tf1 > 0) TOKEN1.token.safeTransfer(vault, tf1);
-    fee1 = 0;
-    emit ClaimFees(newFee0, newFee1);
   }
   
   
@@ -312,10 +448,14 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
   /// @param lp Amount of tokens withdrawn
   /// @param amount0Min Minimum amount of quote token withdrawn
   /// @param amount1Min Minimum amount of base token withdrawn
+  /// @dev The removed liquidity and the pending fees are collected together, instead of claiming fees in a separate collect
   function withdraw(uint256 lp, uint256 amount0Min, uint256 amount1Min) external nonReentrant returns (uint256 removed0, uint256 removed1) {
-    claimFee();
-    if (lp == 0) return (0, 0);
-    uint removedLiquidity = uint(liquidity) * lp / totalSupply();
+    if (lp == 0) {
+      claimFee();
+      return (0, 0);
+    }
+    uint tSupply = totalSupply();
+    uint removedLiquidity = uint(liquidity) * lp / tSupply;
     
     _burn(msg.sender, lp);
     (removed0, removed1) = POS_MGR.decreaseLiquidity(
@@ -328,16 +468,20 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
       })
     );
     liquidity = uint128(uint256(liquidity) - removedLiquidity); 
-    if (removed0 > 0 || removed1 > 0){
-      POS_MGR.collect( 
-        INonfungiblePositionManager.CollectParams({
-          tokenId: tokenId,
-          recipient: msg.sender,
-          amount0Max: uint128(removed0),
-          amount1Max: uint128(removed1)
-        })
-      );
-    }
+    // the position owes the removed amounts plus the fees accrued since the last collect
+    (uint256 collected0, uint256 collected1) = collectAll();
+    handleFees(collected0 - removed0, collected1 - removed1, removed0, removed1);
+    
+    // share of fees held before compounding
+    uint heldFee0 = fee0 * lp / tSupply;
+    uint heldFee1 = fee1 * lp / tSupply;
+    fee0 -= heldFee0;
+    fee1 -= heldFee1;
+    removed0 += heldFee0;
+    removed1 += heldFee1;
+    if (isCompounding && block.timestamp >= lastCompoundTime + compoundInterval) compoundFees();
+    if (removed0 > 0) TOKEN0.token.safeTransfer(msg.sender, removed0);
+    if (removed1 > 0) TOKEN1.token.safeTransfer(msg.sender, removed1);
     emit Withdraw(msg.sender, lp);
   }
   
@@ -350,10 +494,21 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
     if (TOKEN0_PRICE == 0) TOKEN0_PRICE = ORACLE.getAssetPrice(address(TOKEN0.token));
     if (TOKEN1_PRICE == 0) TOKEN1_PRICE = ORACLE.getAssetPrice(address(TOKEN1.token));
 
+    (uint160 sqrtRatioAX96, uint160 sqrtRatioBX96) = getSqrtRatios();
+    (amt0, amt1) = getAmountsAtPrice(TOKEN0_PRICE, TOKEN1_PRICE, sqrtRatioAX96, sqrtRatioBX96);
+  }
+
+
+  /// @notice Calculate the underlying amounts of the position liquidity at a given price, excluding fees
+  /// @param TOKEN0_PRICE Base token price
+  /// @param TOKEN1_PRICE Quote token price
+  /// @param sqrtRatioAX96 Range lower sqrt price
+  /// @param sqrtRatioBX96 Range upper sqrt price
+  function getAmountsAtPrice(uint TOKEN0_PRICE, uint TOKEN1_PRICE, uint160 sqrtRatioAX96, uint160 sqrtRatioBX96) internal view returns (uint256 amt0, uint256 amt1) {
     (amt0, amt1) = LiquidityAmounts.getAmountsForLiquidity(
       uint160(Sqrt.sqrt((TOKEN0_PRICE * 10**TOKEN1.decimals * 2**96) / (TOKEN1_PRICE * 10**TOKEN0.decimals )) * 2**48),
-      TickMath.getSqrtRatioAtTick(lowerTick), 
-      TickMath.getSqrtRatioAtTick(upperTick),
+      sqrtRatioAX96, 
+      sqrtRatioBX96,
       liquidity
     );
   }
@@ -376,6 +531,43 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
     return totalValue * 1e18 / totalSupply();
   } 
 
+
+  /// @notice Return the price of LP tokens and the underlying amounts per LP token for a list of price pairs
+  /// @param token0Prices Base token prices
+  /// @param token1Prices Quote token prices
+  /// @return valuesX1e8 Value of 1 LP token for each price pair, as returned by getValuePerLPAtPrice
+  /// @return amounts0 Amount of token0 underlying 1 LP token for each price pair, including fees
+  /// @return amounts1 Amount of token1 underlying 1 LP token for each price pair, including fees
+  /// @dev The range parameters and supply are read once for the whole list. A zero price is replaced by the oracle price
+  function getValuesPerLPAtPrices(uint[] calldata token0Prices, uint[] calldata token1Prices) 
+    public view returns (uint[] memory valuesX1e8, uint[] memory amounts0, uint[] memory amounts1) 
+  {
+    require(token0Prices.length == token1Prices.length, "Invalid lengths");
+    valuesX1e8 = new uint[](token0Prices.length);
+    amounts0 = new uint[](token0Prices.length);
+    amounts1 = new uint[](token0Prices.length);
+    uint supply = totalSupply();
+    if (supply == 0) return (valuesX1e8, amounts0, amounts1);
+    (uint160 sqrtRatioAX96, uint160 sqrtRatioBX96) = getSqrtRatios();
+    for (uint k = 0; k < token0Prices.length; k++)
+      (valuesX1e8[k], amounts0[k], amounts1[k]) = getValuePerLPAtSqrtRatios(token0Prices[k], token1Prices[k], sqrtRatioAX96, sqrtRatioBX96, supply);
+  }
+
+
+  /// @notice Return the price of 1 LP token and its underlying amounts at a given price
+  function getValuePerLPAtSqrtRatios(uint TOKEN0_PRICE, uint TOKEN1_PRICE, uint160 sqrtRatioAX96, uint160 sqrtRatioBX96, uint supply) 
+    internal view returns (uint priceX1e8, uint amt0, uint amt1) 
+  {
+    if (TOKEN0_PRICE == 0) TOKEN0_PRICE = ORACLE.getAssetPrice(address(TOKEN0.token));
+    if (TOKEN1_PRICE == 0) TOKEN1_PRICE = ORACLE.getAssetPrice(address(TOKEN1.token));
+    (amt0, amt1) = getAmountsAtPrice(TOKEN0_PRICE, TOKEN1_PRICE, sqrtRatioAX96, sqrtRatioBX96);
+    amt0 += fee0;
+    amt1 += fee1;
+    priceX1e8 = (TOKEN0_PRICE * amt0 / (10 ** TOKEN0.decimals) + amt1 * TOKEN1_PRICE / (10 ** TOKEN1.decimals)) * 1e18 / supply;
+    amt0 = amt0 * 1e18 / supply;
+    amt1 = amt1 * 1e18 / supply;
+  }
+
   
   /// @notice Return the price of the LP token
   function latestAnswer() public view returns (uint256 priceX1e8) {
@@ -386,9 +578,9 @@ contract TokenisableRange is ERC20("", ""), ReentrancyGuard {
   /// @notice Return the underlying tokens amounts for a given TR balance excluding the fees
   /// @param amount Amount of tokens we want the underlying amounts for
   function getTokenAmountsExcludingFees(uint amount) public view returns (uint token0Amount, uint token1Amount){
-    address pool = V3_FACTORY.getPool(address(TOKEN0.token), address(TOKEN1.token), feeTier * 100);
-    (uint160 sqrtPriceX96,,,,,,)  = IUniswapV3Pool(pool).slot0();
-    (token0Amount, token1Amount) = LiquidityAmounts.getAmountsForLiquidity( sqrtPriceX96, TickMath.getSqrtRatioAtTick(lowerTick), TickMath.getSqrtRatioAtTick(upperTick),  uint128 ( uint(liquidity) * amount / totalSupply() ) );
+    (uint160 sqrtPriceX96,,,,,,)  = getPool().slot0();
+    (uint160 sqrtRatioAX96, uint160 sqrtRatioBX96) = getSqrtRatios();
+    (token0Amount, token1Amount) = LiquidityAmounts.getAmountsForLiquidity( sqrtPriceX96, sqrtRatioAX96, sqrtRatioBX96,  uint128 ( uint(liquidity) * amount / totalSupply() ) );
   }
 
 
@@ -0,0 +1,83 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../../interfaces/IAaveLendingPoolV2.sol";
+import "../GeVault.sol";
+import "../TokenisableRange.sol";
+
+
+/// @notice Read the state of several GeVaults in a single call
+contract GeVaultLens {
+
+  struct TickData {
+    address tick;
+    address aToken;
+    // Amount of tick deposited by the vault in the lending pool
+    uint balance;
+    // Underlying amounts of the vault balance
+    uint amount0;
+    uint amount1;
+    // Total tick supplied to and borrowed from the lending pool
+    uint aTokenSupply;
+    uint debt;
+  }
+
+  struct VaultData {
+    address vault;
+    uint tvl;
+    uint amount0;
+    uint amount1;
+    uint totalSupply;
+    uint latestAnswer;
+    uint activeTickIndex;
+    uint lastTickIndex;
+    bool poolMatchesOracle;
+    TickData[] ticks;
+  }
+
+
+  /// @notice Get the state of several vaults
+  /// @param vaults List of vault addresses
+  /// @return data State of each vault
+  function getVaultsData(address payable[] memory vaults) public view returns (VaultData[] memory data) {
+    data = new VaultData[](vaults.length);
+    for (uint k = 0; k < vaults.length; k++) data[k] = getVaultData(vaults[k]);
+  }
+
+
+  /// @notice Get the state of a vault
+  /// @param vault Vault address
+  /// @return data Vault state
+  /// @dev Reserves are computed once, and latestAnswer derived from them
+  function getVaultData(address payable vault) public view returns (VaultData memory data) {
+    GeVault v = GeVault(vault);
+    data.vault = vault;
+    (data.amount0, data.amount1, data.tvl) = v.getReserves();
+    data.totalSupply = v.totalSupply();
+    if (data.totalSupply > 0) data.latestAnswer = data.tvl * 1e18 / data.totalSupply;
+    data.activeTickIndex = v.getActiveTickIndex();
+    data.lastTickIndex = v.lastTickIndex();
+    data.poolMatchesOracle = v.poolMatchesOracle();
+
+    ILendingPool lendingPool = v.lendingPool();
+    uint tickLength = v.getTickLength();
+    data.ticks = new TickData[](tickLength);
+    for (uint k = 0; k < tickLength; k++) data.ticks[k] = getTickData(v, lendingPool, k);
+  }
+
+
+  /// @notice Get the state of a vault tick
+  /// @param v Vault
+  /// @param lendingPool Vault lending pool
+  /// @param index Tick index
+  function getTickData(GeVault v, ILendingPool lendingPool, uint index) internal view returns (TickData memory t) {
+    TokenisableRange tr = v.ticks(index);
+    t.tick = address(tr);
+    t.aToken = v.tickATokens(t.tick);
+    t.balance = ERC20(t.aToken).balanceOf(address(v));
+    (t.amount0, t.amount1) = tr.getTokenAmounts(t.balance);
+    t.aTokenSupply = ERC20(t.aToken).totalSupply();
+    t.debt = ERC20(lendingPool.getReserveData(t.tick).variableDebtTokenAddress).totalSupply();
+  }
+}
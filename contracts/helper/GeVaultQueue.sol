@@ -0,0 +1,171 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../openzeppelin-solidity/contracts/token/ERC20/utils/SafeERC20.sol";
+import "../openzeppelin-solidity/contracts/security/ReentrancyGuard.sol";
+import "../GeVault.sol";
+
+
+/// @notice Batch deposits and withdrawals into a GeVault by epoch
+/// @dev Users queue deposits and withdrawals in the current epoch. Settling the epoch costs a single vault rebalancing,
+/// and the resulting GEV tokens and underlying tokens are claimed pro-rata by each participant
+contract GeVaultQueue is ReentrancyGuard {
+  using SafeERC20 for ERC20;
+
+  event QueueDeposit(address indexed user, uint indexed epoch, address token, uint amount);
+  event QueueWithdraw(address indexed user, uint indexed epoch, address token, uint liquidity);
+  event Cancel(address indexed user, uint indexed epoch);
+  event Settle(uint indexed epoch);
+  event Claim(address indexed user, uint indexed epoch, uint liquidity, uint amount0, uint amount1);
+
+  /// @notice Totals of an epoch, indexed by token: 0 for token0, 1 for token1
+  struct Epoch {
+    uint[2] deposits;
+    uint[2] withdrawals;
+    uint[2] shares;
+    uint[2] redeemed;
+    bool isSettled;
+  }
+
+  GeVault public immutable vault;
+  ERC20 public immutable token0;
+  ERC20 public immutable token1;
+
+  /// @notice Epoch currently receiving deposits and withdrawals
+  uint public currentEpoch;
+  mapping(uint => Epoch) private epochs;
+  mapping(uint => mapping(address => uint[2])) private userDeposits;
+  mapping(uint => mapping(address => uint[2])) private userWithdrawals;
+
+
+  constructor(address payable _vault){
+    vault = GeVault(_vault);
+    token0 = GeVault(_vault).token0();
+    token1 = GeVault(_vault).token1();
+  }
+
+
+  /// @notice Queue a deposit in the current epoch
+  /// @param token Token deposited, token0 or token1
+  /// @param amount Amount deposited
+  function deposit(address token, uint amount) public nonReentrant {
+    require(amount > 0, "GEV: Deposit Zero");
+    uint i = getTokenIndex(token);
+    ERC20(token).safeTransferFrom(msg.sender, address(this), amount);
+    userDeposits[currentEpoch][msg.sender][i] += amount;
+    epochs[currentEpoch].deposits[i] += amount;
+    emit QueueDeposit(msg.sender, currentEpoch, token, amount);
+  }
+
+
+  /// @notice Queue a withdrawal in the current epoch
+  /// @param liquidity Amount of GEV tokens to redeem
+  /// @param token Token redeemed for, token0 or token1
+  function withdraw(uint liquidity, address token) public nonReentrant {
+    require(liquidity > 0, "GEV: Withdraw Zero");
+    uint i = getTokenIndex(token);
+    ERC20(address(vault)).safeTransferFrom(msg.sender, address(this), liquidity);
+    userWithdrawals[currentEpoch][msg.sender][i] += liquidity;
+    epochs[currentEpoch].withdrawals[i] += liquidity;
+    emit QueueWithdraw(msg.sender, currentEpoch, token, liquidity);
+  }
+
+
+  /// @notice Cancel all deposits and withdrawals of the user in the current epoch, eg if the epoch cannot be settled
+  function cancel() public nonReentrant {
+    uint epoch = currentEpoch;
+    uint[2] memory deposits = userDeposits[epoch][msg.sender];
+    uint[2] memory withdrawals = userWithdrawals[epoch][msg.sender];
+    delete userDeposits[epoch][msg.sender];
+    delete userWithdrawals[epoch][msg.sender];
+    for (uint i = 0; i < 2; i++){
+      epochs[epoch].deposits[i] -= deposits[i];
+      epochs[epoch].withdrawals[i] -= withdrawals[i];
+      if (deposits[i] > 0) (i == 0 ? token0 : token1).safeTransfer(msg.sender, deposits[i]);
+    }
+    if (withdrawals[0] + withdrawals[1] > 0) ERC20(address(vault)).safeTransfer(msg.sender, withdrawals[0] + withdrawals[1]);
+    emit Cancel(msg.sender, epoch);
+  }
+
+
+  /// @notice Settle the current epoch in the vault and open the next one
+  /// @dev Anyone can settle, the vault checks that the pool price matches the oracle
+  function settle() public nonReentrant {
+    uint epoch = currentEpoch;
+    Epoch storage e = epochs[epoch];
+    require(e.deposits[0] + e.deposits[1] + e.withdrawals[0] + e.withdrawals[1] > 0, "GEV: Empty Epoch");
+    currentEpoch++;
+
+    checkSetApprove(token0, e.deposits[0]);
+    checkSetApprove(token1, e.deposits[1]);
+    (uint[2] memory shares, uint[2] memory redeemed) = vault.settleQueue(e.deposits, e.withdrawals);
+    e.shares = shares;
+    e.redeemed = redeemed;
+    e.isSettled = true;
+    emit Settle(epoch);
+  }
+
+
+  /// @notice Claim the GEV tokens and underlying tokens due to the user for a settled epoch
+  /// @param epoch Epoch number
+  /// @return liquidity GEV tokens received for deposits
+  /// @return amounts Amounts of token0 and token1 received for withdrawals
+  function claim(uint epoch) public nonReentrant returns (uint liquidity, uint[2] memory amounts) {
+    (liquidity, amounts) = getClaimable(epoch, msg.sender);
+    delete userDeposits[epoch][msg.sender];
+    delete userWithdrawals[epoch][msg.sender];
+
+    if (liquidity > 0) ERC20(address(vault)).safeTransfer(msg.sender, liquidity);
+    if (amounts[0] > 0) token0.safeTransfer(msg.sender, amounts[0]);
+    if (amounts[1] > 0) token1.safeTransfer(msg.sender, amounts[1]);
+    emit Claim(msg.sender, epoch, liquidity, amounts[0], amounts[1]);
+  }
+
+
+  /// @notice Get the GEV tokens and underlying tokens claimable by a user for an epoch
+  /// @param epoch Epoch number
+  /// @param user User address
+  /// @return liquidity GEV tokens received for deposits
+  /// @return amounts Amounts of token0 and token1 received for withdrawals
+  function getClaimable(uint epoch, address user) public view returns (uint liquidity, uint[2] memory amounts) {
+    Epoch memory e = epochs[epoch];
+    require(e.isSettled, "GEV: Epoch Not Settled");
+    uint[2] memory deposits = userDeposits[epoch][user];
+    uint[2] memory withdrawals = userWithdrawals[epoch][user];
+    for (uint i = 0; i < 2; i++){
+      if (deposits[i] > 0) liquidity += e.shares[i] * deposits[i] / e.deposits[i];
+      if (withdrawals[i] > 0) amounts[i] = e.redeemed[i] * withdrawals[i] / e.withdrawals[i];
+    }
+  }
+
+
+  /// @notice Get the totals of an epoch
+  /// @param epoch Epoch number
+  function getEpoch(uint epoch) public view returns (Epoch memory) {
+    return epochs[epoch];
+  }
+
+
+  /// @notice Get the deposits and withdrawals queued by a user in an epoch
+  /// @param epoch Epoch number
+  /// @param user User address
+  function getUserRequests(uint epoch, address user) public view returns (uint[2] memory deposits, uint[2] memory withdrawals) {
+    deposits = userDeposits[epoch][user];
+    withdrawals = userWithdrawals[epoch][user];
+  }
+
+
+  /// @notice Get the index of a token in the epoch totals
+  function getTokenIndex(address token) internal view returns (uint) {
+    require(token == address(token0) || token == address(token1), "GEV: Invalid Token");
+    return token == address(token0) ? 0 : 1;
+  }
+
+
+  /// @notice Helper that checks current allowance and approves the vault if necessary
+  function checkSetApprove(ERC20 token, uint amount) internal {
+    uint currentAllowance = token.allowance(address(this), address(vault));
+    if (currentAllowance < amount) token.safeIncreaseAllowance(address(vault), type(uint256).max - currentAllowance);
+  }
+}
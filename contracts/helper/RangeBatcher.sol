@@ -0,0 +1,95 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../openzeppelin-solidity/contracts/token/ERC20/utils/SafeERC20.sol";
+import "../openzeppelin-solidity/contracts/security/ReentrancyGuard.sol";
+import "../TokenisableRange.sol";
+
+
+/// @notice Deposit in and withdraw from several TokenisableRanges of the same pair in one call
+/// @dev Each TR owns its Uniswap NFT, so the POS_MGR calls of several TRs cannot be merged in a single POS_MGR multicall.
+/// Token transfers and allowances are aggregated per token instead
+contract RangeBatcher is ReentrancyGuard {
+  using SafeERC20 for ERC20;
+
+  event DepositMany(address indexed sender, uint count, uint amount0, uint amount1);
+  event WithdrawMany(address indexed sender, uint count, uint removed0, uint removed1);
+
+
+  /// @notice Deposit in several TRs
+  /// @param trs List of TRs, all on the same pair
+  /// @param n0 Amounts of quote token deposited in each TR
+  /// @param n1 Amounts of base token deposited in each TR
+  /// @return lpAmts Amounts of TR tokens sent back for each TR
+  /// @dev Unused tokens are sent back
+  function depositMany(TokenisableRange[] calldata trs, uint[] calldata n0, uint[] calldata n1) external nonReentrant returns (uint[] memory lpAmts) {
+    require(trs.length > 0 && trs.length == n0.length && trs.length == n1.length, "RB: Invalid Lengths");
+    (ERC20 token0, ERC20 token1) = getPairTokens(trs);
+    uint amount0;
+    uint amount1;
+    for (uint k = 0; k < trs.length; k++){
+      amount0 += n0[k];
+      amount1 += n1[k];
+    }
+    token0.safeTransferFrom(msg.sender, address(this), amount0);
+    token1.safeTransferFrom(msg.sender, address(this), amount1);
+
+    lpAmts = new uint[](trs.length);
+    for (uint k = 0; k < trs.length; k++){
+      checkSetApprove(token0, address(trs[k]), n0[k]);
+      checkSetApprove(token1, address(trs[k]), n1[k]);
+      lpAmts[k] = trs[k].deposit(n0[k], n1[k]);
+      if (lpAmts[k] > 0) ERC20(address(trs[k])).safeTransfer(msg.sender, lpAmts[k]);
+    }
+
+    uint bal = token0.balanceOf(address(this));
+    if (bal > 0) token0.safeTransfer(msg.sender, bal);
+    bal = token1.balanceOf(address(this));
+    if (bal > 0) token1.safeTransfer(msg.sender, bal);
+    emit DepositMany(msg.sender, trs.length, amount0, amount1);
+  }
+
+
+  /// @notice Withdraw from several TRs
+  /// @param trs List of TRs, all on the same pair
+  /// @param lps Amounts of TR tokens withdrawn from each TR
+  /// @param amount0Min Minimum total amount of quote token withdrawn
+  /// @param amount1Min Minimum total amount of base token withdrawn
+  /// @return removed0 Total amount of quote token withdrawn
+  /// @return removed1 Total amount of base token withdrawn
+  function withdrawMany(TokenisableRange[] calldata trs, uint[] calldata lps, uint amount0Min, uint amount1Min) external nonReentrant returns (uint removed0, uint removed1) {
+    require(trs.length > 0 && trs.length == lps.length, "RB: Invalid Lengths");
+    (ERC20 token0, ERC20 token1) = getPairTokens(trs);
+    for (uint k = 0; k < trs.length; k++){
+      if (lps[k] == 0) continue;
+      ERC20(address(trs[k])).safeTransferFrom(msg.sender, address(this), lps[k]);
+      (uint r0, uint r1) = trs[k].withdraw(lps[k], 0, 0);
+      removed0 += r0;
+      removed1 += r1;
+    }
+    require(removed0 >= amount0Min && removed1 >= amount1Min, "RB: Slippage");
+    if (removed0 > 0) token0.safeTransfer(msg.sender, removed0);
+    if (removed1 > 0) token1.safeTransfer(msg.sender, removed1);
+    emit WithdrawMany(msg.sender, trs.length, removed0, removed1);
+  }
+
+
+  /// @notice Get the pair tokens and check that all TRs share them
+  function getPairTokens(TokenisableRange[] calldata trs) internal view returns (ERC20 token0, ERC20 token1) {
+    (token0, ) = trs[0].TOKEN0();
+    (token1, ) = trs[0].TOKEN1();
+    for (uint k = 1; k < trs.length; k++){
+      (ERC20 t0, ) = trs[k].TOKEN0();
+      (ERC20 t1, ) = trs[k].TOKEN1();
+      require(t0 == token0 && t1 == token1, "RB: Invalid Pair");
+    }
+  }
+
+
+  /// @notice Helper that checks current allowance and approves if necessary
+  function checkSetApprove(ERC20 token, address spender, uint amount) internal {
+    uint currentAllowance = token.allowance(address(this), spender);
+    if (currentAllowance < amount) token.safeIncreaseAllowance(spender, type(uint256).max - currentAllowance);
+  }
+}
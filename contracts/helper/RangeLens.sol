@@ -0,0 +1,62 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../../interfaces/IAaveOracle.sol";
+import "../TokenisableRange.sol";
+
+
+/// @notice Value several TokenisableRanges of the same pair in a single call
+/// @dev The oracle prices of the pair are read once and passed to each TR
+contract RangeLens {
+
+  /// @notice Get the value of 1 LP token of several TRs at the current oracle prices
+  /// @param trs List of TRs, all on the same pair and oracle
+  /// @return valuesX1e8 Value of 1 LP token of each TR
+  function getLatestAnswers(TokenisableRange[] calldata trs) public view returns (uint[] memory valuesX1e8) {
+    (uint price0, uint price1) = getOraclePrices(trs);
+    valuesX1e8 = new uint[](trs.length);
+    for (uint k = 0; k < trs.length; k++) valuesX1e8[k] = trs[k].getValuePerLPAtPrice(price0, price1);
+  }
+
+
+  /// @notice Get the value and underlying amounts of 1 LP token of several TRs for a list of price pairs
+  /// @param trs List of TRs, all on the same pair and oracle
+  /// @param token0Prices Base token prices
+  /// @param token1Prices Quote token prices
+  /// @return valuesX1e8 Value of 1 LP token, indexed by TR then price pair
+  /// @return amounts0 Amount of token0 underlying 1 LP token, indexed by TR then price pair
+  /// @return amounts1 Amount of token1 underlying 1 LP token, indexed by TR then price pair
+  /// @dev A zero price is replaced by the oracle price, which is read once for all TRs
+  function getValuesPerLPAtPrices(TokenisableRange[] calldata trs, uint[] memory token0Prices, uint[] memory token1Prices)
+    public view returns (uint[][] memory valuesX1e8, uint[][] memory amounts0, uint[][] memory amounts1)
+  {
+    require(token0Prices.length == token1Prices.length, "RL: Invalid Lengths");
+    (uint price0, uint price1) = getOraclePrices(trs);
+    for (uint k = 0; k < token0Prices.length; k++){
+      if (token0Prices[k] == 0) token0Prices[k] = price0;
+      if (token1Prices[k] == 0) token1Prices[k] = price1;
+    }
+    valuesX1e8 = new uint[][](trs.length);
+    amounts0 = new uint[][](trs.length);
+    amounts1 = new uint[][](trs.length);
+    for (uint k = 0; k < trs.length; k++)
+      (valuesX1e8[k], amounts0[k], amounts1[k]) = trs[k].getValuesPerLPAtPrices(token0Prices, token1Prices);
+  }
+
+
+  /// @notice Read the oracle prices of the pair shared by all TRs
+  function getOraclePrices(TokenisableRange[] calldata trs) internal view returns (uint price0, uint price1) {
+    require(trs.length > 0, "RL: Invalid Lengths");
+    (ERC20 token0, ) = trs[0].TOKEN0();
+    (ERC20 token1, ) = trs[0].TOKEN1();
+    IAaveOracle oracle = trs[0].ORACLE();
+    for (uint k = 1; k < trs.length; k++){
+      (ERC20 t0, ) = trs[k].TOKEN0();
+      (ERC20 t1, ) = trs[k].TOKEN1();
+      require(t0 == token0 && t1 == token1 && trs[k].ORACLE() == oracle, "RL: Invalid Pair");
+    }
+    price0 = oracle.getAssetPrice(address(token0));
+    price1 = oracle.getAssetPrice(address(token1));
+  }
+}
@@ -5,6 +5,9 @@ import "../openzeppelin-solidity/contracts/access/Ownable.sol";
 import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
 import "../openzeppelin-solidity/contracts/token/ERC20/utils/SafeERC20.sol";
 import "../openzeppelin-solidity/contracts/security/ReentrancyGuard.sol"; 
+import "../../interfaces/IUniswapV3Factory.sol";
+import "../../interfaces/IUniswapV3Pool.sol";
+import "../lib/FullMath.sol";
 
 interface ISwapRouter {
     struct ExactInputSingleParams {
@@ -32,6 +35,7 @@ interface ISwapRouter {
     function exactOutputSingle(ExactOutputSingleParams calldata params) external payable returns (uint256 amountIn);
     function refundETH() external payable;
     function WETH9() external view returns (address);
+    function factory() external view returns (address);
 }
 
 
@@ -109,28 +113,93 @@ contract V3Proxy is ReentrancyGuard, Ownable {
         amounts[1] = amountOut;
     }
 
+    /// @notice Estimate a swap output from the pool spot price and fee tier, without the Quoter
+    /// @dev Ignores price impact and the price can be moved within a block: only for an order of magnitude, not for slippage protection
+    function estimateAmountsOut(uint amountIn, address[] calldata path) external view returns (uint[] memory amounts) {
+        require(path.length == 2, "Direct swap only");
+        amounts = new uint[](2);
+        amounts[0] = amountIn;
+        amounts[1] = getSpotAmount(amountIn, path[0], path[1]) * (1e6 - feeTier) / 1e6;
+    }
+
+    /// @notice Estimate a swap input from the pool spot price and fee tier, without the Quoter
+    /// @dev Ignores price impact and the price can be moved within a block: only for an order of magnitude, not for slippage protection
+    function estimateAmountsIn(uint amountOut, address[] calldata path) external view returns (uint[] memory amounts) {
+        require(path.length == 2, "Direct swap only");
+        amounts = new uint[](2);
+        amounts[0] = getSpotAmount(amountOut, path[1], path[0]) * 1e6 / (1e6 - feeTier);
+        amounts[1] = amountOut;
+    }
+
+    /// @notice Convert an amount of tokenA to tokenB at the pool spot price
+    function getSpotAmount(uint amount, address tokenA, address tokenB) internal view returns (uint) {
+        address pool = IUniswapV3Factory(ROUTER.factory()).getPool(tokenA, tokenB, feeTier);
+        require(pool != address(0), "Invalid pool");
+        (uint160 sqrtPriceX96,,,,,,) = IUniswapV3Pool(pool).slot0();
+        // pool price is token1 per token0
+        if (tokenA < tokenB) return FullMath.mulDiv(FullMath.mulDiv(amount, sqrtPriceX96, 2**96), sqrtPriceX96, 2**96);
+        else return FullMath.mulDiv(FullMath.mulDiv(amount, 2**96, sqrtPriceX96), 2**96, sqrtPriceX96);
+    }
+
     function swapExactTokensForTokens(uint amountIn, uint amountOutMin, address[] calldata path, address to, uint deadline) external returns (uint[] memory amounts) {
+        amounts = swapExactInput(amountIn, amountOutMin, path, to, deadline, 0);
+    }
+
+    /// @notice Swap without quoting first, protected by amountOutMin and a price limit
+    /// @param sqrtPriceLimitX96 Pool price at which the swap stops, the input not swapped is sent back
+    function swapExactTokensForTokensWithLimit(uint amountIn, uint amountOutMin, address[] calldata path, address to, uint deadline, uint160 sqrtPriceLimitX96) 
+        external returns (uint[] memory amounts) 
+    {
+        amounts = swapExactInput(amountIn, amountOutMin, path, to, deadline, sqrtPriceLimitX96);
+    }
+
+    function swapTokensForExactTokens(uint amountOut, uint amountInMax, address[] calldata path, address to, uint deadline) external returns (uint[] memory amounts) {
+        amounts = swapExactOutput(amountOut, amountInMax, path, to, deadline, 0);
+    }
+
+    /// @notice Swap without quoting first, protected by amountInMax and a price limit
+    /// @param sqrtPriceLimitX96 Pool price at which the swap stops, so less than amountOut may be received
+    function swapTokensForExactTokensWithLimit(uint amountOut, uint amountInMax, address[] calldata path, address to, uint deadline, uint160 sqrtPriceLimitX96) 
+        external returns (uint[] memory amounts) 
+    {
+        amounts = swapExactOutput(amountOut, amountInMax, path, to, deadline, sqrtPriceLimitX96);
+    }
+
+    function swapExactInput(uint amountIn, uint amountOutMin, address[] calldata path, address to, uint deadline, uint160 sqrtPriceLimitX96) 
+        internal returns (uint[] memory amounts) 
+    {
         require(path.length == 2, "Direct swap only");
         require(msg.sender == to, "Swap to self only");
         ERC20 ogInAsset = ERC20(path[0]);
+        uint balanceBefore = ogInAsset.balanceOf(address(this));
         ogInAsset.safeTransferFrom(msg.sender, address(this), amountIn);
         ogInAsset.safeApprove(address(ROUTER), amountIn);
         amounts = new uint[](2);
         amounts[0] = amountIn;         
-        amounts[1] = ROUTER.exactInputSingle(ISwapRouter.ExactInputSingleParams(path[0], path[1], feeTier, msg.sender, deadline, amountIn, amountOutMin, 0));
+        amounts[1] = ROUTER.exactInputSingle(ISwapRouter.ExactInputSingleParams(path[0], path[1], feeTier, msg.sender, deadline, amountIn, amountOutMin, sqrtPriceLimitX96));
         ogInAsset.safeApprove(address(ROUTER), 0);
+        // swap stopped at the price limit: send back the input left
+        uint left = ogInAsset.balanceOf(address(this)) - balanceBefore;
+        if (left > 0) {
+            amounts[0] -= left;
+            ogInAsset.safeTransfer(msg.sender, left);
+        }
         emit Swap(msg.sender, path[0], path[1], amounts[0], amounts[1]); 
     }
 
-    function swapTokensForExactTokens(uint amountOut, uint amountInMax, address[] calldata path, address to, uint deadline) external returns (uint[] memory amounts) {
+    function swapExactOutput(uint amountOut, uint amountInMax, address[] calldata path, address to, uint deadline, uint160 sqrtPriceLimitX96) 
+        internal returns (uint[] memory amounts) 
+    {
         require(path.length == 2, "Direct swap only");
         require(msg.sender == to, "Swap to self only");
         ERC20 ogInAsset = ERC20(path[0]);
+        uint balanceOutBefore = ERC20(path[1]).balanceOf(msg.sender);
         ogInAsset.safeTransferFrom(msg.sender, address(this), amountInMax);
         ogInAsset.safeApprove(address(ROUTER), amountInMax);
         amounts = new uint[](2);
-        amounts[0] = ROUTER.exactOutputSingle(ISwapRouter.ExactOutputSingleParams(path[0], path[1], feeTier, msg.sender, deadline, amountOut, amountInMax, 0));         
-        amounts[1] = amountOut; 
+        amounts[0] = ROUTER.exactOutputSingle(ISwapRouter.ExactOutputSingleParams(path[0], path[1], feeTier, msg.sender, deadline, amountOut, amountInMax, sqrtPriceLimitX96));         
+        // swap stopped at the price limit: less than amountOut was received
+        amounts[1] = sqrtPriceLimitX96 == 0 ? amountOut : ERC20(path[1]).balanceOf(msg.sender) - balanceOutBefore; 
         ogInAsset.safeTransfer(msg.sender, ogInAsset.balanceOf(address(this)));
         ogInAsset.safeApprove(address(ROUTER), 0);
         emit Swap(msg.sender, path[0], path[1], amounts[0], amounts[1]); 
@@ -0,0 +1,42 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+
+
+/// @notice ERC20 with free minting for tests
+contract MockERC20 is ERC20 {
+  uint8 private immutable _decimals;
+
+  constructor(string memory name_, string memory symbol_, uint8 decimals_) ERC20(name_, symbol_) {
+    _decimals = decimals_;
+  }
+
+  function decimals() public view virtual override returns (uint8) {
+    return _decimals;
+  }
+
+  /// @notice Mint tokens to any address
+  function mint(address to, uint amount) external {
+    _mint(to, amount);
+  }
+}
+
+
+/// @notice WETH with free minting for tests
+contract MockWETH is MockERC20("Wrapped Ether", "WETH", 18) {
+
+  function deposit() public payable {
+    _mint(msg.sender, msg.value);
+  }
+
+  function withdraw(uint amount) external {
+    _burn(msg.sender, amount);
+    (bool success, ) = payable(msg.sender).call{value: amount}("");
+    require(success, "WETH: Error sending ETH");
+  }
+
+  receive() external payable {
+    deposit();
+  }
+}
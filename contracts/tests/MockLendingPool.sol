@@ -0,0 +1,325 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../openzeppelin-solidity/contracts/token/ERC20/utils/SafeERC20.sol";
+import "../../interfaces/DataTypes.sol";
+import "../../interfaces/IFlashLoanReceiver.sol";
+import "../../interfaces/IPriceOracle.sol";
+
+
+/// @notice Aave V2 aToken or variable debt token stand-in: 1:1 with the underlying, no interest
+/// @dev aTokens hold the underlying, as in Aave, so that the reserve liquidity is the underlying balance of the aToken
+contract MockAToken is ERC20 {
+  using SafeERC20 for ERC20;
+
+  address public immutable POOL;
+  address public immutable UNDERLYING_ASSET_ADDRESS;
+  bool public immutable isDebtToken;
+  uint8 private immutable _decimals;
+
+  constructor(string memory name_, string memory symbol_, address asset, bool _isDebtToken) ERC20(name_, symbol_) {
+    POOL = msg.sender;
+    UNDERLYING_ASSET_ADDRESS = asset;
+    isDebtToken = _isDebtToken;
+    _decimals = ERC20(asset).decimals();
+  }
+
+  modifier onlyPool() {
+    require(msg.sender == POOL, "CT_CALLER_MUST_BE_LENDING_POOL");
+    _;
+  }
+
+  function decimals() public view virtual override returns (uint8) {
+    return _decimals;
+  }
+
+  function mint(address to, uint amount) external onlyPool {
+    _mint(to, amount);
+  }
+
+  function burn(address from, uint amount) external onlyPool {
+    _burn(from, amount);
+  }
+
+  function transferOnLiquidation(address from, address to, uint amount) external onlyPool {
+    _transfer(from, to, amount);
+  }
+
+  function transferUnderlyingTo(address to, uint amount) external onlyPool {
+    ERC20(UNDERLYING_ASSET_ADDRESS).safeTransfer(to, amount);
+  }
+
+  /// @notice Debt isn't transferable
+  function _transfer(address from, address to, uint amount) internal virtual override {
+    require(!isDebtToken || msg.sender == POOL, "TRANSFER_NOT_SUPPORTED");
+    super._transfer(from, to, amount);
+  }
+}
+
+
+/// @notice Aave V2 lending pool addresses provider stand-in
+contract MockAddressesProvider {
+  address public getLendingPool;
+  address public getPriceOracle;
+  address public immutable getPoolAdmin;
+
+  constructor() {
+    getPoolAdmin = msg.sender;
+  }
+
+  function setLendingPoolImpl(address pool) external {
+    require(msg.sender == getPoolAdmin, "Unallowed call");
+    getLendingPool = pool;
+  }
+
+  function setPriceOracle(address priceOracle) external {
+    require(msg.sender == getPoolAdmin, "Unallowed call");
+    getPriceOracle = priceOracle;
+  }
+}
+
+
+/// @notice Lending pool stand-in for tests, compatible with the Aave V2 fork calls used by the contracts
+/// @dev Variable rate only, no interest, no liquidations. Collateral uses the same ltv and liquidation threshold for all reserves
+contract MockLendingPool {
+  using SafeERC20 for ERC20;
+
+  event Deposit(address indexed reserve, address user, address indexed onBehalfOf, uint amount, uint16 indexed referral);
+  event Withdraw(address indexed reserve, address indexed user, address indexed to, uint amount);
+  event Borrow(address indexed reserve, address user, address indexed onBehalfOf, uint amount, uint borrowRateMode, uint borrowRate, uint16 indexed referral);
+  event Repay(address indexed reserve, address indexed user, address indexed repayer, uint amount);
+  event FlashLoan(address indexed target, address indexed initiator, address indexed asset, uint amount, uint premium, uint16 referralCode);
+  event LiquidationCall(address indexed collateralAsset, address indexed debtAsset, address indexed user, uint debtToCover, uint liquidatedCollateralAmount, address liquidator, bool receiveAToken);
+
+  MockAddressesProvider public immutable addressesProvider;
+  uint public constant FLASHLOAN_PREMIUM_TOTAL = 9;
+  /// @notice Share of the debt that can be repaid in a liquidation, and collateral bonus of the liquidator, in E4
+  uint public constant LIQUIDATION_CLOSE_FACTOR = 5000;
+  uint public constant LIQUIDATION_BONUS = 10500;
+  uint public ltv = 8000;
+  uint public liquidationThreshold = 8500;
+
+  mapping(address => DataTypes.ReserveData) private reserves;
+  address[] private reservesList;
+  /// @notice Position managers allowed to move user aTokens
+  mapping(address => bool) public isPM;
+  address public pm;
+
+
+  constructor(MockAddressesProvider _addressesProvider) {
+    addressesProvider = _addressesProvider;
+  }
+
+  modifier onlyPoolAdmin() {
+    require(msg.sender == addressesProvider.getPoolAdmin(), "Unallowed call");
+    _;
+  }
+
+  modifier onlyPM() {
+    require(isPM[msg.sender], "Unallowed call");
+    _;
+  }
+
+
+  //////// ADMIN
+
+  /// @notice Create the aToken and debt token of a reserve
+  function initReserve(address asset) external onlyPoolAdmin {
+    require(reserves[asset].aTokenAddress == address(0), "Reserve exists");
+    string memory symbol = ERC20(asset).symbol();
+    DataTypes.ReserveData storage reserve = reserves[asset];
+    reserve.aTokenAddress = address(new MockAToken(string(abi.encodePacked("Roe ", symbol)), string(abi.encodePacked("roe", symbol)), asset, false));
+    reserve.variableDebtTokenAddress = address(new MockAToken(string(abi.encodePacked("Roe variable debt ", symbol)), string(abi.encodePacked("vd", symbol)), asset, true));
+    reserve.liquidityIndex = 1e27;
+    reserve.variableBorrowIndex = 1e27;
+    reserve.id = uint8(reservesList.length);
+    reservesList.push(asset);
+  }
+
+  function setCollateralParameters(uint _ltv, uint _liquidationThreshold) external onlyPoolAdmin {
+    require(_ltv <= _liquidationThreshold && _liquidationThreshold <= 1e4, "Invalid parameters");
+    ltv = _ltv;
+    liquidationThreshold = _liquidationThreshold;
+  }
+
+  function PMAssign(address _pm) external onlyPoolAdmin {
+    pm = _pm;
+    isPM[_pm] = true;
+  }
+
+  function PMSet(address _pm, bool _state) external onlyPoolAdmin {
+    isPM[_pm] = _state;
+  }
+
+
+  //////// USER ACTIONS
+
+  function deposit(address asset, uint amount, address onBehalfOf, uint16 referralCode) external {
+    MockAToken aToken = getAToken(asset);
+    ERC20(asset).safeTransferFrom(msg.sender, address(aToken), amount);
+    aToken.mint(onBehalfOf, amount);
+    emit Deposit(asset, msg.sender, onBehalfOf, amount, referralCode);
+  }
+
+  function withdraw(address asset, uint amount, address to) external returns (uint) {
+    MockAToken aToken = getAToken(asset);
+    if (amount == type(uint).max) amount = aToken.balanceOf(msg.sender);
+    aToken.burn(msg.sender, amount);
+    aToken.transferUnderlyingTo(to, amount);
+    checkHealthFactor(msg.sender);
+    emit Withdraw(asset, msg.sender, to, amount);
+    return amount;
+  }
+
+  function borrow(address asset, uint amount, uint interestRateMode, uint16 referralCode, address onBehalfOf) external {
+    require(interestRateMode == 2, "Only variable rate");
+    require(onBehalfOf == msg.sender || isPM[msg.sender], "Unallowed call");
+    MockAToken aToken = getAToken(asset);
+    MockAToken(reserves[asset].variableDebtTokenAddress).mint(onBehalfOf, amount);
+    checkHealthFactor(onBehalfOf);
+    aToken.transferUnderlyingTo(msg.sender, amount);
+    emit Borrow(asset, msg.sender, onBehalfOf, amount, interestRateMode, 0, referralCode);
+  }
+
+  function repay(address asset, uint amount, uint rateMode, address onBehalfOf) external returns (uint) {
+    require(rateMode == 2, "Only variable rate");
+    MockAToken debtToken = MockAToken(reserves[asset].variableDebtTokenAddress);
+    uint debt = debtToken.balanceOf(onBehalfOf);
+    if (amount > debt) amount = debt;
+    ERC20(asset).safeTransferFrom(msg.sender, address(getAToken(asset)), amount);
+    debtToken.burn(onBehalfOf, amount);
+    emit Repay(asset, onBehalfOf, msg.sender, amount);
+    return amount;
+  }
+
+  /// @notice Flash loan: mode 0 must be paid back with the premium, other modes open a variable debt for onBehalfOf
+  function flashLoan(
+    address receiverAddress,
+    address[] calldata assets,
+    uint[] calldata amounts,
+    uint[] calldata modes,
+    address onBehalfOf,
+    bytes calldata params,
+    uint16 referralCode
+  ) external {
+    require(assets.length == amounts.length && assets.length == modes.length, "Inconsistent params");
+    uint[] memory premiums = new uint[](assets.length);
+    for (uint k = 0; k < assets.length; k++){
+      premiums[k] = amounts[k] * FLASHLOAN_PREMIUM_TOTAL / 1e4;
+      getAToken(assets[k]).transferUnderlyingTo(receiverAddress, amounts[k]);
+    }
+    require(
+      IFlashLoanReceiver(receiverAddress).executeOperation(assets, amounts, premiums, msg.sender, params),
+      "Invalid flashloan executor return"
+    );
+    for (uint k = 0; k < assets.length; k++){
+      if (modes[k] == 0)
+        ERC20(assets[k]).safeTransferFrom(receiverAddress, address(getAToken(assets[k])), amounts[k] + premiums[k]);
+      else {
+        require(onBehalfOf == msg.sender || isPM[msg.sender], "Unallowed call");
+        MockAToken(reserves[assets[k]].variableDebtTokenAddress).mint(onBehalfOf, amounts[k]);
+      }
+      emit FlashLoan(receiverAddress, msg.sender, assets[k], amounts[k], premiums[k], referralCode);
+    }
+    checkHealthFactor(onBehalfOf);
+  }
+
+
+  /// @notice Liquidate a position below the liquidation threshold: repay up to half of a debt for the collateral worth it plus the bonus
+  function liquidationCall(address collateralAsset, address debtAsset, address user, uint debtToCover, bool receiveAToken) external {
+    (uint totalCollateralETH, uint totalDebtETH,,,,) = getUserAccountData(user);
+    require(totalDebtETH * 1e4 > totalCollateralETH * liquidationThreshold, "Health factor not below threshold");
+    MockAToken debtToken = MockAToken(reserves[debtAsset].variableDebtTokenAddress);
+    MockAToken aToken = getAToken(collateralAsset);
+    uint maxDebt = debtToken.balanceOf(user) * LIQUIDATION_CLOSE_FACTOR / 1e4;
+    if (debtToCover > maxDebt) debtToCover = maxDebt;
+    
+    IPriceOracle oracle = IPriceOracle(addressesProvider.getPriceOracle());
+    uint collateral = debtToCover * oracle.getAssetPrice(debtAsset) * 10 ** ERC20(collateralAsset).decimals() * LIQUIDATION_BONUS
+      / (oracle.getAssetPrice(collateralAsset) * 10 ** ERC20(debtAsset).decimals() * 1e4);
+    uint userCollateral = aToken.balanceOf(user);
+    // not enough collateral: only the debt it covers is repaid
+    if (collateral > userCollateral) {
+      debtToCover = debtToCover * userCollateral / collateral;
+      collateral = userCollateral;
+    }
+    
+    ERC20(debtAsset).safeTransferFrom(msg.sender, address(getAToken(debtAsset)), debtToCover);
+    debtToken.burn(user, debtToCover);
+    if (receiveAToken) aToken.transferOnLiquidation(user, msg.sender, collateral);
+    else {
+      aToken.burn(user, collateral);
+      aToken.transferUnderlyingTo(msg.sender, collateral);
+    }
+    emit LiquidationCall(collateralAsset, debtAsset, user, debtToCover, collateral, msg.sender, receiveAToken);
+  }
+
+
+  //////// POSITION MANAGER
+
+  /// @notice Move aTokens from a user to the position manager
+  function PMTransfer(address aTokenAddress, address user, uint amount) external onlyPM {
+    MockAToken(aTokenAddress).transferOnLiquidation(user, msg.sender, amount);
+  }
+
+  /// @notice Move aTokens from the position manager to a user
+  function PMTransferTo(address aTokenAddress, address user, uint amount) external onlyPM {
+    MockAToken(aTokenAddress).transferOnLiquidation(msg.sender, user, amount);
+  }
+
+
+  //////// VIEWS
+
+  function getReserveData(address asset) external view returns (DataTypes.ReserveData memory) {
+    return reserves[asset];
+  }
+
+  function getReservesList() external view returns (address[] memory) {
+    return reservesList;
+  }
+
+  function getAddressesProvider() external view returns (address) {
+    return address(addressesProvider);
+  }
+
+  function paused() external pure returns (bool) {
+    return false;
+  }
+
+  /// @notice Account data, valued with 8 decimals by the oracle
+  function getUserAccountData(address user) public view returns (
+    uint totalCollateralETH,
+    uint totalDebtETH,
+    uint availableBorrowsETH,
+    uint currentLiquidationThreshold,
+    uint ltv_,
+    uint healthFactor
+  ) {
+    IPriceOracle oracle = IPriceOracle(addressesProvider.getPriceOracle());
+    for (uint k = 0; k < reservesList.length; k++){
+      address asset = reservesList[k];
+      uint unit = 10 ** ERC20(asset).decimals();
+      uint price = oracle.getAssetPrice(asset);
+      totalCollateralETH += ERC20(reserves[asset].aTokenAddress).balanceOf(user) * price / unit;
+      totalDebtETH += ERC20(reserves[asset].variableDebtTokenAddress).balanceOf(user) * price / unit;
+    }
+    currentLiquidationThreshold = liquidationThreshold;
+    ltv_ = ltv;
+    uint maxDebt = totalCollateralETH * ltv / 1e4;
+    availableBorrowsETH = maxDebt > totalDebtETH ? maxDebt - totalDebtETH : 0;
+    healthFactor = totalDebtETH == 0 ? type(uint).max : totalCollateralETH * liquidationThreshold * 1e14 / totalDebtETH;
+  }
+
+
+  function getAToken(address asset) internal view returns (MockAToken aToken) {
+    aToken = MockAToken(reserves[asset].aTokenAddress);
+    require(address(aToken) != address(0), "Invalid reserve");
+  }
+
+  /// @notice Debt must stay within the ltv of the collateral
+  function checkHealthFactor(address user) internal view {
+    (uint totalCollateralETH, uint totalDebtETH,,,,) = getUserAccountData(user);
+    require(totalDebtETH * 1e4 <= totalCollateralETH * ltv, "Health factor lower than liquidation threshold");
+  }
+}
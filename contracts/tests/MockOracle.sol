@@ -0,0 +1,29 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.8.19;
+
+
+interface ILatestAnswer {
+  function latestAnswer() external view returns (uint256);
+}
+
+
+/// @notice Aave oracle stand-in for tests: prices are either set directly, or read from a source with latestAnswer
+contract MockOracle {
+  mapping(address => uint) private prices;
+  mapping(address => address) public getSourceOfAsset;
+
+  function setAssetPrice(address asset, uint price) external {
+    prices[asset] = price;
+  }
+
+  function setAssetSources(address[] calldata assets, address[] calldata sources) external {
+    require(assets.length == sources.length, "INCONSISTENT_PARAMS_LENGTH");
+    for (uint k = 0; k < assets.length; k++) getSourceOfAsset[assets[k]] = sources[k];
+  }
+
+  function getAssetPrice(address asset) public view returns (uint256) {
+    address source = getSourceOfAsset[asset];
+    if (source != address(0)) return ILatestAnswer(source).latestAnswer();
+    return prices[asset];
+  }
+}
@@ -0,0 +1,202 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.8.19;
+
+import "../openzeppelin-solidity/contracts/token/ERC20/ERC20.sol";
+import "../openzeppelin-solidity/contracts/token/ERC20/utils/SafeERC20.sol";
+import "../lib/LiquidityAmounts.sol";
+import "../lib/TickMath.sol";
+import "../../interfaces/INonfungiblePositionManager.sol";
+
+
+/// @notice Uniswap V3 pool stand-in for tests: it only holds a price, which tests set directly instead of swapping
+contract MockUniswapV3Pool {
+  address public immutable token0;
+  address public immutable token1;
+  uint24 public immutable fee;
+  int24 public immutable tickSpacing;
+  uint160 private sqrtPriceX96;
+  int24 private tick;
+
+  constructor(address _token0, address _token1, uint24 _fee, int24 _tickSpacing) {
+    token0 = _token0;
+    token1 = _token1;
+    fee = _fee;
+    tickSpacing = _tickSpacing;
+  }
+
+  function initialize(uint160 _sqrtPriceX96) external {
+    require(sqrtPriceX96 == 0, "AI");
+    setSqrtPriceX96(_sqrtPriceX96);
+  }
+
+  /// @notice Move the pool price, as a swap would
+  function setSqrtPriceX96(uint160 _sqrtPriceX96) public {
+    sqrtPriceX96 = _sqrtPriceX96;
+    tick = TickMath.getTickAtSqrtRatio(_sqrtPriceX96);
+  }
+
+  function slot0() external view returns (uint160, int24, uint16, uint16, uint16, uint8, bool) {
+    return (sqrtPriceX96, tick, 0, 1, 1, 0, true);
+  }
+}
+
+
+/// @notice Uniswap V3 factory stand-in for tests
+/// @dev No constructor state, so that the code can be installed at the canonical factory address used by TokenisableRange
+contract MockUniswapV3Factory {
+  mapping(address => mapping(address => mapping(uint24 => address))) public getPool;
+
+  function feeAmountTickSpacing(uint24 fee) public pure returns (int24) {
+    if (fee == 100) return 1;
+    if (fee == 500) return 10;
+    if (fee == 3000) return 60;
+    if (fee == 10000) return 200;
+    return 0;
+  }
+
+  function createPool(address tokenA, address tokenB, uint24 fee) external returns (address pool) {
+    require(tokenA != tokenB && feeAmountTickSpacing(fee) > 0, "Invalid pool");
+    (address token0, address token1) = tokenA < tokenB ? (tokenA, tokenB) : (tokenB, tokenA);
+    require(getPool[token0][token1][fee] == address(0), "Pool exists");
+    pool = address(new MockUniswapV3Pool(token0, token1, fee, feeAmountTickSpacing(fee)));
+    getPool[token0][token1][fee] = pool;
+    getPool[token1][token0][fee] = pool;
+  }
+}
+
+
+/// @notice Uniswap V3 position manager stand-in for tests
+/// @dev Positions are valued at the mock pool price. The manager holds all position tokens, so it must be funded
+/// with reserves by the tests for withdrawals after a price move. Fees are added by tests with addFees.
+/// No constructor state, so that the code can be installed at the canonical address used by TokenisableRange
+contract MockNonfungiblePositionManager {
+  using SafeERC20 for ERC20;
+
+  struct Position {
+    address owner;
+    address pool;
+    int24 tickLower;
+    int24 tickUpper;
+    uint128 liquidity;
+    uint128 tokensOwed0;
+    uint128 tokensOwed1;
+  }
+
+  MockUniswapV3Factory constant public factory = MockUniswapV3Factory(0x1F98431c8aD98523631AE4a59f267346ea31F984);
+
+  uint public totalSupply;
+  mapping(uint => Position) private _positions;
+
+
+  function positions(uint tokenId) external view returns (
+    uint96 nonce,
+    address operator,
+    address token0,
+    address token1,
+    uint24 fee,
+    int24 tickLower,
+    int24 tickUpper,
+    uint128 liquidity,
+    uint feeGrowthInside0LastX128,
+    uint feeGrowthInside1LastX128,
+    uint128 tokensOwed0,
+    uint128 tokensOwed1
+  ) {
+    Position storage p = _positions[tokenId];
+    require(p.pool != address(0), "Invalid token ID");
+    token0 = MockUniswapV3Pool(p.pool).token0();
+    token1 = MockUniswapV3Pool(p.pool).token1();
+    fee = MockUniswapV3Pool(p.pool).fee();
+    tickLower = p.tickLower;
+    tickUpper = p.tickUpper;
+    liquidity = p.liquidity;
+    tokensOwed0 = p.tokensOwed0;
+    tokensOwed1 = p.tokensOwed1;
+  }
+
+
+  function ownerOf(uint tokenId) external view returns (address) {
+    return _positions[tokenId].owner;
+  }
+
+
+  function mint(INonfungiblePositionManager.MintParams calldata params) external payable returns (uint tokenId, uint128 liquidity, uint amount0, uint amount1) {
+    address pool = factory.getPool(params.token0, params.token1, params.fee);
+    require(pool != address(0) && params.token0 < params.token1, "Invalid pool");
+    tokenId = ++totalSupply;
+    _positions[tokenId] = Position(params.recipient, pool, params.tickLower, params.tickUpper, 0, 0, 0);
+    (liquidity, amount0, amount1) = addLiquidity(tokenId, params.amount0Desired, params.amount1Desired, params.amount0Min, params.amount1Min);
+  }
+
+
+  function increaseLiquidity(INonfungiblePositionManager.IncreaseLiquidityParams calldata params) external payable returns (uint128 liquidity, uint amount0, uint amount1) {
+    require(_positions[params.tokenId].pool != address(0), "Invalid token ID");
+    (liquidity, amount0, amount1) = addLiquidity(params.tokenId, params.amount0Desired, params.amount1Desired, params.amount0Min, params.amount1Min);
+  }
+
+
+  function decreaseLiquidity(INonfungiblePositionManager.DecreaseLiquidityParams calldata params) external payable returns (uint amount0, uint amount1) {
+    Position storage p = _positions[params.tokenId];
+    require(msg.sender == p.owner, "Not approved");
+    require(params.liquidity <= p.liquidity, "Not enough liquidity");
+    (amount0, amount1) = LiquidityAmounts.getAmountsForLiquidity(getSqrtPrice(p.pool), TickMath.getSqrtRatioAtTick(p.tickLower), TickMath.getSqrtRatioAtTick(p.tickUpper), params.liquidity);
+    require(amount0 >= params.amount0Min && amount1 >= params.amount1Min, "Price slippage check");
+    p.liquidity -= params.liquidity;
+    p.tokensOwed0 += uint128(amount0);
+    p.tokensOwed1 += uint128(amount1);
+  }
+
+
+  function collect(INonfungiblePositionManager.CollectParams calldata params) external payable returns (uint amount0, uint amount1) {
+    Position storage p = _positions[params.tokenId];
+    require(msg.sender == p.owner, "Not approved");
+    amount0 = params.amount0Max < p.tokensOwed0 ? params.amount0Max : p.tokensOwed0;
+    amount1 = params.amount1Max < p.tokensOwed1 ? params.amount1Max : p.tokensOwed1;
+    p.tokensOwed0 -= uint128(amount0);
+    p.tokensOwed1 -= uint128(amount1);
+    MockUniswapV3Pool pool = MockUniswapV3Pool(p.pool);
+    if (amount0 > 0) ERC20(pool.token0()).safeTransfer(params.recipient, amount0);
+    if (amount1 > 0) ERC20(pool.token1()).safeTransfer(params.recipient, amount1);
+  }
+
+
+  function burn(uint tokenId) external payable {
+    Position memory p = _positions[tokenId];
+    require(msg.sender == p.owner, "Not approved");
+    require(p.liquidity == 0 && p.tokensOwed0 == 0 && p.tokensOwed1 == 0, "Not cleared");
+    delete _positions[tokenId];
+  }
+
+
+  /// @notice Credit trading fees to a position, pulled from the caller
+  function addFees(uint tokenId, uint128 amount0, uint128 amount1) external {
+    Position storage p = _positions[tokenId];
+    MockUniswapV3Pool pool = MockUniswapV3Pool(p.pool);
+    if (amount0 > 0) ERC20(pool.token0()).safeTransferFrom(msg.sender, address(this), amount0);
+    if (amount1 > 0) ERC20(pool.token1()).safeTransferFrom(msg.sender, address(this), amount1);
+    p.tokensOwed0 += amount0;
+    p.tokensOwed1 += amount1;
+  }
+
+
+  /// @notice Add liquidity to a position at the pool price, pulling the tokens from the caller
+  function addLiquidity(uint tokenId, uint amount0Desired, uint amount1Desired, uint amount0Min, uint amount1Min) internal returns (uint128 liquidity, uint amount0, uint amount1) {
+    Position storage p = _positions[tokenId];
+    uint160 sqrtPriceX96 = getSqrtPrice(p.pool);
+    uint160 sqrtRatioAX96 = TickMath.getSqrtRatioAtTick(p.tickLower);
+    uint160 sqrtRatioBX96 = TickMath.getSqrtRatioAtTick(p.tickUpper);
+    liquidity = LiquidityAmounts.getLiquidityForAmounts(sqrtPriceX96, sqrtRatioAX96, sqrtRatioBX96, amount0Desired, amount1Desired);
+    require(liquidity > 0, "Zero liquidity");
+    (amount0, amount1) = LiquidityAmounts.getAmountsForLiquidity(sqrtPriceX96, sqrtRatioAX96, sqrtRatioBX96, liquidity);
+    require(amount0 >= amount0Min && amount1 >= amount1Min, "Price slippage check");
+    p.liquidity += liquidity;
+    MockUniswapV3Pool pool = MockUniswapV3Pool(p.pool);
+    if (amount0 > 0) ERC20(pool.token0()).safeTransferFrom(msg.sender, address(this), amount0);
+    if (amount1 > 0) ERC20(pool.token1()).safeTransferFrom(msg.sender, address(this), amount1);
+  }
+
+
+  function getSqrtPrice(address pool) internal view returns (uint160 sqrtPriceX96) {
+    (sqrtPriceX96,,,,,,) = MockUniswapV3Pool(pool).slot0();
+  }
+}
@@ -44,12 +44,12 @@ contract Test_OptionsPositionManager is OptionsPositionManager {
   }
   
   /// @notice test internal function swapTokensForExactTokens
-  function test_swapTokensForExactTokens(IUniswapV2Router01 ammRouter, uint recvAmount, uint maxAmount, address[] memory path) external {
-    swapTokensForExactTokens(ammRouter, recvAmount, maxAmount, path);
+  function test_swapTokensForExactTokens(IUniswapV2Router01 ammRouter, IPriceOracle oracle, uint recvAmount, uint maxAmount, address[] memory path) external {
+    swapTokensForExactTokens(ammRouter, oracle, recvAmount, maxAmount, path);
   }
   
-  /// @notice test internal function swapTokensForExactTokens
-  function test_getTargetAmountFromOracle(IPriceOracle oracle, address assetA, uint amountA, address assetB)  external view returns (uint){
-    return getTargetAmountFromOracle(oracle, assetA, amountA, assetB) ;
+  /// @notice test internal function getOracleAmount
+  function test_getOracleAmount(IPriceOracle oracle, address assetA, uint amountA, address assetB)  external view returns (uint){
+    return getOracleAmount(oracle, assetA, amountA, assetB) ;
   }
 }
\ No newline at end of file
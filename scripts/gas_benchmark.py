@@ -0,0 +1,125 @@
+# Gas benchmark of the contracts hot paths
+#
+# Tests record the gas used by entry points with the `gas` fixture (see tests/conftest.py), eg
+# gas.record("GeVault.deposit[ticks=6]", tx). At the end of the session the measures are compared with the JSON baseline
+# in tests/gas_baseline.json: entries more expensive than the baseline by more than the tolerance are regressions and
+# fail the run. Entries missing from the baseline are listed as new, and fail the run too with `--gas-strict`, so that a CI
+# without a committed baseline can't pass silently. `brownie test --gas-update` rewrites the baseline instead, it must run on
+# the mainnet fork block of the tests for the measures to be comparable.
+#
+# Two JSON reports, eg from two branches, can be compared with:
+#   python -m scripts.gas_benchmark base.json head.json --tolerance 0.02 --strict
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+DEFAULT_TOLERANCE = 0.02
+# intrinsic cost of a transaction, and of its calldata bytes since Istanbul
+TX_BASE_GAS = 21000
+CALLDATA_ZERO_GAS = 4
+CALLDATA_NONZERO_GAS = 16
+
+# status is one of "ok", "regression", "improvement", "new", "removed"
+GasDelta = namedtuple("GasDelta", ["entry", "baseline", "current", "delta", "status"])
+
+
+class GasReport:
+  '''Gas used per entry point, the last measure of an entry wins'''
+
+  def __init__(self):
+    self.entries = {}
+
+  def record(self, entry, tx):
+    '''Record a transaction, or a raw gas amount'''
+    gas = tx if isinstance(tx, int) else tx.gas_used
+    self.entries[entry] = gas
+    return gas
+
+  def __len__(self):
+    return len(self.entries)
+
+
+def intrinsic_gas(data):
+  '''Gas charged to a call before execution: base cost and calldata, as bytes or hex string'''
+  if isinstance(data, str): data = bytes.fromhex(data[2:] if data.startswith("0x") else data)
+  return TX_BASE_GAS + sum(CALLDATA_ZERO_GAS if b == 0 else CALLDATA_NONZERO_GAS for b in data)
+
+
+def execution_gas(tx):
+  '''Gas used by a call beyond its intrinsic cost, to compare a batched call with a loop of calls'''
+  return tx.gas_used - intrinsic_gas(tx.input)
+
+
+def load(path):
+  try:
+    with open(path) as f:
+      return {k: int(v) for k, v in json.load(f).items()}
+  except FileNotFoundError:
+    return {}
+
+
+def save(path, entries):
+  with open(path, "w") as f:
+    json.dump(dict(sorted(entries.items())), f, indent=2)
+    f.write("\n")
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+  '''Compare gas measures with a baseline, entries within the relative tolerance are "ok"'''
+  deltas = []
+  for entry in sorted(set(baseline) | set(current)):
+    base = baseline.get(entry)
+    gas = current.get(entry)
+    if base is None:
+      deltas.append(GasDelta(entry, None, gas, None, "new"))
+      continue
+    if gas is None:
+      deltas.append(GasDelta(entry, base, None, None, "removed"))
+      continue
+    delta = (gas - base) / base if base > 0 else 0.0
+    if delta > tolerance: status = "regression"
+    elif delta < -tolerance: status = "improvement"
+    else: status = "ok"
+    deltas.append(GasDelta(entry, base, gas, delta, status))
+  return deltas
+
+
+def regressions(deltas):
+  return [d for d in deltas if d.status == "regression"]
+
+
+def new_entries(deltas):
+  '''Entries measured but missing from the baseline: not checked until the baseline is updated'''
+  return [d for d in deltas if d.status == "new"]
+
+
+def format_deltas(deltas):
+  '''Table of the deltas, one line per entry point'''
+  width = max([len(d.entry) for d in deltas] + [len("entry")])
+  lines = [f"{'entry':<{width}} | {'baseline':>10} | {'current':>10} | {'delta':>8} | status"]
+  for d in deltas:
+    base = "-" if d.baseline is None else str(d.baseline)
+    gas = "-" if d.current is None else str(d.current)
+    delta = "-" if d.delta is None else f"{d.delta:+.2%}"
+    lines.append(f"{d.entry:<{width}} | {base:>10} | {gas:>10} | {delta:>8} | {d.status}")
+  return "\n".join(lines)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare two gas reports")
+  parser.add_argument("baseline")
+  parser.add_argument("current")
+  parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+  parser.add_argument("--strict", action="store_true", help="Fail on entries missing from the baseline")
+  args = parser.parse_args()
+
+  deltas = compare(load(args.baseline), load(args.current), args.tolerance)
+  print(format_deltas(deltas))
+  new = new_entries(deltas)
+  for d in new: print(f"new entry, not in the baseline: {d.entry}")
+  sys.exit(1 if regressions(deltas) or (args.strict and new) else 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,29 @@
+from collections import namedtuple
+
+# Field order of the GeVaultLens structs
+TICK_FIELDS = ["tick", "aToken", "balance", "amount0", "amount1", "aTokenSupply", "debt"]
+VAULT_FIELDS = ["vault", "tvl", "amount0", "amount1", "totalSupply", "latestAnswer", "activeTickIndex", "lastTickIndex", "poolMatchesOracle", "ticks"]
+
+TickData = namedtuple("TickData", TICK_FIELDS)
+VaultData = namedtuple("VaultData", VAULT_FIELDS)
+
+
+def decode_tick_data(raw):
+  return TickData(*raw)
+
+
+def decode_vault_data(raw):
+  fields = list(raw)
+  fields[-1] = [decode_tick_data(t) for t in fields[-1]]
+  return VaultData(*fields)
+
+
+# Decode the tuples returned by GeVaultLens.getVaultsData
+def decode_vaults_data(raw):
+  return [decode_vault_data(v) for v in raw]
+
+
+# Read the state of all vaults in a single call, keyed by vault address
+def get_vaults_data(lens, vaults):
+  data = decode_vaults_data(lens.getVaultsData([str(v) for v in vaults]))
+  return {v.vault: v for v in data}
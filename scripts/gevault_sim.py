@@ -0,0 +1,290 @@
+# Off-chain simulator of a GeVault over a price path
+#
+# Mirrors GeVault.deployAssets, getActiveTickIndex, needsRebalance and getAdjustedBaseFee, and the fee accrual of the
+# underlying TokenisableRanges, to size liquidityPerTick, fullRangeShare and baseFeeX4 without a mainnet fork.
+# Amounts are floats in base token (eg ETH) and quote token (eg USDC) units, prices are quote per base.
+#
+# Positions are static between two rebalances, so each segment is valued with NumPy over all its steps at once, and the
+# only Python loop is over rebalances. Swap volume is the volume implied by the price path (the minimum volume moving
+# the price through each position), scaled by volume_multiplier.
+#
+# Not modelled: borrowing of the ticks in the lending pool, incremental and light rebalancing, idle drift (idle assets
+# only change when the active tick moves, which always triggers a rebalance).
+import argparse
+import csv
+from collections import namedtuple
+
+import numpy as np
+
+# Tick prices of the deployed vaults, see scripts/deploy_arbitrum.py
+VaultLayout = namedtuple("VaultLayout", ["name", "ticks", "fee_tier"])
+LAYOUTS = {
+  "ETH": VaultLayout("ETH-USDC", [1000 + 100 * k for k in range(16)], 500),
+  "GMX": VaultLayout("GMX-USDC", [20 + 5 * k for k in range(20)], 500),
+  "ARB": VaultLayout("ARB-USDC", [round(0.5 + 0.1 * k, 1) for k in range(16)], 500),
+  "BTC": VaultLayout("BTC-USDC", [20000 + 1000 * k for k in range(21)], 500),
+}
+
+# Vault settings, same names and units as in GeVault
+# rebalance_mode: "tick" rebalances when the active tick moves, "needed" also when the full range drifts, as rebalanceIfNeeded
+VaultParams = namedtuple(
+  "VaultParams",
+  ["liquidity_per_tick", "full_range_share", "base_fee_x4", "full_range_threshold_x4", "rebalance_mode",
+   "tick_width", "treasury_fee", "volume_multiplier", "gas_price_gwei"],
+  defaults=[3, 20, 20, 200, "tick", 1.0001, 20, 1.0, 0.1]
+)
+
+# Estimated gas of the steps of a full rebalance cycle, calibrate with the gas tests of tests/test_GeVault.py
+GAS = {
+  "rebalance": 80000,
+  "scan_tick": 7000,
+  "withdraw_tick": 180000,
+  "deposit_tick": 280000,
+  "withdraw_full_range": 150000,
+  "deposit_full_range": 220000,
+}
+
+SimResult = namedtuple(
+  "SimResult",
+  ["layout", "tvl", "base_value", "hodl", "fees_base", "fees_quote", "fees_value", "treasury_value", "rebalances", "rebalance_steps",
+   "gas", "gas_cost_native"]
+)
+
+
+def load_prices(path, column="price"):
+  """Load a price path from a CSV or Parquet file, return the prices as a float array"""
+  if str(path).endswith(".parquet"):
+    import pandas as pd
+    return pd.read_parquet(path, columns=[column])[column].to_numpy(dtype=float)
+  with open(path, newline="") as f:
+    return np.array([float(row[column]) for row in csv.DictReader(f)])
+
+
+def get_active_tick_index(ticks, prices):
+  """Vectorised getActiveTickIndex: index of the first tick at or above each price, len(ticks) if all are below"""
+  return np.searchsorted(np.asarray(ticks, dtype=float), prices, side="left")
+
+
+def adjusted_base_fee(base_fee_x4, value0, value1, increase_token0):
+  """Same as GeVault.getAdjustedBaseFee: linear in the reserves imbalance, from baseFeeX4 / 2 to baseFeeX4 * 3 / 2"""
+  if increase_token0: fee = base_fee_x4 * value0 // (value1 + 1)
+  else: fee = base_fee_x4 * value1 // (value0 + 1)
+  return min(max(fee, base_fee_x4 // 2), base_fee_x4 * 3 // 2)
+
+
+def position_amounts(liquidity, sqrt_lower, sqrt_upper, sqrt_prices):
+  """Base and quote amounts of a position, the price is clamped into the range"""
+  c = np.clip(sqrt_prices, sqrt_lower, sqrt_upper)
+  return liquidity * (1 / c - 1 / sqrt_upper), liquidity * (c - sqrt_lower)
+
+
+def position_fees(liquidity, sqrt_lower, sqrt_upper, sqrt_prices, fee_rate):
+  """Fees earned at each step by a position: swaps moving the price up pay in quote, and down pay in base"""
+  c = np.clip(sqrt_prices, sqrt_lower, sqrt_upper)
+  dc = np.diff(c)
+  fees_quote = np.where(dc > 0, liquidity * dc, 0) * fee_rate
+  fees_base = np.where(dc < 0, liquidity * (1 / c[1:] - 1 / c[:-1]), 0) * fee_rate
+  return fees_base, fees_quote
+
+
+class Vault:
+  """State of a simulated vault: idle assets and positions, each position being [liquidity, sqrt lower, sqrt upper]"""
+
+  def __init__(self, layout, params):
+    self.params = params
+    self.ticks = np.asarray(layout.ticks, dtype=float)
+    self.fee_rate = layout.fee_tier / 1e6 * params.volume_multiplier
+    self.base = 0.
+    self.quote = 0.
+    self.positions = []
+    self.tick_index = 0
+    self.treasury_value = 0.
+
+  def remove_from_all_ranges(self, sqrt_price):
+    for liquidity, sqrt_lower, sqrt_upper in self.positions:
+      base, quote = position_amounts(liquidity, sqrt_lower, sqrt_upper, sqrt_price)
+      self.base += base
+      self.quote += quote
+    withdrawn = len(self.positions)
+    self.positions = []
+    return withdrawn
+
+  def deposit_in_tick(self, index, sqrt_price, amount, is_base):
+    sqrt_lower = np.sqrt(self.ticks[index])
+    sqrt_upper = np.sqrt(self.ticks[index] * self.params.tick_width)
+    # a single token deposit in a range holding both tokens fails and the assets stay idle, as in depositAndStash
+    if is_base and sqrt_price <= sqrt_lower: liquidity = amount / (1 / sqrt_lower - 1 / sqrt_upper)
+    elif not is_base and sqrt_price >= sqrt_upper: liquidity = amount / (sqrt_upper - sqrt_lower)
+    else: return 0
+    self.positions.append([liquidity, sqrt_lower, sqrt_upper])
+    if is_base: self.base -= amount
+    else: self.quote -= amount
+    return 1
+
+  def deploy_assets(self, price):
+    """Same allocation as GeVault.deployAssets"""
+    sqrt_price = np.sqrt(price)
+    share = self.params.full_range_share / 100
+    # full range deposit takes both tokens at the pool ratio, limited by the scarcer one
+    liquidity = min(self.base * share * sqrt_price, self.quote * share / sqrt_price)
+    deposited = 0
+    if liquidity > 0:
+      self.positions.append([liquidity, 0., np.inf])
+      self.base -= liquidity / sqrt_price
+      self.quote -= liquidity * sqrt_price
+      deposited += 1
+
+    index = int(get_active_tick_index(self.ticks, price))
+    base_amount = self.base / self.params.liquidity_per_tick
+    quote_amount = self.quote / self.params.liquidity_per_tick
+    ticks_deposited = 0
+    # ticks below price only hold quote token and ticks above only hold base token
+    for k in [index - 2, index - 1]:
+      if k >= 0: ticks_deposited += self.deposit_in_tick(k, sqrt_price, quote_amount, False)
+    for k in [index, index + 1]:
+      if k < len(self.ticks): ticks_deposited += self.deposit_in_tick(k, sqrt_price, base_amount, True)
+    self.tick_index = index
+    return deposited, ticks_deposited
+
+  def rebalance(self, price):
+    """Full rebalance cycle, returns its estimated gas"""
+    had_full_range = any(np.isinf(p[2]) for p in self.positions)
+    withdrawn = self.remove_from_all_ranges(np.sqrt(price))
+    full_range, ticks = self.deploy_assets(price)
+    return (
+      GAS["rebalance"] + GAS["scan_tick"] * len(self.ticks)
+      + GAS["withdraw_full_range"] * had_full_range + GAS["withdraw_tick"] * (withdrawn - had_full_range)
+      + GAS["deposit_full_range"] * full_range + GAS["deposit_tick"] * ticks
+    )
+
+  def value_segment(self, sqrt_prices):
+    """Value the vault over a segment with static positions
+    Returns the base and quote holdings at each step, the full range value and the fees accrued until each step"""
+    prices = sqrt_prices ** 2
+    base = np.full(len(sqrt_prices), self.base)
+    quote = np.full(len(sqrt_prices), self.quote)
+    full_range_value = np.zeros(len(sqrt_prices))
+    fees_base = np.zeros(len(sqrt_prices))
+    fees_quote = np.zeros(len(sqrt_prices))
+    for liquidity, sqrt_lower, sqrt_upper in self.positions:
+      b, q = position_amounts(liquidity, sqrt_lower, sqrt_upper, sqrt_prices)
+      base += b
+      quote += q
+      if np.isinf(sqrt_upper): full_range_value = b * prices + q
+      fb, fq = position_fees(liquidity, sqrt_lower, sqrt_upper, sqrt_prices, self.fee_rate)
+      fees_base[1:] += np.cumsum(fb)
+      fees_quote[1:] += np.cumsum(fq)
+    return base, quote, full_range_value, fees_base, fees_quote
+
+  def full_range_drifted(self, prices, base, quote, full_range_value):
+    """Vectorised full range check of needsRebalance"""
+    value0 = base * prices
+    target = 2 * np.minimum(value0, quote) * self.params.full_range_share / 100
+    return np.abs(full_range_value - target) * 1e4 > self.params.full_range_threshold_x4 * (value0 + quote)
+
+
+def simulate(prices, layout, params=VaultParams(), tvl=1e6):
+  """Replay a price path in a vault initially holding tvl in quote value, half in each token"""
+  prices = np.asarray(prices, dtype=float)
+  sqrt_prices = np.sqrt(prices)
+  n = len(prices)
+  vault = Vault(layout, params)
+  vault.base = tvl / 2 / prices[0]
+  vault.quote = tvl / 2
+  hodl = vault.base * prices + vault.quote
+  vault.deploy_assets(prices[0])
+
+  # the active tick only changes at these steps, so they are the tick rebalances
+  tick_events = np.flatnonzero(np.diff(get_active_tick_index(vault.ticks, prices))) + 1
+
+  tvl_path = np.zeros(n)
+  base_value_path = np.zeros(n)
+  treasury_share = params.treasury_fee / 100
+  total_fees_base = total_fees_quote = 0.
+  rebalance_steps = []
+  gas = 0
+  start = 0
+  while True:
+    k = np.searchsorted(tick_events, start, side="right")
+    is_rebalance = k < len(tick_events)
+    end = int(tick_events[k]) if is_rebalance else n - 1
+    base, quote, full_range_value, fees_base, fees_quote = vault.value_segment(sqrt_prices[start:end + 1])
+    if params.rebalance_mode == "needed":
+      drifted = vault.full_range_drifted(prices[start:end + 1], base, quote, full_range_value)
+      drifted[0] = False
+      if drifted.any():
+        is_rebalance = True
+        end = start + int(np.argmax(drifted))
+        base, quote, fees_base, fees_quote = (a[:end - start + 1] for a in [base, quote, fees_base, fees_quote])
+
+    # ticks pay their treasury fee when collecting fees, the rest goes back to the vault on rebalance
+    vault.treasury_value += (fees_base[-1] * prices[end] + fees_quote[-1]) * treasury_share
+    fees_base *= 1 - treasury_share
+    fees_quote *= 1 - treasury_share
+    base_value_path[start:end + 1] = (base + fees_base) * prices[start:end + 1]
+    tvl_path[start:end + 1] = base_value_path[start:end + 1] + quote + fees_quote
+    total_fees_base += fees_base[-1]
+    total_fees_quote += fees_quote[-1]
+    if not is_rebalance: break
+
+    vault.base += fees_base[-1]
+    vault.quote += fees_quote[-1]
+    gas += vault.rebalance(prices[end])
+    rebalance_steps.append(end)
+    start = end
+
+  return SimResult(
+    layout=layout.name,
+    tvl=tvl_path,
+    base_value=base_value_path,
+    hodl=hodl,
+    fees_base=total_fees_base,
+    fees_quote=total_fees_quote,
+    fees_value=total_fees_base * prices[-1] + total_fees_quote,
+    treasury_value=vault.treasury_value,
+    rebalances=len(rebalance_steps),
+    rebalance_steps=np.array(rebalance_steps, dtype=int),
+    gas=gas,
+    gas_cost_native=gas * params.gas_price_gwei * 1e-9,
+  )
+
+
+def deposit_fee(result, params, step, amount, is_base):
+  """Fee paid in token for a deposit at a step of a simulation, as getDepositLiquidity
+  Base token is token0 in all deployed vaults, so depositing base increases token0"""
+  value0 = int(result.base_value[step])
+  value1 = int(result.tvl[step]) - value0
+  return amount * adjusted_base_fee(params.base_fee_x4, value0, value1, is_base) / 1e4
+
+
+def summary(result):
+  return {
+    "layout": result.layout,
+    "final_tvl": float(result.tvl[-1]),
+    "hodl": float(result.hodl[-1]),
+    "fees_value": float(result.fees_value),
+    "treasury_value": float(result.treasury_value),
+    "rebalances": result.rebalances,
+    "gas": int(result.gas),
+    "gas_cost_native": float(result.gas_cost_native),
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Replay a price path in GeVault layouts")
+  parser.add_argument("path", help="CSV or Parquet price file")
+  parser.add_argument("--column", default="price")
+  parser.add_argument("--layout", action="append", choices=list(LAYOUTS), help="defaults to all layouts")
+  parser.add_argument("--tvl", type=float, default=1e6)
+  for field, default in VaultParams._field_defaults.items():
+    parser.add_argument("--" + field.replace("_", "-"), type=type(default), default=default)
+  args = parser.parse_args()
+
+  prices = load_prices(args.path, args.column)
+  params = VaultParams(**{f: getattr(args, f) for f in VaultParams._fields})
+  for name in args.layout or LAYOUTS:
+    print(summary(simulate(prices, LAYOUTS[name], params, args.tvl)))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,198 @@
+# Bit-exact port of contracts/lib/FullMath.sol, TickMath.sol and LiquidityAmounts.sol
+#
+# Every function accepts Python ints, or NumPy arrays for vectorised use. Integer arrays are converted to object
+# arrays of Python ints so that 256-bit intermediate values never wrap. Inputs that would revert on-chain raise a
+# ValueError, with the error of the Solidity library when it has one.
+#
+# The goal is exact off-chain valuation, equal to the chain to the unit, for tests and scripts: not raw throughput.
+# Object arrays run the Python int arithmetic element by element, vectorised calls only save the interpreter loop.
+# `python -m scripts.uniswap_math` measures the throughput; on one core (Python 3.11, NumPy 2.4) it is 0.15-0.37M
+# positions/s per function, 6-9x a scalar loop. Millions of positions per second would need fixed width (uint64 limbs)
+# arithmetic, with a multi-limb division for mulDiv, which isn't implemented.
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+Q96 = 2 ** 96
+RESOLUTION = 96
+UINT128_MAX = 2 ** 128 - 1
+UINT256_MAX = 2 ** 256 - 1
+
+MIN_TICK = -887272
+MAX_TICK = -MIN_TICK
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+# Multipliers of getSqrtRatioAtTick, indexed by tick bit
+TICK_RATIOS = [
+  0xfff97272373d413259a46990580e213a, 0xfff2e50f5f656932ef12357cf3c7fdcc, 0xffe5caca7e10e4e61c3624eaa0941cd0,
+  0xffcb9843d60f6159c9db58835c926644, 0xff973b41fa98c081472e6896dfb254c0, 0xff2ea16466c96a3843ec78b326b52861,
+  0xfe5dee046a99a2a811c461f1969c3053, 0xfcbe86c7900a88aedcffc83b479aa3a4, 0xf987a7253ac413176f2b074cf7815e54,
+  0xf3392b0822b70005940c7a398e4b70f3, 0xe7159475a2c29b7443b29c7fa6e889d9, 0xd097f3bdfd2022b8845ad8f792aa5825,
+  0xa9f746462d870fdf8a65dc1f90e061e5, 0x70d869a156d2a1b890bb3df62baf32f7, 0x31be135f97d08fd981231505542fcfa6,
+  0x9aa508b5b7a84e1c677de54f3e99bc9, 0x5d6af8dedb81196699c329225ee604, 0x2216e584f5fa1ea926041bedfe98,
+  0x48a170391f7dc42444e8fa2,
+]
+
+
+def _is_array(*values):
+  return np is not None and any(isinstance(v, np.ndarray) for v in values)
+
+
+# Convert arrays and lists to object arrays of Python ints, leave scalars untouched
+def _to_int(x):
+  if np is not None and isinstance(x, (np.ndarray, list, tuple)):
+    return np.array([int(v) for v in np.ravel(x)], dtype=object).reshape(np.shape(x))
+  return int(x)
+
+
+def _where(cond, a, b):
+  if _is_array(cond, a, b): return np.where(cond, np.asarray(a, dtype=object), np.asarray(b, dtype=object))
+  return a if cond else b
+
+
+def _require(cond, error="revert"):
+  if not (cond.all() if _is_array(cond) else cond): raise ValueError(error)
+
+
+# Swap a and b where a > b
+def _sort(a, b):
+  return _where(a > b, b, a), _where(a > b, a, b)
+
+
+def mul_div(a, b, denominator):
+  a, b, denominator = _to_int(a), _to_int(b), _to_int(denominator)
+  _require(denominator > 0)
+  result = a * b // denominator
+  _require(result <= UINT256_MAX)
+  return result
+
+
+def mul_div_rounding_up(a, b, denominator):
+  result = mul_div(a, b, denominator)
+  remainder = _to_int(a) * _to_int(b) % _to_int(denominator)
+  _require(_where(remainder > 0, result < UINT256_MAX, True))
+  return result + _where(remainder > 0, 1, 0)
+
+
+def get_sqrt_ratio_at_tick(tick):
+  tick = _to_int(tick)
+  abs_tick = _where(tick < 0, -tick, tick)
+  _require(abs_tick <= MAX_TICK, "T")
+  ratio = _where(abs_tick & 0x1 != 0, 0xfffcb933bd6fad37aa2d162d1a594001, 0x100000000000000000000000000000000)
+  for k, multiplier in enumerate(TICK_RATIOS):
+    ratio = _where(abs_tick & (2 << k) != 0, ratio * multiplier >> 128, ratio)
+  ratio = _where(tick > 0, UINT256_MAX // _where(tick > 0, ratio, 1), ratio)
+  # divide by 1<<32 rounding up to go from a Q128.128 to a Q128.96
+  return (ratio >> 32) + _where(ratio % (1 << 32) == 0, 0, 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96):
+  sqrt_price_x96 = _to_int(sqrt_price_x96)
+  _require((sqrt_price_x96 >= MIN_SQRT_RATIO) & (sqrt_price_x96 < MAX_SQRT_RATIO), "R")
+  ratio = sqrt_price_x96 << 32
+
+  # most significant bit, same steps as the assembly blocks
+  r = ratio
+  msb = 0
+  for shift in [7, 6, 5, 4, 3, 2, 1]:
+    f = _where(r > (1 << (1 << shift)) - 1, 1 << shift, 0)
+    msb = msb | f
+    r = r >> f
+  msb = msb | _where(r > 0x1, 1, 0)
+
+  r = _where(msb >= 128, ratio >> _where(msb >= 128, msb - 127, 0), ratio << _where(msb >= 128, 0, 127 - msb))
+  log_2 = (msb - 128) << 64
+  for shift in range(63, 49, -1):
+    r = (r * r) >> 127
+    f = r >> 128
+    log_2 = log_2 | (f << shift)
+    r = r >> f
+
+  log_sqrt10001 = log_2 * 255738958999603826347141 # 128.128 number
+  tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+  tick_hi = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+  return _where(tick_low == tick_hi, tick_low, _where(get_sqrt_ratio_at_tick(tick_hi) <= sqrt_price_x96, tick_hi, tick_low))
+
+
+def _to_uint128(x):
+  _require(x <= UINT128_MAX)
+  return x
+
+
+def get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0):
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  intermediate = mul_div(sqrt_ratio_a_x96, sqrt_ratio_b_x96, Q96)
+  return _to_uint128(mul_div(amount0, intermediate, sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1):
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  return _to_uint128(mul_div(amount1, Q96, sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amounts(sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0, amount1):
+  sqrt_ratio_x96, amount0, amount1 = _to_int(sqrt_ratio_x96), _to_int(amount0), _to_int(amount1)
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  # clamp the current price into the range, the unused side is computed on the full range with a zero amount
+  below = sqrt_ratio_x96 < sqrt_ratio_a_x96
+  above = sqrt_ratio_x96 >= sqrt_ratio_b_x96
+  price0 = _where(below, sqrt_ratio_a_x96, sqrt_ratio_x96)
+  price1 = _where(above, sqrt_ratio_b_x96, sqrt_ratio_x96)
+  liquidity0 = get_liquidity_for_amount0(_where(above, sqrt_ratio_a_x96, price0), sqrt_ratio_b_x96, _where(above, 0, amount0))
+  liquidity1 = get_liquidity_for_amount1(sqrt_ratio_a_x96, _where(below, sqrt_ratio_b_x96, price1), _where(below, 0, amount1))
+  return _where(below, liquidity0, _where(above, liquidity1, _where(liquidity0 < liquidity1, liquidity0, liquidity1)))
+
+
+def get_amount0_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity):
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  return mul_div(_to_int(liquidity) << RESOLUTION, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+
+def get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity):
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  return mul_div(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+
+
+def get_amounts_for_liquidity(sqrt_ratio_x96, sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity):
+  sqrt_ratio_x96 = _to_int(sqrt_ratio_x96)
+  sqrt_ratio_a_x96, sqrt_ratio_b_x96 = _sort(_to_int(sqrt_ratio_a_x96), _to_int(sqrt_ratio_b_x96))
+  # below the range the position is all token0 and above all token1, which is the same as clamping the price
+  price = _where(sqrt_ratio_x96 < sqrt_ratio_a_x96, sqrt_ratio_a_x96, _where(sqrt_ratio_x96 < sqrt_ratio_b_x96, sqrt_ratio_x96, sqrt_ratio_b_x96))
+  amount0 = get_amount0_for_liquidity(price, sqrt_ratio_b_x96, liquidity)
+  amount1 = get_amount1_for_liquidity(sqrt_ratio_a_x96, price, liquidity)
+  return amount0, amount1
+
+
+def benchmark(count=100000, seed=0):
+  '''Positions valued per second by the vectorised functions, on random ticks around the current price'''
+  import random
+  import time
+  random.seed(seed)
+  ticks = np.array([random.randint(-50000, 50000) for _ in range(count)], dtype=np.int64)
+  liquidities = np.array([random.randint(1, 2**63) for _ in range(count)], dtype=np.uint64)
+  results = {}
+  start = time.perf_counter()
+  prices = get_sqrt_ratio_at_tick(ticks)
+  results["get_sqrt_ratio_at_tick"] = count / (time.perf_counter() - start)
+  lower, upper = prices - prices // 100, prices + prices // 100
+  start = time.perf_counter()
+  amounts0, amounts1 = get_amounts_for_liquidity(prices, lower, upper, liquidities)
+  results["get_amounts_for_liquidity"] = count / (time.perf_counter() - start)
+  start = time.perf_counter()
+  get_liquidity_for_amounts(prices, lower, upper, amounts0, amounts1)
+  results["get_liquidity_for_amounts"] = count / (time.perf_counter() - start)
+  return results
+
+
+def main():
+  import argparse
+  parser = argparse.ArgumentParser(description="Throughput of the vectorised Uniswap math")
+  parser.add_argument("--count", type=int, default=100000)
+  args = parser.parse_args()
+  for name, rate in benchmark(args.count).items(): print(f"{name:<28} {rate:>12,.0f} positions/s")
+
+
+if __name__ == "__main__":
+  main()
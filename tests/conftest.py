@@ -1,5 +1,9 @@
+import math
+import os
+from collections import namedtuple
 import pytest
 from brownie import config, accounts, Contract, chain
+from scripts import gas_benchmark
 
 @pytest.fixture(scope='session', autouse=True)
 def user(accounts):
@@ -24,3 +28,187 @@ def timelock(accounts):
 def user2(accounts):
   user2 = accounts.add(private_key="0x416b8a7d9290502f5661da81f0cf43893e3d19cb9aea3c426cfb36e8186e9c09")
   yield user2
+
+
+World = namedtuple("World", "trImplementation trBeacon snapshot")
+
+
+class WorldSnapshot:
+  '''Snapshot of the session world. chain.snapshot() holds a single snapshot, that fn_isolation takes again for each test,
+  so the world snapshot is taken with the node's evm_snapshot and brownie is synced after each revert'''
+
+  def __init__(self):
+    self.id = self.rpc("evm_snapshot")
+
+  def rpc(self, method, *params):
+    from brownie import web3
+    result = web3.provider.make_request(method, list(params))
+    if "error" in result: raise RuntimeError(f"{method} failed: {result['error']}")
+    return result["result"]
+
+  def revert(self):
+    # the node drops a snapshot once reverted to
+    self.rpc("evm_revert", self.id)
+    self.id = self.rpc("evm_snapshot")
+    # brownie drops the contracts and transactions of the reverted blocks on revert
+    chain.snapshot()
+    chain.revert()
+
+
+# Common world, built once per session. Only deployments identical across modules belong here: TokenisableRange ticks
+# differ per module (pair, ranges, amounts).
+@pytest.fixture(scope='session', autouse=True)
+def world(request, owner, Strings, TickMath, TokenisableRange, UpgradeableBeacon):
+  Strings.deploy({"from": owner})
+  TickMath.deploy({"from": owner})
+  tr = TokenisableRange.deploy({"from": owner})
+  trb = UpgradeableBeacon.deploy(tr, {"from": owner})
+  if request.config.getoption("--mocks"): request.getfixturevalue("mock_stack")
+  yield World(tr, trb, WorldSnapshot())
+
+
+# Overrides brownie's module_isolation, that resets the chain to the fork block: modules start from the world snapshot
+# instead of redeploying it. fn_isolation builds on this fixture, and still reverts each test to the module state.
+@pytest.fixture(scope='module', autouse=True)
+def module_isolation(world):
+  world.snapshot.revert()
+  yield
+  world.snapshot.revert()
+
+
+# Lending pool reserve parameters for TokenisableRange assets
+THETA_A = "0x78b787C1533Acfb84b8C76B7e5CFdfe80231Ea2D" # matic "0xb54240e3F2180A0E14CE405A089f600dc2D8457c"
+THETA_STABLE_DEBT = "0x8B6Ab2f071b27AC1eEbFfA973D957A767b15b2DB" # matic "0x92ED25161bb90eb0026e579b60B8D96eE3b7A15F"
+THETA_VARIABLE_DEBT = "0xB19Dd5DAD35af36CF2D80D1A9060f1949b11fCb0" # matic "0x51b89b9e24bc85d6756571032B8bf5660Bf6FbE5"
+THETA_100BPS_FIXED = "0xfAdB757A7BC3031285417d7114EFD58598E21d79" # "0xEdFbbeDdc3CB3271fd60E90E184B151C76Cd88aB"
+NULL = "0x0000000000000000000000000000000000000000"
+# reserves per batchInitReserve call, each reserve deploys 3 token proxies
+RESERVES_PER_BATCH = 8
+
+@pytest.fixture(scope='session')
+def init_reserves(owner, TokenisableRange):
+  def init(config, addresses, sender):
+    reserves = []
+    for i in addresses:
+      sym = TokenisableRange.at(i).symbol()
+      name = TokenisableRange.at(i).name()
+      reserves.append( [THETA_A, THETA_STABLE_DEBT, THETA_VARIABLE_DEBT, 18, THETA_100BPS_FIXED, i, owner.address, NULL, sym, "Roe " + name, "roe"+sym, "Roe variable debt bearing " + name, "vd"+sym, "Roe stable debt bearing " + name, "sd" + sym, ""] )
+    for k in range(0, len(reserves), RESERVES_PER_BATCH):
+      config.batchInitReserve(reserves[k:k+RESERVES_PER_BATCH], {"from": sender})
+  yield init
+
+
+# Local mock stack: run with `brownie test --mocks` on a development network, without a mainnet fork.
+# The mock stack only backs test_Mocks.py and the pure python tests: the fork modules build their own world out of
+# mainnet state (whales, lending pool configurator, timelock), so any test that loads mainnet contracts through `interface`
+# is skipped in that mode. Tests using the mock stack are skipped otherwise, since it overwrites the canonical Uniswap addresses.
+V3_FACTORY = "0x1F98431c8aD98523631AE4a59f267346ea31F984"
+POS_MGR = "0xC36442b4a4522E871399CD717aBDD847Ab11FE88"
+MOCK_TREASURY = "0x50101017adf9D2d06C395471Bc3D6348589c3b97"
+MOCK_ETH_PRICE = 1262
+
+
+def pytest_addoption(parser):
+  parser.addoption("--mocks", action="store_true", default=False, help="Run against local mocks instead of a mainnet fork")
+  parser.addoption("--gas-update", action="store_true", default=False, help="Write the measured gas to the baseline")
+  parser.addoption("--gas-strict", action="store_true", default=False, help="Fail on gas entries missing from the baseline")
+  parser.addoption("--gas-tolerance", type=float, default=gas_benchmark.DEFAULT_TOLERANCE, help="Relative gas increase allowed over the baseline")
+  parser.addoption("--gas-report", default=None, help="Also write the measured gas to this JSON file")
+
+
+def pytest_collection_modifyitems(config, items):
+  use_mocks = config.getoption("--mocks")
+  skip_fork = pytest.mark.skip(reason="needs mainnet fork state, not covered by the mock stack, remove --mocks to run")
+  skip_mocks = pytest.mark.skip(reason="needs the mock stack, run with --mocks")
+  for item in items:
+    fixtures = getattr(item, "fixturenames", ())
+    uses_mocks = "mock_stack" in fixtures
+    if use_mocks and "interface" in fixtures: item.add_marker(skip_fork)
+    elif not use_mocks and uses_mocks: item.add_marker(skip_mocks)
+
+
+def set_code(address, code):
+  '''Install runtime code at an address, with whichever RPC method the local node supports'''
+  from brownie import web3
+  for method in ("evm_setAccountCode", "anvil_setCode", "hardhat_setCode"):
+    result = web3.provider.make_request(method, [address, code])
+    if "error" not in result: return
+  raise RuntimeError("Local node doesn't support setting account code")
+
+
+MockStack = namedtuple("MockStack", "usdc weth factory pool posManager oracle addressesProvider lendingPool roerouter")
+
+@pytest.fixture(scope="session")
+def mock_stack(accounts, web3, MockERC20, MockWETH, MockUniswapV3Factory, MockUniswapV3Pool, MockNonfungiblePositionManager, MockOracle, MockAddressesProvider, MockLendingPool, RoeRouter):
+  owner = accounts[0]
+  # TokenisableRange expects USDC as token0, like on mainnet
+  weth = MockWETH.deploy({"from": owner})
+  usdc = MockERC20.deploy("USD Coin", "USDC", 6, {"from": owner})
+  while int(usdc.address, 16) > int(weth.address, 16):
+    usdc = MockERC20.deploy("USD Coin", "USDC", 6, {"from": owner})
+
+  # TokenisableRange uses hardcoded Uniswap addresses
+  set_code(V3_FACTORY, web3.eth.get_code(MockUniswapV3Factory.deploy({"from": owner}).address).hex())
+  set_code(POS_MGR, web3.eth.get_code(MockNonfungiblePositionManager.deploy({"from": owner}).address).hex())
+  factory = MockUniswapV3Factory.at(V3_FACTORY)
+  posManager = MockNonfungiblePositionManager.at(POS_MGR)
+  factory.createPool(usdc, weth, 500, {"from": owner})
+  pool = MockUniswapV3Pool.at(factory.getPool(usdc, weth, 500))
+  pool.initialize(math.isqrt(10**12 * 2**192 // MOCK_ETH_PRICE), {"from": owner})
+  # reserves so that positions can be withdrawn after the price moves
+  usdc.mint(posManager, 10**18, {"from": owner})
+  weth.mint(posManager, 10**27, {"from": owner})
+
+  oracle = MockOracle.deploy({"from": owner})
+  oracle.setAssetPrice(weth, MOCK_ETH_PRICE * 10**8, {"from": owner})
+  oracle.setAssetPrice(usdc, 10**8, {"from": owner})
+  addressesProvider = MockAddressesProvider.deploy({"from": owner})
+  lendingPool = MockLendingPool.deploy(addressesProvider, {"from": owner})
+  addressesProvider.setLendingPoolImpl(lendingPool, {"from": owner})
+  addressesProvider.setPriceOracle(oracle, {"from": owner})
+  lendingPool.initReserve(usdc, {"from": owner})
+  lendingPool.initReserve(weth, {"from": owner})
+
+  roerouter = RoeRouter.deploy(MOCK_TREASURY, {"from": owner})
+  # no AMMv2 router in the mock stack, but the pool record requires one
+  roerouter.addPool(addressesProvider, usdc, weth, MOCK_TREASURY, {"from": owner})
+  yield MockStack(usdc, weth, factory, pool, posManager, oracle, addressesProvider, lendingPool, roerouter)
+
+
+# Gas benchmark: tests record entry points gas with the `gas` fixture, compared with the baseline at the end of the session
+GAS_BASELINE = os.path.join(os.path.dirname(__file__), "gas_baseline.json")
+GAS_REPORT = gas_benchmark.GasReport()
+
+
+@pytest.fixture(scope="session")
+def gas():
+  yield GAS_REPORT
+
+
+def pytest_sessionfinish(session, exitstatus):
+  if len(GAS_REPORT) == 0: return
+  options = session.config.option
+  if options.gas_report: gas_benchmark.save(options.gas_report, GAS_REPORT.entries)
+  if options.gas_update:
+    # keep entries of benchmarks that didn't run
+    gas_benchmark.save(GAS_BASELINE, {**gas_benchmark.load(GAS_BASELINE), **GAS_REPORT.entries})
+    return
+  # benchmarks that didn't run in a partial session aren't reported as removed, entries missing from the baseline are reported as new
+  baseline = {k: v for k, v in gas_benchmark.load(GAS_BASELINE).items() if k in GAS_REPORT.entries}
+  session.config._gas_deltas = gas_benchmark.compare(baseline, GAS_REPORT.entries, options.gas_tolerance)
+  failed = gas_benchmark.regressions(session.config._gas_deltas) or (options.gas_strict and gas_benchmark.new_entries(session.config._gas_deltas))
+  if failed and session.exitstatus == 0: session.exitstatus = 1
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+  deltas = getattr(config, "_gas_deltas", None)
+  if not deltas: return
+  terminalreporter.section("gas")
+  terminalreporter.write_line(gas_benchmark.format_deltas(deltas))
+  for d in gas_benchmark.regressions(deltas):
+    terminalreporter.write_line(f"gas regression: {d.entry} {d.delta:+.2%} over the baseline", red=True)
+  new = gas_benchmark.new_entries(deltas)
+  if new:
+    strict = config.option.gas_strict
+    terminalreporter.write_line(f"gas: {len(new)} entries not in {os.path.basename(GAS_BASELINE)}, run with --gas-update to add them", red=strict, yellow=not strict)
+    for d in new: terminalreporter.write_line(f"  {d.entry}: {d.current}", red=strict, yellow=not strict)
@@ -1,6 +1,7 @@
 import pytest, brownie
 from brownie import network
 import math
+from scripts.uniswap_math import get_amounts_for_liquidity, get_liquidity_for_amounts
 
 
 # CONSTANTS
@@ -110,13 +111,9 @@ def seed_accounts( weth, usdc, user, owner, lendingPool, accounts):
 
   
 @pytest.fixture(scope="module", autouse=True)
-def contracts(owner, Strings, TickMath, TokenisableRange, UpgradeableBeacon, RangeManager, lendingPool, router, weth, usdc):
-  Strings.deploy({"from": owner})
-  TickMath.deploy({"from": owner})
-  tr = TokenisableRange.deploy({"from": owner})
-  trb = UpgradeableBeacon.deploy(tr, {"from": owner})
+def contracts(owner, world, RangeManager, lendingPool, router, weth, usdc):
   r = RangeManager.deploy(lendingPool, usdc, weth, {"from": owner})
-  yield tr, trb, r
+  yield world.trImplementation, world.trBeacon, r
 
 @pytest.fixture(scope="module", autouse=True)
 def fullRangeTR(TokenisableRange, owner, usdc, weth, oracle):
@@ -135,25 +132,16 @@ def gevault(accounts, chain, pm, owner, timelock, lendingPool, GeVault, roeroute
   yield gevault
   
 
-# calc range values for uni v3: https://docs.google.com/spreadsheets/d/1EXqXeXysknbib3_WbUB-lGGknBjxJvt4/edit#gid=385415845
-# OR return values from https://app.uniswap.org/#/add/ETH/0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48/3000?chain=mainnet&maxPrice=2000&minPrice=1600
+# Amounts of a TokenisableRange position worth about 1 USDC at the pool price, from the exact port of the range math
 @pytest.fixture(scope="module", autouse=True)
-def liquidityRatio(interface, usdc, weth):
-  def liqRatio(rangeLow, rangeHigh):
-    pool = interface.IUniswapV3Factory("0x1F98431c8aD98523631AE4a59f267346ea31F984").getPool(usdc, weth, 3000)
-    sqrtPriceX96 = interface.IUniswapV3Pool(pool).slot0()[0]
-    price = ( 2 ** 192 / sqrtPriceX96 ** 2 ) * 1e12 # 1e12 because decimal difference between WETH and USDC
-    if price < rangeLow: price = rangeLow
-    if price > rangeHigh: price = rangeHigh
-    priceSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(price)) * 2 / math.log(1.0001)))
-    priceLowSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeLow)) * 2 / math.log(1.0001)))
-    priceHighSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeHigh)) * 2 / math.log(1.0001)))
-    if priceSqrt == priceLowSqrt: return 0, 1e18 / rangeLow
-    relation = (priceSqrt-priceHighSqrt) / ( (1/priceSqrt) - (1/priceLowSqrt) )
-    lpAmount = 1
-    usdAmount = lpAmount / ( 1 + relation * price ) 
-    ethAmount = relation * usdAmount
-    return usdAmount * 1e6, ethAmount * 1e18
+def liquidityRatio(interface):
+  def liqRatio(tr):
+    sqrtPriceX96 = interface.IUniswapV3Pool(tr.uniswapPool()).slot0()[0]
+    sqrtRatioLowerX96, sqrtRatioUpperX96 = tr.sqrtRatioLowerX96(), tr.sqrtRatioUpperX96()
+    # value of a reference liquidity in USDC units, WETH valued at the pool price
+    amount0, amount1 = get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18)
+    value = amount0 + amount1 * 2**192 // sqrtPriceX96**2
+    return get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18 * 10**6 // value)
   yield liqRatio
 
 
@@ -168,16 +156,15 @@ def exactSwap(routerV3, params, extra): # pragma: no cover
   return routerV3.exactInputSingle(params, extra)
   
 
-@pytest.fixture(scope="module", autouse=True)
-def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, config, contracts, TokenisableRange, seed_accounts, liquidityRatio, gevault):
-  tr, trb, r = contracts
+# Deploy ticks at given prices, and load them as collateral in the lending pool
+def deployTicks(prices, owner, timelock, lendingPool, weth, usdc, oracle, config, TokenisableRange, liquidityRatio, init_reserves):
   addresses = []
   
-  for i in TICKS:
+  for i in prices:
     t = TokenisableRange.deploy({"from": owner})
     t.initProxy(oracle, usdc, weth, i * 1e10, i * 1.0001 * 1e10, i, i*1.0001, True, {"from": owner})
     print("Ticker", i, t.name(), t.symbol())
-    usdAmount, ethAmount = liquidityRatio(i, i*1.0001) 
+    usdAmount, ethAmount = liquidityRatio(t)
     usdc.approve(t, 2**256-1, {"from": owner})
     weth.approve(t, 2**256-1, {"from": owner})
     t.init(usdAmount, ethAmount, {"from": owner})
@@ -187,18 +174,8 @@ def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interf
   oracle.setAssetSources( addresses, addresses, {"from": timelock}) 
 
   # Load all into Lending Pool
-  theta_A = "0x78b787C1533Acfb84b8C76B7e5CFdfe80231Ea2D" # matic "0xb54240e3F2180A0E14CE405A089f600dc2D8457c"
-  theta_stbDebt = "0x8B6Ab2f071b27AC1eEbFfA973D957A767b15b2DB" # matic "0x92ED25161bb90eb0026e579b60B8D96eE3b7A15F"
-  theta_varDebt = "0xB19Dd5DAD35af36CF2D80D1A9060f1949b11fCb0" # matic "0x51b89b9e24bc85d6756571032B8bf5660Bf6FbE5"
-  theta_100bps_fixed = "0xfAdB757A7BC3031285417d7114EFD58598E21d79" # "0xEdFbbeDdc3CB3271fd60E90E184B151C76Cd88aB"
-
-  reserves = []
-  for i in addresses:
-      sym = TokenisableRange.at(i).symbol()
-      name = TokenisableRange.at(i).name()
-      reserves.append( [theta_A, theta_stbDebt, theta_varDebt, 18, theta_100bps_fixed, i, owner.address, NULL, sym, "Roe " + name, "roe"+sym, "Roe variable debt bearing " + name, "vd"+sym, "Roe stable debt bearing " + name, "sd" + sym, ""] )
 
-  for i in reserves: config.batchInitReserve([i], {"from": timelock})
+  init_reserves(config, addresses, timelock)
 
   # Enable as collateral
   for i in addresses:
@@ -210,7 +187,21 @@ def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interf
     tr = TokenisableRange.at(i)
     tr.approve(lendingPool, 2**256-1, {"from": owner})
     lendingPool.deposit(tr, tr.balanceOf(owner), owner, 0, {"from": owner})
-    gevault.pushTick(i, {"from": owner})
+  return addresses
+
+
+# Ticks above TICKS for 20 ticks benchmarks: function scoped so that fn_isolation reverts the reserves and oracle sources
+@pytest.fixture
+def extraTicks(owner, timelock, lendingPool, weth, usdc, oracle, config, TokenisableRange, liquidityRatio, init_reserves, prep_ranger):
+  prices = [TICKS[-1] + 100 * (k + 1) for k in range(20 - len(TICKS))]
+  yield deployTicks(prices, owner, timelock, lendingPool, weth, usdc, oracle, config, TokenisableRange, liquidityRatio, init_reserves)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, config, contracts, TokenisableRange, seed_accounts, liquidityRatio, gevault, init_reserves):
+  tr, trb, r = contracts
+  addresses = deployTicks(TICKS, owner, timelock, lendingPool, weth, usdc, oracle, config, TokenisableRange, liquidityRatio, init_reserves)
+  for i in addresses: gevault.pushTick(i, {"from": owner})
   
   # price of ETH at this fixed block is 1262, which means the active ticks should 1000, 1100, 1200, 1300
   gevault.rebalance({"from": owner})
@@ -235,6 +226,32 @@ def test_push_overlap(accounts, chain, pm, owner, timelock, lendingPool, gevault
   with brownie.reverts("GEV: Shift Tick Overlap"): gevault.shiftTick(last_tick, {"from": owner})
   
 
+def test_shift_tick_order(owner, gevault, GeVault, roerouter, fullRangeTR):
+  g = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, False, fullRangeTR, {"from": owner})
+  n = gevault.getTickLength()
+  # build from the middle: prepend lower ticks and append higher ones
+  g.pushTick(gevault.ticks(2), {"from": owner})
+  g.shiftTick(gevault.ticks(1), {"from": owner})
+  g.pushTick(gevault.ticks(3), {"from": owner})
+  g.shiftTick(gevault.ticks(0), {"from": owner})
+  for k in range(4, n): g.pushTick(gevault.ticks(k), {"from": owner})
+  
+  assert g.getTickLength() == n
+  for k in range(n): assert g.ticks(k) == gevault.ticks(k)
+  with brownie.reverts("GEV: Invalid Tick"): g.ticks(n)
+  
+  # prepending costs the same regardless of the number of ticks
+  g2 = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, False, fullRangeTR, {"from": owner})
+  g2.pushTick(gevault.ticks(n-1), {"from": owner})
+  g2.shiftTick(gevault.ticks(n-2), {"from": owner})
+  gasShort = g2.shiftTick(gevault.ticks(n-3), {"from": owner}).gas_used
+  g3 = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, False, fullRangeTR, {"from": owner})
+  for k in range(2, n): g3.pushTick(gevault.ticks(k), {"from": owner})
+  g3.shiftTick(gevault.ticks(1), {"from": owner})
+  # small margin for calldata costs of different addresses
+  assert abs(g3.shiftTick(gevault.ticks(0), {"from": owner}).gas_used - gasShort) < 1000
+  
+
 def test_disabled(accounts, chain, pm, usdc, owner, timelock, lendingPool, gevault, roerouter, oracle, TokenisableRange):
   usdc.approve(gevault, 2**256-1, {"from": owner})
   gevault.setEnabled(False, {"from": owner})
@@ -567,6 +584,351 @@ def test_fees(accounts, weth, usdc, owner, lendingPool, gevault, oracle, Tokenis
   assert gevault.getAdjustedBaseFee(False) == baseFee / 1.2
 
 
+def test_incremental_deposit_withdraw(accounts, usdc, weth, owner, lendingPool, gevault, oracle, TokenisableRange, fullRangeTR):
+  gevault.setIncrementalRebalance(True, {"from": owner})
+  assert gevault.incrementalRebalance() == True
+  
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  assert nearlyEqual(gevault.getTVL(), 1000 * oracle.getAssetPrice(usdc))
+  t1 = TokenisableRange.at(gevault.ticks(1))
+  t2 = TokenisableRange.at(gevault.ticks(2))
+  assert gevault.getTickBalance(1) > 0 and gevault.getTickBalance(2) > 0
+  assert nearlyEqual(gevault.getTickBalance(1) * t1.latestAnswer(), gevault.getTickBalance(2) * t2.latestAnswer())
+  # ticks out of the active range are untouched
+  assert gevault.getTickBalance(5) == 0
+  
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  assert gevault.getTickBalance(3) > 0 and gevault.getTickBalance(4) > 0
+  
+  # nothing to move: rebalancing doesnt modify ticks
+  bal1 = gevault.getTickBalance(1)
+  gevault.rebalance({"from": owner})
+  assert gevault.getTickBalance(1) == bal1
+  
+  # full range above its share: trimmed, and the freed assets go to the ticks
+  frBal = fullRangeTR.balanceOf(gevault)
+  gevault.setFullRangeShare(10, {"from": owner})
+  gevault.rebalance({"from": owner})
+  assert fullRangeTR.balanceOf(gevault) < frBal and gevault.getTickBalance(1) > bal1
+  bal1 = gevault.getTickBalance(1)
+  
+  liquidity = gevault.balanceOf(owner)
+  usdcBal = usdc.balanceOf(owner)
+  gevault.withdraw(liquidity / 4, usdc, {"from": owner})
+  assert usdc.balanceOf(owner) > usdcBal
+  assert gevault.getTickBalance(1) < bal1
+
+
+@pytest.mark.skip_coverage
+def test_incremental_deposit_collects_fees(accounts, usdc, weth, owner, user, gevault, oracle, routerV3, fullRangeTR, TokenisableRange):
+  gevault.setIncrementalRebalance(True, {"from": owner})
+  gevault.setTvlCap(1e14, {"from": owner})
+  # fees are kept by the TRs for their holders instead of being sent to the fee vault
+  fullRangeTR.setCompounding(True, 0, {"from": owner})
+  for k in range(gevault.getTickLength()): TokenisableRange.at(gevault.ticks(k)).setCompounding(True, 0, {"from": owner})
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+
+  # generate fees: push the price across the 1300 tick and back
+  aaveUSDC = accounts.at(AAVE_USDC, force=True)
+  usdc.approve(routerV3, 2**256-1, {"from": aaveUSDC} )
+  weth.approve(routerV3, 2**256-1, {"from": aaveUSDC} )
+  wethBal = weth.balanceOf(aaveUSDC)
+  exactSwap(routerV3, [usdc, weth, 500, aaveUSDC, 1803751170519, 20000000e6, 0, 0], {"from": aaveUSDC})
+  exactSwap(routerV3, [weth, usdc, 500, aaveUSDC, 1803751170519, weth.balanceOf(aaveUSDC) - wethBal, 0, 0], {"from": aaveUSDC})
+  assert gevault.poolMatchesOracle() == True
+  ownerValue = gevault.getTVL() * gevault.balanceOf(owner) / gevault.totalSupply()
+
+  # large deposit compared to the vault: it would capture most of the pending fees if they were left out of the TVL
+  usdc.approve(gevault, 2**256-1, {"from": user})
+  treasuryBal = usdc.balanceOf(TREASURY)
+  gevault.deposit(usdc, 20000e6, {"from": user})
+  depositValue = (20000e6 - (usdc.balanceOf(TREASURY) - treasuryBal)) * oracle.getAssetPrice(usdc) / 1e6
+
+  # a full cycle collects everything left, the TVL then includes all the fees
+  gevault.setIncrementalRebalance(False, {"from": owner})
+  gevault.rebalance({"from": owner})
+  tvl = gevault.getTVL()
+  assert tvl * gevault.balanceOf(owner) / gevault.totalSupply() >= ownerValue
+  assert tvl * gevault.balanceOf(user) / gevault.totalSupply() <= depositValue * 1.000001
+
+
+# Tick layouts of scripts/deploy_arbitrum.py: (first tick, last tick, step)
+TICK_LAYOUTS = {"ETH": (1000, 2500, 100), "GMX": (20, 115, 5), "ARB": (0.5, 2.0, 0.1), "BTC": (20000, 40000, 1000)}
+
+# Linear scan reference for getActiveTickIndex
+def activeTickIndexLinear(vault, TokenisableRange, baseTokenIsToken0):
+  for k in range(vault.getTickLength()):
+    amt0, amt1 = TokenisableRange.at(vault.ticks(k)).getTokenAmountsExcludingFees(1e18)
+    if (baseTokenIsToken0 and amt1 == 0) or (not baseTokenIsToken0 and amt0 == 0): return k
+  return vault.getTickLength()
+
+
+@pytest.mark.skip_coverage
+@pytest.mark.parametrize("layout", TICK_LAYOUTS.keys())
+def test_active_tick_index_search(layout, interface, owner, usdc, weth, oracle, GeVault, TokenisableRange, roerouter, fullRangeTR, liquidityRatio):
+  first, last, step = TICK_LAYOUTS[layout]
+  prices = [first + k * step for k in range(round((last - first) / step) + 1)]
+  # rescale layout around current ETH price, between 2 ticks
+  sqrtPriceX96 = interface.IUniswapV3Pool(UNISWAPPOOLV3).slot0()[0]
+  price = ( 2 ** 192 / sqrtPriceX96 ** 2 ) * 1e12
+  m = len(prices) // 2
+  scale = price / (prices[m] + step / 2)
+  trs = []
+  for p in prices:
+    p = round(p * scale, 2)
+    t = TokenisableRange.deploy({"from": owner})
+    t.initProxy(oracle, usdc, weth, p * 1e10, p * 1.0001 * 1e10, p, p * 1.0001, True, {"from": owner})
+    usdAmount, ethAmount = liquidityRatio(t)
+    usdc.approve(t, 2**256-1, {"from": owner})
+    weth.approve(t, 2**256-1, {"from": owner})
+    t.init(usdAmount, ethAmount, {"from": owner})
+    # the position holds the exact liquidity of the amounts, whether the tick is below, above or around the price
+    assert t.liquidity() == get_liquidity_for_amounts(sqrtPriceX96, t.sqrtRatioLowerX96(), t.sqrtRatioUpperX96(), usdAmount, ethAmount)
+    trs.append(t)
+  
+  # subsets cover an active tick in range, all ticks above price and all ticks below price
+  for subset in [trs, trs[:m], trs[m+1:], trs[m-1:m+3]]:
+    for baseTokenIsToken0 in [False, True]:
+      g = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, baseTokenIsToken0, fullRangeTR, {"from": owner})
+      # ticks are ordered by ascending price in quote token
+      for t in (subset if not baseTokenIsToken0 else subset[::-1]): g.pushTick(t, {"from": owner})
+      assert g.getActiveTickIndex() == activeTickIndexLinear(g, TokenisableRange, baseTokenIsToken0)
+
+
+@pytest.mark.skip_coverage
+def test_deposit_withdraw_gas_20_ticks(owner, usdc, weth, gevault, GeVault, roerouter, fullRangeTR, extraTicks, gas):
+  g = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, False, fullRangeTR, {"from": owner})
+  for k in range(gevault.getTickLength()): g.pushTick(gevault.ticks(k), {"from": owner})
+  for t in extraTicks: g.pushTick(t, {"from": owner})
+  assert g.getTickLength() == 20
+  
+  usdc.approve(g, 2**256-1, {"from": owner})
+  weth.approve(g, 2**256-1, {"from": owner})
+  g.deposit(usdc, 1000e6, {"from": owner})
+  g.deposit(weth, 1e18, {"from": owner})
+  depositGas = gas.record("GeVault.deposit[ticks=20]", g.deposit(usdc, 100e6, {"from": owner}))
+  withdrawGas = gas.record("GeVault.withdraw[ticks=20]", g.withdraw(g.balanceOf(owner) / 10, usdc, {"from": owner}))
+  gas.record("GeVault.rebalance[ticks=20]", g.rebalance({"from": owner}))
+  print("20 ticks gas: deposit", depositGas, "withdraw", withdrawGas)
+
+
+def test_queue(owner, user, usdc, weth, gevault, GeVaultQueue, oracle):
+  queue = GeVaultQueue.deploy(gevault, {"from": owner})
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  
+  with brownie.reverts("GEV: Unauthorized"): gevault.settleQueue([1e6, 0], [0, 0], {"from": owner})
+  gevault.setQueue(queue, {"from": owner})
+  with brownie.reverts("GEV: Empty Epoch"): queue.settle({"from": user})
+  
+  usdc.approve(queue, 2**256-1, {"from": owner})
+  usdc.approve(queue, 2**256-1, {"from": user})
+  gevault.approve(queue, 2**256-1, {"from": owner})
+  queue.deposit(usdc, 100e6, {"from": owner})
+  queue.deposit(usdc, 300e6, {"from": user})
+  liquidity = gevault.balanceOf(owner) / 10
+  queue.withdraw(liquidity, weth, {"from": owner})
+  # a cancelled request is refunded
+  usdcBal = usdc.balanceOf(user)
+  queue.cancel({"from": user})
+  assert usdc.balanceOf(user) == usdcBal + 300e6
+  queue.deposit(usdc, 300e6, {"from": user})
+  with brownie.reverts("GEV: Epoch Not Settled"): queue.claim(0, {"from": user})
+  
+  tvl = gevault.getTVL()
+  queue.settle({"from": user})
+  assert queue.currentEpoch() == 1
+  # 400 USDC deposited and 10% of the vault withdrawn
+  assert nearlyEqual(gevault.getTVL(), tvl * 0.9 + 400 * oracle.getAssetPrice(usdc))
+  
+  queue.claim(0, {"from": user})
+  wethBal = weth.balanceOf(owner)
+  ownerShares = gevault.balanceOf(owner)
+  queue.claim(0, {"from": owner})
+  assert weth.balanceOf(owner) > wethBal
+  # pro-rata shares
+  assert nearlyEqual(gevault.balanceOf(user), 3 * (gevault.balanceOf(owner) - ownerShares))
+  assert queue.getClaimable(0, user) == (0, (0, 0))
+
+
+def test_needs_rebalance(owner, user, usdc, weth, gevault):
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  assert gevault.needsRebalance() == False
+  assert gevault.rebalanceIfNeeded({"from": user}).return_value == False
+  
+  # small donation stays below thresholds
+  gevault.depositFee(usdc, 10e6, {"from": owner})
+  assert gevault.needsRebalance() == False
+  # large idle balance needs redeploying
+  gevault.depositFee(usdc, 500e6, {"from": owner})
+  assert gevault.needsRebalance() == True
+  assert gevault.rebalanceIfNeeded({"from": user}).return_value == True
+  assert gevault.needsRebalance() == False
+  
+  with brownie.reverts("GEV: Invalid Threshold"): gevault.setRebalanceThresholds(1e4, 0, {"from": owner})
+  gevault.setRebalanceThresholds(0, 0, {"from": owner})
+  gevault.depositFee(usdc, 10e6, {"from": owner})
+  assert gevault.needsRebalance() == True
+
+
+def test_lens(owner, usdc, weth, gevault, GeVaultLens, lendingPool):
+  from scripts.gevault_lens import get_vaults_data
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  
+  lens = GeVaultLens.deploy({"from": owner})
+  data = get_vaults_data(lens, [gevault])[gevault.address]
+  assert data.tvl == gevault.getTVL()
+  assert (data.amount0, data.amount1) == gevault.getReserves()[:2]
+  assert data.latestAnswer == gevault.latestAnswer()
+  assert data.activeTickIndex == gevault.getActiveTickIndex()
+  assert data.poolMatchesOracle == gevault.poolMatchesOracle()
+  assert len(data.ticks) == gevault.getTickLength()
+  for k, t in enumerate(data.ticks):
+    assert t.tick == gevault.ticks(k)
+    assert t.aToken == lendingPool.getReserveData(t.tick)[7]
+    assert t.balance == gevault.getTickBalance(k)
+
+
+def test_previews_and_mint(owner, usdc, weth, gevault):
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  
+  preview = gevault.previewDeposit(weth, 1e18)
+  liquidity = gevault.deposit(weth, 1e18, {"from": owner}).return_value
+  assert nearlyEqual(liquidity, preview)
+  
+  preview = gevault.previewWithdraw(liquidity / 2, usdc)
+  usdcBal = usdc.balanceOf(owner)
+  gevault.withdraw(liquidity / 2, usdc, {"from": owner})
+  assert nearlyEqual(usdc.balanceOf(owner) - usdcBal, preview)
+  
+  # mint exact shares
+  preview = gevault.previewMint(1e18, usdc)
+  with brownie.reverts("GEV: Max Amount Exceeded"): gevault.mint(1e18, usdc, preview / 2, {"from": owner})
+  gevBal = gevault.balanceOf(owner)
+  usdcBal = usdc.balanceOf(owner)
+  gevault.mint(1e18, usdc, preview * 1.01, {"from": owner})
+  assert gevault.balanceOf(owner) == gevBal + 1e18
+  assert nearlyEqual(usdcBal - usdc.balanceOf(owner), preview)
+  
+  # max deposit respects the TVL cap
+  gevault.setTvlCap(gevault.getTVL() + 100e8, {"from": owner})
+  maxAmount = gevault.maxDeposit(usdc)
+  assert nearlyEqual(maxAmount, 100e6)
+  with brownie.reverts("GEV: Max Cap Reached"): gevault.deposit(usdc, maxAmount * 1.01, {"from": owner})
+  gevault.deposit(usdc, maxAmount * 0.99, {"from": owner})
+  
+  # previews only price the vault tokens
+  with brownie.reverts("GEV: Invalid Token"): gevault.previewDeposit(NULL, 1e18)
+  with brownie.reverts("GEV: Invalid Token"): gevault.previewMint(1e18, NULL)
+  with brownie.reverts("GEV: Invalid Token"): gevault.previewWithdraw(1e18, NULL)
+  with brownie.reverts("GEV: Invalid Token"): gevault.maxDeposit(NULL)
+
+
+def test_atoken_cache(gevault, lendingPool, user):
+  for k in range(gevault.getTickLength()):
+    t = gevault.ticks(k)
+    assert gevault.tickATokens(t) == lendingPool.getReserveData(t)[7]
+  # permissionless as it only syncs with the lending pool
+  gevault.refreshATokens({"from": user})
+  assert gevault.tickATokens(gevault.ticks(0)) == lendingPool.getReserveData(gevault.ticks(0))[7]
+
+
+def test_light_deposit_withdraw(accounts, usdc, weth, owner, gevault, oracle):
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  bal1 = gevault.getTickBalance(1)
+  bal3 = gevault.getTickBalance(3)
+  
+  # light usdc deposit only goes to the usdc ticks
+  tvl = gevault.getTVL()
+  gevault.depositLight(usdc, 100e6, {"from": owner})
+  assert nearlyEqual(gevault.getTVL(), tvl + 100 * oracle.getAssetPrice(usdc))
+  assert gevault.getTickBalance(1) > bal1
+  assert gevault.getTickBalance(3) == bal3
+  assert gevault.getTickBalance(5) == 0
+  
+  # light withdraw pulls from the most liquid usdc tick only
+  bal1 = gevault.getTickBalance(1)
+  bal2 = gevault.getTickBalance(2)
+  usdcBal = usdc.balanceOf(owner)
+  gevault.withdrawLight(gevault.balanceOf(owner) / 20, usdc, {"from": owner})
+  assert usdc.balanceOf(owner) > usdcBal
+  assert (gevault.getTickBalance(1) < bal1) != (gevault.getTickBalance(2) < bal2)
+  assert gevault.getTickBalance(3) == bal3
+  
+  # withdrawing more than the active ticks hold falls back to a full cycle
+  wethBal = owner.balance()
+  gevault.withdrawLight(gevault.balanceOf(owner) / 2, weth, {"from": owner})
+  assert owner.balance() > wethBal + 0.8e18
+
+
+@pytest.mark.skip_coverage
+def test_light_deposit_tick_moved(accounts, interface, usdc, weth, owner, gevault, routerV3, oracle, HardcodedPriceOracle):
+  usdc.approve(gevault, 2**256-1, {"from": owner})
+  weth.approve(gevault, 2**256-1, {"from": owner})
+  gevault.deposit(usdc, 1000e6, {"from": owner})
+  gevault.deposit(weth, 1e18, {"from": owner})
+  assert gevault.lastTickIndex() == 3
+  
+  # move price upward by buying much WETH, price is now 1380.95
+  aaveUSDC = accounts.at(AAVE_USDC, force=True)
+  usdc.approve(routerV3, 2**256-1, {"from": aaveUSDC} )
+  exactSwap(routerV3, [usdc, weth, 500, aaveUSDC, 1803751170519, 38000000e6, 0, 0], {"from": aaveUSDC})
+  neworacle = HardcodedPriceOracle.deploy(138000000000, {"from": owner})
+  lpadd = interface.ILendingPoolAddressesProvider(LENDING_POOL_ADDRESSES_PROVIDER)
+  oracle.setAssetSources([WETH], [neworacle], {"from": accounts.at(lpadd.getPoolAdmin(), force=True)})
+  assert gevault.getActiveTickIndex() == 4
+  
+  # the active ticks are stale: the light deposit falls back to a full deposit around the new active tick
+  gevault.depositLight(usdc, 100e6, {"from": owner})
+  assert gevault.lastTickIndex() == 4
+  assert gevault.getTickBalance(1) == 0
+  assert gevault.getTickBalance(5) > 0
+
+
+@pytest.mark.skip_coverage
+def test_incremental_rebalance_gas(owner, usdc, weth, gevault, GeVault, roerouter, fullRangeTR, gas):
+  results = []
+  for tickCount in range(2, gevault.getTickLength() + 1):
+    g = GeVault.deploy(TREASURY, roerouter, UNISWAPPOOLV3, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", WETH, False, fullRangeTR, {"from": owner})
+    for k in range(tickCount): g.pushTick(gevault.ticks(k), {"from": owner})
+    usdc.approve(g, 2**256-1, {"from": owner})
+    weth.approve(g, 2**256-1, {"from": owner})
+    g.deposit(usdc, 1000e6, {"from": owner})
+    g.deposit(weth, 1e18, {"from": owner})
+    
+    fullDeposit = gas.record(f"GeVault.deposit[ticks={tickCount}]", g.deposit(usdc, 10e6, {"from": owner}))
+    fullRebalance = gas.record(f"GeVault.rebalance[ticks={tickCount}]", g.rebalance({"from": owner}))
+    gas.record(f"GeVault.withdraw[ticks={tickCount}]", g.withdraw(g.balanceOf(owner) / 10, usdc, {"from": owner}))
+    g.setIncrementalRebalance(True, {"from": owner})
+    incDeposit = gas.record(f"GeVault.deposit[ticks={tickCount},incremental]", g.deposit(usdc, 10e6, {"from": owner}))
+    incRebalance = gas.record(f"GeVault.rebalance[ticks={tickCount},incremental]", g.rebalance({"from": owner}))
+    results.append((tickCount, fullDeposit, incDeposit, fullRebalance, incRebalance))
+  
+  print("ticks | deposit full | deposit incremental | rebalance full | rebalance incremental")
+  for r in results: print(" | ".join(str(x) for x in r))
+  # full path cost scales with tick count, incremental path only with active ticks
+  assert results[-1][2] < results[-1][1]
+  assert results[-1][4] < results[-1][3]
+
+
 def test_migration_token(gevault, GeVault, owner, timelock, roerouter, MigrateVault, usdc, weth, fullRangeTR):
   gevault.setBaseFee(0, {"from": owner})
   usdc.approve(gevault, 2**256-1, {"from": owner})
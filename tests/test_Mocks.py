@@ -0,0 +1,158 @@
+import pytest, brownie
+import math
+from scripts.uniswap_math import get_sqrt_ratio_at_tick, get_amounts_for_liquidity
+
+
+# Runs on a local development network with `brownie test --mocks`, see conftest.py
+TREASURY="0x50101017adf9D2d06C395471Bc3D6348589c3b97" # random empty
+TICKS = [1100, 1150, 1200, 1250, 1300, 1350, 1400]
+
+
+@pytest.fixture(autouse=True)
+def isolation(fn_isolation):
+  pass
+
+
+def setPrice(mock_stack, owner, price):
+  mock_stack.pool.setSqrtPriceX96(math.isqrt(10**12 * 2**192 // price), {"from": owner})
+  mock_stack.oracle.setAssetPrice(mock_stack.weth, price * 10**8, {"from": owner})
+
+
+# Mint a TR position with the given liquidity at the pool price
+def initTR(t, mock_stack, owner, liquidity):
+  sqrtPriceX96 = mock_stack.pool.slot0()[0]
+  amount0, amount1 = get_amounts_for_liquidity(sqrtPriceX96, get_sqrt_ratio_at_tick(t.lowerTick()), get_sqrt_ratio_at_tick(t.upperTick()), liquidity)
+  mock_stack.usdc.mint(owner, amount0, {"from": owner})
+  mock_stack.weth.mint(owner, amount1, {"from": owner})
+  mock_stack.usdc.approve(t, 2**256-1, {"from": owner})
+  mock_stack.weth.approve(t, 2**256-1, {"from": owner})
+  t.init(amount0, amount1, {"from": owner})
+  return amount0, amount1
+
+
+@pytest.fixture(scope="module")
+def fullRangeTR(mock_stack, owner, TokenisableRange):
+  t = TokenisableRange.deploy({"from": owner})
+  t.initProxyFullRange(mock_stack.oracle, mock_stack.usdc, mock_stack.weth, {"from": owner})
+  initTR(t, mock_stack, owner, 10**13)
+  yield t
+
+
+# Deploy tickers and load them as collateral in the lending pool
+@pytest.fixture(scope="module")
+def tickers(mock_stack, owner, TokenisableRange):
+  addresses = []
+  for i in TICKS:
+    t = TokenisableRange.deploy({"from": owner})
+    t.initProxy(mock_stack.oracle, mock_stack.usdc, mock_stack.weth, i * 1e10, i * 1.0001 * 1e10, i, i*1.0001, True, {"from": owner})
+    initTR(t, mock_stack, owner, 10**17)
+    mock_stack.lendingPool.initReserve(t, {"from": owner})
+    addresses.append(t)
+  mock_stack.oracle.setAssetSources(addresses, addresses, {"from": owner})
+  yield addresses
+
+
+@pytest.fixture(scope="module")
+def gevault(mock_stack, owner, GeVault, fullRangeTR, tickers):
+  gevault = GeVault.deploy(TREASURY, mock_stack.roerouter, mock_stack.pool, 0, "GeVault WETHUSDC", "GEV-ETHUSDC", mock_stack.weth, False, fullRangeTR, {"from": owner})
+  for t in tickers: gevault.pushTick(t, {"from": owner})
+  gevault.rebalance({"from": owner})
+  yield gevault
+
+
+def test_mock_pool(mock_stack, owner):
+  assert mock_stack.factory.getPool(mock_stack.weth, mock_stack.usdc, 500) == mock_stack.pool
+  assert mock_stack.pool.token0() == mock_stack.usdc
+  assert 1e12 * 2**192 / mock_stack.pool.slot0()[0]**2 == pytest.approx(1262, rel=0.01)
+  with brownie.reverts("Pool exists"): mock_stack.factory.createPool(mock_stack.usdc, mock_stack.weth, 500, {"from": owner})
+
+
+def test_mock_lending_pool(mock_stack, owner, user):
+  usdc, weth, lendingPool = mock_stack.usdc, mock_stack.weth, mock_stack.lendingPool
+  weth.mint(user, 1e18, {"from": owner})
+  usdc.mint(owner, 1e10, {"from": owner})
+  weth.approve(lendingPool, 2**256-1, {"from": user})
+  usdc.approve(lendingPool, 2**256-1, {"from": owner})
+  lendingPool.deposit(weth, 1e18, user, 0, {"from": user})
+  lendingPool.deposit(usdc, 1e10, owner, 0, {"from": owner})
+  assert brownie.interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user) == 1e18
+
+  # 80% ltv
+  with brownie.reverts("Health factor lower than liquidation threshold"): lendingPool.borrow(usdc, 1100e6, 2, 0, user, {"from": user})
+  lendingPool.borrow(usdc, 1000e6, 2, 0, user, {"from": user})
+  assert usdc.balanceOf(user) == 1000e6
+  with brownie.reverts("Health factor lower than liquidation threshold"): lendingPool.withdraw(weth, 2**256-1, user, {"from": user})
+
+  usdc.approve(lendingPool, 2**256-1, {"from": user})
+  lendingPool.repay(usdc, 2**256-1, 2, user, {"from": user})
+  lendingPool.withdraw(weth, 2**256-1, user, {"from": user})
+  assert weth.balanceOf(user) == 1e18
+
+
+def test_mock_liquidation(mock_stack, owner, user):
+  usdc, weth, lendingPool = mock_stack.usdc, mock_stack.weth, mock_stack.lendingPool
+  weth.mint(user, 1e18, {"from": owner})
+  usdc.mint(owner, 2e10, {"from": owner})
+  weth.approve(lendingPool, 2**256-1, {"from": user})
+  usdc.approve(lendingPool, 2**256-1, {"from": owner})
+  lendingPool.deposit(weth, 1e18, user, 0, {"from": user})
+  lendingPool.deposit(usdc, 1e10, owner, 0, {"from": owner})
+  lendingPool.borrow(usdc, 1000e6, 2, 0, user, {"from": user})
+  with brownie.reverts("Health factor not below threshold"): lendingPool.liquidationCall(weth, usdc, user, 500e6, False, {"from": owner})
+
+  # collateral worth 1100 is below the 85% liquidation threshold of the 1000 debt
+  mock_stack.oracle.setAssetPrice(weth, 1100 * 10**8, {"from": owner})
+  debtToken = brownie.interface.ERC20(lendingPool.getReserveData(usdc)[9])
+  wethBal = weth.balanceOf(owner)
+  lendingPool.liquidationCall(weth, usdc, user, 2**256-1, False, {"from": owner})
+  # half of the debt is repaid, for the collateral worth it plus a 5% bonus
+  assert debtToken.balanceOf(user) == 500e6
+  assert weth.balanceOf(owner) - wethBal == 500 * 10**18 * 10500 // (1100 * 10**4)
+
+
+def test_mock_tr(mock_stack, owner, user, fullRangeTR):
+  usdc, weth = mock_stack.usdc, mock_stack.weth
+  # full range at 1262: 1 LP is worth twice the ETH value
+  assert fullRangeTR.latestAnswer() == pytest.approx(2 * 1262e8 * fullRangeTR.getTokenAmounts(1e18)[1] / 1e18, rel=0.01)
+
+  amount0, amount1 = fullRangeTR.getTokenAmounts(1e18)
+  usdc.mint(user, amount0, {"from": owner})
+  weth.mint(user, amount1, {"from": owner})
+  usdc.approve(fullRangeTR, 2**256-1, {"from": user})
+  weth.approve(fullRangeTR, 2**256-1, {"from": user})
+  fullRangeTR.deposit(amount0, amount1, {"from": user})
+  assert fullRangeTR.balanceOf(user) == pytest.approx(1e18, rel=0.01)
+
+  # fees are collected out of the position on the next interaction
+  usdc.mint(owner, 1e6, {"from": owner})
+  usdc.approve(mock_stack.posManager, 2**256-1, {"from": owner})
+  mock_stack.posManager.addFees(fullRangeTR.tokenId(), 1e6, 0, {"from": owner})
+  fullRangeTR.claimFee({"from": user})
+  assert mock_stack.posManager.positions(fullRangeTR.tokenId())[10] == 0
+
+  # withdrawing after the price moved returns the position at the new price
+  setPrice(mock_stack, owner, 1400)
+  fullRangeTR.withdraw(fullRangeTR.balanceOf(user), 0, 0, {"from": user})
+  assert fullRangeTR.balanceOf(user) == 0
+  assert usdc.balanceOf(user) > amount0 and weth.balanceOf(user) < amount1
+
+
+def test_mock_gevault(mock_stack, owner, user, gevault):
+  usdc, weth = mock_stack.usdc, mock_stack.weth
+  assert gevault.poolMatchesOracle()
+  usdc.mint(user, 1000e6, {"from": owner})
+  weth.mint(user, 1e18, {"from": owner})
+  usdc.approve(gevault, 2**256-1, {"from": user})
+  weth.approve(gevault, 2**256-1, {"from": user})
+  gevault.deposit(usdc, 1000e6, {"from": user})
+  gevault.deposit(weth, 1e18, {"from": user})
+  # deposit fees are at most a few %
+  assert gevault.getTVL() > 2200e8 and gevault.getTVL() <= 2262e8
+
+  setPrice(mock_stack, owner, 1330)
+  assert gevault.poolMatchesOracle()
+  gevault.rebalance({"from": owner})
+
+  gevault.withdraw(gevault.balanceOf(user), usdc, {"from": user})
+  assert gevault.balanceOf(user) == 0
+  assert usdc.balanceOf(user) > 2200e6
@@ -1,6 +1,7 @@
 import pytest, brownie
 from brownie import network
 import math
+from scripts.uniswap_math import get_amounts_for_liquidity, get_liquidity_for_amounts
 
 
 # CONSTANTS
@@ -111,34 +112,21 @@ def seed_accounts( weth, usdc, user, owner, lendingPool, accounts):
 
   
 @pytest.fixture(scope="module", autouse=True)
-def contracts(owner, Strings, TickMath, TokenisableRange, UpgradeableBeacon, RangeManager, lendingPool, router, weth, usdc):
-  Strings.deploy({"from": owner})
-  TickMath.deploy({"from": owner})
-  tr = TokenisableRange.deploy({"from": owner})
-  trb = UpgradeableBeacon.deploy(tr, {"from": owner})
+def contracts(owner, world, RangeManager, lendingPool, router, weth, usdc):
   r = RangeManager.deploy(lendingPool, usdc, weth, {"from": owner})
-  yield tr, trb, r
+  yield world.trImplementation, world.trBeacon, r
 
 
-# calc range values for uni v3: https://docs.google.com/spreadsheets/d/1EXqXeXysknbib3_WbUB-lGGknBjxJvt4/edit#gid=385415845
-# OR return values from https://app.uniswap.org/#/add/ETH/0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48/3000?chain=mainnet&maxPrice=2000&minPrice=1600
+# Amounts of a TokenisableRange position worth about 1 USDC at the pool price, from the exact port of the range math
 @pytest.fixture(scope="module", autouse=True)
-def liquidityRatio(interface, usdc, weth):
-  def liqRatio(rangeLow, rangeHigh):
-    pool = interface.IUniswapV3Factory("0x1F98431c8aD98523631AE4a59f267346ea31F984").getPool(usdc, weth, 3000)
-    sqrtPriceX96 = interface.IUniswapV3Pool(pool).slot0()[0]
-    price = ( 2 ** 192 / sqrtPriceX96 ** 2 ) * 1e12 # 1e12 because decimal difference between WETH and USDC
-    if price < rangeLow: price = rangeLow
-    if price > rangeHigh: price = rangeHigh
-    priceSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(price)) * 2 / math.log(1.0001)))
-    priceLowSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeLow)) * 2 / math.log(1.0001)))
-    priceHighSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeHigh)) * 2 / math.log(1.0001)))
-    if priceSqrt == priceLowSqrt: return 0, 1e18 / rangeLow
-    relation = (priceSqrt-priceHighSqrt) / ( (1/priceSqrt) - (1/priceLowSqrt) )
-    lpAmount = 1
-    usdAmount = lpAmount / ( 1 + relation * price ) 
-    ethAmount = relation * usdAmount
-    return usdAmount * 1e6, ethAmount * 1e18
+def liquidityRatio(interface):
+  def liqRatio(tr):
+    sqrtPriceX96 = interface.IUniswapV3Pool(tr.uniswapPool()).slot0()[0]
+    sqrtRatioLowerX96, sqrtRatioUpperX96 = tr.sqrtRatioLowerX96(), tr.sqrtRatioUpperX96()
+    # value of a reference liquidity in USDC units, WETH valued at the pool price
+    amount0, amount1 = get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18)
+    value = amount0 + amount1 * 2**192 // sqrtPriceX96**2
+    return get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18 * 10**6 // value)
   yield liqRatio
 
 
@@ -150,7 +138,7 @@ def nearlyEqual(value0, value1):
 
 
 @pytest.fixture(scope="module", autouse=True)
-def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, config, contracts, TokenisableRange, seed_accounts, liquidityRatio):
+def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, config, contracts, TokenisableRange, seed_accounts, liquidityRatio, init_reserves):
   tr, trb, r = contracts
 
   ranges = [ [RANGE_LIMITS[0], RANGE_LIMITS[1]], [RANGE_LIMITS[1], RANGE_LIMITS[2]], [RANGE_LIMITS[2], RANGE_LIMITS[3]] ]
@@ -163,31 +151,22 @@ def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interf
 
   # The following lazily fills all the ticks and ranges except the current active one (e.g. 1600-2000)
   # as there's slippage protection, the active Ranger needs to have the correct ratio 
-  # - i usually just use uniswap to figure out the ratio i need to deposit, didn't try to calculate
+  # - liquidityRatio computes it from the range ticks and the pool price
 
   for i in range(r.getStepListLength()):
-    usdAmount, ethAmount = liquidityRatio( ranges[i][0], ranges[i][1])  
-    r.initRange(r.tokenisedRanges(i), usdAmount * 100, 100 * ethAmount, {"from": owner})
-    usdAmount, ethAmount = liquidityRatio( (ranges[i][0]+ranges[i][1])/2,(ranges[i][0]+ranges[i][1])/2 + 1)
-    r.initRange(r.tokenisedTicker(i), usdAmount * 100, 100 * ethAmount, {"from": owner})  
+    for t in [TokenisableRange.at(r.tokenisedRanges(i)), TokenisableRange.at(r.tokenisedTicker(i))]:
+      usdAmount, ethAmount = liquidityRatio(t)
+      r.initRange(t, usdAmount * 100, 100 * ethAmount, {"from": owner})
+      sqrtPriceX96 = interface.IUniswapV3Pool(t.uniswapPool()).slot0()[0]
+      assert t.liquidity() == get_liquidity_for_amounts(sqrtPriceX96, t.sqrtRatioLowerX96(), t.sqrtRatioUpperX96(), usdAmount * 100, 100 * ethAmount)
   
   # Load all into Oracle
   addresses = [r.tokenisedRanges(i) for i in range(3)] + [r.tokenisedTicker(i) for i in range(3)]
   oracle.setAssetSources( addresses, addresses, {"from": timelock}) 
 
   # Load all into Lending Pool
-  theta_A = "0x78b787C1533Acfb84b8C76B7e5CFdfe80231Ea2D" # matic "0xb54240e3F2180A0E14CE405A089f600dc2D8457c"
-  theta_stbDebt = "0x8B6Ab2f071b27AC1eEbFfA973D957A767b15b2DB" # matic "0x92ED25161bb90eb0026e579b60B8D96eE3b7A15F"
-  theta_varDebt = "0xB19Dd5DAD35af36CF2D80D1A9060f1949b11fCb0" # matic "0x51b89b9e24bc85d6756571032B8bf5660Bf6FbE5"
-  theta_100bps_fixed = "0xfAdB757A7BC3031285417d7114EFD58598E21d79" # "0xEdFbbeDdc3CB3271fd60E90E184B151C76Cd88aB"
-
-  reserves = []
-  for i in addresses:
-      sym = TokenisableRange.at(i).symbol()
-      name = TokenisableRange.at(i).name()
-      reserves.append( [theta_A, theta_stbDebt, theta_varDebt, 18, theta_100bps_fixed, i, owner.address, NULL, sym, "Roe " + name, "roe"+sym, "Roe variable debt bearing " + name, "vd"+sym, "Roe stable debt bearing " + name, "sd" + sym, ""] )
 
-  for i in reserves: config.batchInitReserve([i], {"from": timelock})
+  init_reserves(config, addresses, timelock)
 
   # Enable as collateral
   for i in addresses:
@@ -223,8 +202,26 @@ def test_unallowed_flashloan_call(pm, owner, roerouter):
   with brownie.reverts("OPM: Call Unallowed"):
     pm.executeOperation([], [], [], owner, calldata, {"from": owner})
 
+  # batch liquidation direct call unallowed
+  calldata = encode_abi(['uint8', 'uint', 'address[]', 'address[][]', 'uint256[][]', 'address[]'], [2, poolId, [], [], [], []])
+  with brownie.reverts("OPM: Call Unallowed"):
+    pm.executeOperation([], [], [], owner, calldata, {"from": owner})
 
-def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, contracts, TokenisableRange, prep_ranger, config, OptionsPositionManager, roerouter):
+  # pool addresses in params are only trusted when called by that pool, for a flashloan initiated by the OPM itself
+  calldata = encode_abi(['uint8', '(address,address,address,address,address)', 'address', 'address[]'], [0, (NULL, NULL, NULL, NULL, NULL), NULL, []])
+  with brownie.reverts("OPM: Call Unallowed"):
+    pm.executeOperation([], [], [], pm, calldata, {"from": owner})
+  calldata = encode_abi(['uint8', '(address,address,address,address,address)', 'address', 'address[]'], [0, (owner.address, NULL, NULL, NULL, NULL), NULL, []])
+  with brownie.reverts("OPM: Call Unallowed"):
+    pm.executeOperation([], [], [], owner, calldata, {"from": owner})
+
+  # unknown mode
+  calldata = encode_abi(['uint8', 'uint', 'address', 'address'], [3, poolId, NULL, NULL])
+  with brownie.reverts("OPM: Invalid Mode"):
+    pm.executeOperation([], [], [], pm, calldata, {"from": owner})
+
+
+def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, contracts, TokenisableRange, prep_ranger, config, OptionsPositionManager, roerouter, gas):
   tr, trb, r = contracts
   lendingPool.PMAssign(pm, {"from": timelock })
   poolId = roerouter.getPoolsLength() - 1
@@ -249,7 +246,7 @@ def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, us
     
   # BUY PUTS: borrow ticker below current price (full USDC)
   ubalbef = interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user)
-  pm.buyOptions(poolId, [ticker0], [borrowAmount], ["0x0000000000000000000000000000000000000000"], {"from": user})
+  gas.record("OptionsPositionManager.buyOptions", pm.buyOptions(poolId, [ticker0], [borrowAmount], ["0x0000000000000000000000000000000000000000"], {"from": user}))
   # assert that amount borrowed + previous balance = current balance
   assert ubalbef + ticker0.getTokenAmounts(borrowAmount)[0] == interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user)
   print ('debt', lendingPool.getUserAccountData(user)[1], 'expected', ticker0.latestAnswer() * borrowAmount / 1e18 )
@@ -266,7 +263,7 @@ def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, us
   # BUY MULTIPLE OPTIONS: OTM puts and OTM calls
   ubalbef = interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user)
   wbalbef = interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user)
-  pm.buyOptions(poolId, [ticker0, ticker1], [borrowAmount, borrowAmount], ["0x0000000000000000000000000000000000000000", "0x0000000000000000000000000000000000000000"], {"from": user})
+  gas.record("OptionsPositionManager.buyOptions[2 ticks]", pm.buyOptions(poolId, [ticker0, ticker1], [borrowAmount, borrowAmount], ["0x0000000000000000000000000000000000000000", "0x0000000000000000000000000000000000000000"], {"from": user}))
   # Nearly equal as running interest will increase supply -> slightly decrease underlying tokens withdrawn
   print ('weth', wbalbef + ticker1.getTokenAmounts(borrowAmount)[1], interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user) )
   assert nearlyEqual(wbalbef + ticker1.getTokenAmounts(borrowAmount)[1], interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user) )
@@ -277,7 +274,7 @@ def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, us
   # BUY ITM CALLS: buy OTM puts, swap to call
   ubalbef = interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user)
   wbalbef = interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user)
-  pm.buyOptions(poolId, [ticker0], [borrowAmount], [usdc], {"from": user})
+  gas.record("OptionsPositionManager.buyOptions[swap]", pm.buyOptions(poolId, [ticker0], [borrowAmount], [usdc], {"from": user}))
   assert ubalbef == interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user) # USDC bal hasnt changed
   # hard to check exactly the value out for ETH
   print ('wbal bef - aft', wbalbef, interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user) )
@@ -294,7 +291,7 @@ def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, us
     pm.close(poolId, user, ticker0, 0, weth, {"from": owner} )
     
   print('debt tr0bef', interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user) )
-  pm.close(poolId, user, ticker0, 0, weth, {"from": user} )
+  gas.record("OptionsPositionManager.close", pm.close(poolId, user, ticker0, 0, weth, {"from": user} ))
   print('debt tr0', interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user) )
   assert interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user) == 0
   
@@ -305,6 +302,84 @@ def test_buy_options(accounts, chain, pm, owner, timelock, lendingPool, weth, us
   assert interface.ERC20(lendingPool.getReserveData(ticker1)[9]).balanceOf(user) == 0
 
 
+def test_buy_options_gas(pm, timelock, lendingPool, user, interface, contracts, prep_ranger, roerouter, gas):
+  tr, trb, r = contracts
+  lendingPool.PMAssign(pm, {"from": timelock })
+  poolId = roerouter.getPoolsLength() - 1
+  tickers = [r.tokenisedTicker(i) for i in range(3)]
+  ranges = [r.tokenisedRanges(i) for i in range(3)]
+  for i in tickers + ranges:
+    interface.ICreditDelegationToken( lendingPool.getReserveData(i)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+  # gas per number of options: pool addresses are resolved once per call, not once per option
+  for options in [tickers[:1], tickers, tickers + ranges]:
+    tx = pm.buyOptions(poolId, options, [1e15] * len(options), [NULL] * len(options), {"from": user})
+    gas.record(f"OptionsPositionManager.buyOptions[{len(options)} options]", tx)
+
+
+def test_buy_options_net_swap(pm, timelock, lendingPool, weth, usdc, user, interface, contracts, TokenisableRange, prep_ranger, roerouter, gas):
+  tr, trb, r = contracts
+  lendingPool.PMAssign(pm, {"from": timelock })
+  poolId = roerouter.getPoolsLength() - 1
+  ticker2 = TokenisableRange.at(r.tokenisedTicker(2))
+  range2 = TokenisableRange.at(r.tokenisedRanges(2))
+  borrowAmount = 1e16
+  for t in [ticker2, range2]:
+    interface.ICreditDelegationToken( lendingPool.getReserveData(t)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+
+  # both options above price swap WETH to USDC: a single swap for the two
+  wbalbef = interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user)
+  ubalbef = interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user)
+  tx = pm.buyOptions(poolId, [ticker2, range2], [borrowAmount, borrowAmount], [weth, weth], {"from": user})
+  gas.record("OptionsPositionManager.buyOptions[2 swaps]", tx)
+  assert len(tx.events["Swap"]) == 1
+  assert len(tx.events["BuyOptions"]) == 2
+  received = 0
+  for e in tx.events["BuyOptions"]:
+    assert e["amount1"] == 0
+    received += e["amount0"]
+  assert nearlyEqual(wbalbef, interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(user))
+  assert nearlyEqual(ubalbef + received, interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(user))
+
+
+def test_close_many(pm, owner, timelock, lendingPool, weth, usdc, user, interface, contracts, TokenisableRange, prep_ranger, roerouter, gas):
+  tr, trb, r = contracts
+  lendingPool.PMAssign(pm, {"from": timelock })
+  poolId = roerouter.getPoolsLength() - 1
+  ticker0 = TokenisableRange.at(r.tokenisedTicker(0))
+  ticker1 = TokenisableRange.at(r.tokenisedTicker(2))
+  borrowAmount = 1e16
+  interface.ICreditDelegationToken( lendingPool.getReserveData(ticker0)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+  interface.ICreditDelegationToken( lendingPool.getReserveData(ticker1)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+  # OTM put and OTM call: one needs USDC, the other WETH
+  pm.buyOptions(poolId, [ticker0, ticker1], [borrowAmount, borrowAmount], [NULL, NULL], {"from": user})
+
+  with brownie.reverts('OPM: Array Length Mismatch'):
+    pm.closeMany(poolId, user, [ticker0, ticker1], [0], weth, {"from": user})
+  with brownie.reverts('OPM: Invalid Collateral Asset'):
+    pm.closeMany(poolId, user, [ticker0, ticker1], [0, 0], TREASURY, {"from": user})
+  with brownie.reverts("Not initiated by user"):
+    pm.closeMany(poolId, user, [ticker0, ticker1], [0, 0], weth, {"from": owner})
+  with brownie.reverts('OPM: No Debt'):
+    pm.closeMany(poolId, user, [], [], weth, {"from": user})
+  with brownie.reverts('OPM: Duplicate Debt Asset'):
+    pm.closeMany(poolId, user, [ticker0, ticker0], [0, 0], weth, {"from": user})
+
+  # partial repay of ticker0, full repay of ticker1
+  debt0 = interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user)
+  tx = pm.closeMany(poolId, user, [ticker0, ticker1], [debt0 / 2, 0], weth, {"from": user})
+  gas.record("OptionsPositionManager.closeMany[2 ticks]", tx)
+  assert len(tx.events["ClosePosition"]) == 2
+  assert nearlyEqual(interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user), debt0 / 2)
+  assert interface.ERC20(lendingPool.getReserveData(ticker1)[9]).balanceOf(user) == 0
+  # nothing left in the position manager
+  assert usdc.balanceOf(pm) == 0 and weth.balanceOf(pm) == 0
+
+  with brownie.reverts('OPM: No Debt'):
+    pm.closeMany(poolId, user, [ticker1], [0], weth, {"from": user})
+  pm.closeMany(poolId, user, [ticker0], [0], weth, {"from": user})
+  assert interface.ERC20(lendingPool.getReserveData(ticker0)[9]).balanceOf(user) == 0
+
+
 def test_sell_fake_option(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, TokenisableRange, OptionsPositionManager, roerouter):
   lendingPool.PMAssign(pm, {"from": timelock })
   poolId = roerouter.getPoolsLength() - 1
@@ -319,13 +394,13 @@ def test_sell_fake_option(accounts, chain, pm, owner, timelock, lendingPool, wet
 
 
 
-def test_sell_option(pm, user, owner, timelock, lendingPool, weth, usdc, interface, oracle, contracts, TokenisableRange, roerouter):
+def test_sell_option(pm, user, owner, timelock, lendingPool, weth, usdc, interface, oracle, contracts, TokenisableRange, roerouter, gas):
   tr, trb, r = contracts
   lendingPool.PMAssign(pm, {"from": timelock })
   poolId = roerouter.getPoolsLength() - 1
   
   tr = TokenisableRange.at(r.tokenisedTicker(0))
-  pm.sellOptions(poolId, tr, 1e6, 0, {"from": user})
+  gas.record("OptionsPositionManager.sellOptions", pm.sellOptions(poolId, tr, 1e6, 0, {"from": user}))
   oBal = interface.ERC20( lendingPool.getReserveData(tr)[7] ).balanceOf(user)
   assert nearlyEqual( oracle.getAssetPrice(usdc), oracle.getAssetPrice(tr) *  oBal / 1e18)
   
@@ -340,7 +415,7 @@ def test_sell_option(pm, user, owner, timelock, lendingPool, weth, usdc, interfa
   assert nearlyEqual( oBal / 2, interface.ERC20( lendingPool.getReserveData(tr)[7] ).balanceOf(owner))
   
 
-def test_reduce(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, TokenisableRange, prep_ranger, roerouter):
+def test_reduce(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, TokenisableRange, prep_ranger, roerouter, gas):
   tr, trb, r = contracts
   lendingPool.PMAssign(pm, {"from": timelock })
   poolId = roerouter.getPoolsLength() - 1
@@ -376,7 +451,7 @@ def test_reduce(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, u
     pm.close(poolId, user, ticker1, 0, weth, {"from": owner} )
   with brownie.reverts("OPM: Invalid Collateral Asset"):
     pm.close(poolId, user, ticker1, 0, ROUTER, {"from": owner})
-  pm.close(poolId, user, ticker1, borrowAmount / 10, usdc, {"from": owner} )
+  gas.record("OptionsPositionManager.close[soft liquidation]", pm.close(poolId, user, ticker1, borrowAmount / 10, usdc, {"from": owner} ))
   assert lendingPool.getUserAccountData(user)[5] > hf # soft liquidation should increase HF
   #print(lendingPool.getUserAccountData(user))
 
@@ -397,6 +472,7 @@ def test_reduce(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, u
   liquidator = accounts[5] # unused account to check amounts
   liquidationAmount = 1e16
   l = pm.liquidate(poolId, user, [ticker1], [liquidationAmount], usdc, {"from": liquidator} )
+  gas.record("OptionsPositionManager.liquidate", l)
   print('liquidator balances', interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(liquidator), interface.ERC20(lendingPool.getReserveData(weth)[7]).balanceOf(liquidator) )
   print ("liquidator vs liq. value vs liq.fee.%", interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(liquidator), ticker1.latestAnswer() * liquidationAmount / 1e18, interface.ERC20(lendingPool.getReserveData(usdc)[7]).balanceOf(liquidator) * 100 / (ticker1.latestAnswer() * liquidationAmount / 1e18) * 100 )
   # liquidator received liq. fees
@@ -406,6 +482,39 @@ def test_reduce(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, u
   # liquidate several assets at once
   liquidationAmount = 1e16
   l = pm.liquidate(poolId, user, [ticker0, ticker1], [liquidationAmount, liquidationAmount], usdc, {"from": liquidator} )
+  gas.record("OptionsPositionManager.liquidate[2 ticks]", l)
+
+
+def test_liquidate_many(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, maker, interface, contracts, TokenisableRange, prep_ranger, roerouter, gas):
+  tr, trb, r = contracts
+  lendingPool.PMAssign(pm, {"from": timelock })
+  poolId = roerouter.getPoolsLength() - 1
+  ticker0 = TokenisableRange.at(r.tokenisedTicker(0))
+  ticker1 = TokenisableRange.at(r.tokenisedTicker(2))
+  borrowAmount = 1e17
+  interface.ICreditDelegationToken( lendingPool.getReserveData(ticker0)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+  interface.ICreditDelegationToken( lendingPool.getReserveData(ticker1)[9] ).approveDelegation(pm, 2**256-1, {"from": user})
+  pm.buyOptions(poolId, [ticker1], [borrowAmount], [weth], {"from": user})
+  pm.buyOptions(poolId, [ticker0], [borrowAmount], [weth], {"from": user})
+  
+  # same path as test_reduce to bring the user below liquidation threshold
+  chain.sleep(93000000000); chain.mine(1)
+  pm.close(poolId, user, ticker1, borrowAmount / 10, usdc, {"from": owner} )
+  chain.sleep(360000); chain.mine(1);
+  
+  # batch liquidation: one flashloan for all users, healthy accounts are skipped without reverting
+  liquidator = accounts[5]
+  liquidationAmount = 1e16
+  with brownie.reverts('ARRAY_LEN_MISMATCH'):
+    pm.liquidateMany(poolId, [user, maker], [[ticker1]], [[liquidationAmount]], [usdc], {"from": liquidator} )
+  with brownie.reverts('ARRAY_LEN_MISMATCH'):
+    pm.liquidateMany(poolId, [user], [[ticker0, ticker1]], [[liquidationAmount]], [usdc], {"from": liquidator} )
+  debt1 = interface.ERC20(lendingPool.getReserveData(ticker1)[9]).balanceOf(user)
+  l = pm.liquidateMany(poolId, [user, maker], [[ticker0, ticker1], [ticker1]], [[liquidationAmount, liquidationAmount], [liquidationAmount]], [usdc, usdc], {"from": liquidator} )
+  gas.record("OptionsPositionManager.liquidateMany[2 users]", l)
+  assert len(l.events["LiquidatePosition"]) == 2
+  assert l.events["LiquidationSkipped"][0]["user"] == maker
+  assert interface.ERC20(lendingPool.getReserveData(ticker1)[9]).balanceOf(user) < debt1
 
 
 def test_sandwich(accounts, chain, pm, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, contracts, TokenisableRange, prep_ranger, config, OptionsPositionManager, roerouter):
@@ -472,25 +581,32 @@ def test_sandwich(owner, interface, contracts, lendingPool, usdc, weth, Tokenisa
   with brownie.reverts("OPM: Slippage Error"): test.test_checkExpectedBalances(range, 1e18, amount0, amount1)
   
 
-def test_swapTokensForExactTokens(owner, accounts, Test_OptionsPositionManager, usdc, weth, contracts, TokenisableRange, roerouter, router):
+def test_swapTokensForExactTokens(owner, accounts, Test_OptionsPositionManager, usdc, weth, contracts, TokenisableRange, roerouter, router, NullOracle, oracle):
   t = Test_OptionsPositionManager.deploy(roerouter, {"from": owner})
+  nullOracleEth = NullOracle.deploy(weth, {"from": owner})
 
-  with brownie.reverts("OPM: Invalid Swap Amounts"): t.test_swapTokensForExactTokens(router, 1e18, 1e6, [usdc, weth], {"from": owner})
-  with brownie.reverts("OPM: Insufficient Token Amount"): t.test_swapTokensForExactTokens(router, 1e18, 1e12, [usdc, weth], {"from": owner})
-  # swap succeeds
+  with brownie.reverts("OPM: Insufficient Token Amount"): t.test_swapTokensForExactTokens(router, oracle, 1e18, 1e12, [usdc, weth], {"from": owner})
   usdc.transfer(t, 1e7, {"from": owner})
-  t.test_swapTokensForExactTokens(router, 1e15, 1e7, [usdc, weth], {"from": owner})
+  with brownie.reverts("OPM: Invalid Oracle Price"): t.test_swapTokensForExactTokens(router, nullOracleEth, 1e15, 1e7, [usdc, weth], {"from": owner})
+  # no quote beforehand, the router reverts if the max amount, capped to the balance and the oracle value, isn't enough
+  with brownie.reverts(): t.test_swapTokensForExactTokens(router, oracle, 1e18, 1e6, [usdc, weth], {"from": owner})
+  with brownie.reverts(): t.test_swapTokensForExactTokens(router, oracle, 1e18, 1e12, [usdc, weth], {"from": owner})
+  # the whole balance is allowed, but the swap can't spend more than 1% over the oracle value
+  oracleAmount = t.test_getOracleAmount(oracle, weth, 1e15, usdc)
+  t.test_swapTokensForExactTokens(router, oracle, 1e15, 1e7, [usdc, weth], {"from": owner})
   assert weth.balanceOf(t) == 1e15
+  assert 1e7 - usdc.balanceOf(t) <= oracleAmount * 101 // 100 + 1
   
   
-def test_getTargetAmountFromOracle(owner, accounts, Test_OptionsPositionManager, usdc, weth, contracts, TokenisableRange, roerouter, router, NullOracle, oracle):
+def test_getOracleAmount(owner, accounts, Test_OptionsPositionManager, usdc, weth, contracts, TokenisableRange, roerouter, router, NullOracle, oracle):
   t = Test_OptionsPositionManager.deploy(roerouter, {"from": owner})
   nullOracleUsd = NullOracle.deploy(usdc, {"from": owner})
   nullOracleEth = NullOracle.deploy(weth, {"from": owner})
 
-  with brownie.reverts("OPM: Invalid Oracle Price"): t.test_getTargetAmountFromOracle(nullOracleUsd, weth, 1e18, usdc)
-  with brownie.reverts("OPM: Invalid Oracle Price"): t.test_getTargetAmountFromOracle(nullOracleEth, weth, 1e18, usdc)
-  with brownie.reverts("OPM: Target Amount Too Low"): t.test_getTargetAmountFromOracle(oracle, weth, 1, usdc)
+  with brownie.reverts("OPM: Invalid Oracle Price"): t.test_getOracleAmount(nullOracleUsd, weth, 1e18, usdc)
+  with brownie.reverts("OPM: Invalid Oracle Price"): t.test_getOracleAmount(nullOracleEth, weth, 1e18, usdc)
+  # dust rounds down to 0
+  assert t.test_getOracleAmount(oracle, weth, 1, usdc) == 0
   
-  res = t.test_getTargetAmountFromOracle(oracle, weth, 1e18, usdc)
+  res = t.test_getOracleAmount(oracle, weth, 1e18, usdc)
   assert nearlyEqual(res * oracle.getAssetPrice(usdc) / 1e6, oracle.getAssetPrice(weth))
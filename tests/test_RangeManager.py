@@ -1,5 +1,7 @@
 import pytest, brownie
 import math
+from scripts import gas_benchmark
+from scripts.uniswap_math import get_sqrt_ratio_at_tick, get_amounts_for_liquidity, get_liquidity_for_amounts
 
 
 # CONSTANTS
@@ -97,34 +99,21 @@ def seed_accounts( weth, usdc, user, owner, lendingPool, accounts):
 
   
 @pytest.fixture(scope="module", autouse=True)
-def contracts(owner, Strings, TickMath, TokenisableRange, UpgradeableBeacon, RangeManager, lendingPool, router, weth, usdc):
-  Strings.deploy({"from": owner})
-  TickMath.deploy({"from": owner})
-  tr = TokenisableRange.deploy({"from": owner})
-  trb = UpgradeableBeacon.deploy(tr, {"from": owner})
+def contracts(owner, world, RangeManager, lendingPool, router, weth, usdc):
   r = RangeManager.deploy(lendingPool, usdc, weth, {"from": owner})
-  yield tr, trb, r
+  yield world.trImplementation, world.trBeacon, r
 
 
-# calc range values for uni v3: https://docs.google.com/spreadsheets/d/1EXqXeXysknbib3_WbUB-lGGknBjxJvt4/edit#gid=385415845
-# OR return values from https://app.uniswap.org/#/add/ETH/0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48/3000?chain=mainnet&maxPrice=2000&minPrice=1600
+# Amounts of a TokenisableRange position worth about 1 USDC at the pool price, from the exact port of the range math
 @pytest.fixture(scope="module", autouse=True)
-def liquidityRatio(interface, usdc, weth):
-  def liqRatio(rangeLow, rangeHigh):
-    pool = interface.IUniswapV3Factory("0x1F98431c8aD98523631AE4a59f267346ea31F984").getPool(usdc, weth, 3000)
-    sqrtPriceX96 = interface.IUniswapV3Pool(pool).slot0()[0]
-    price = ( 2 ** 192 / sqrtPriceX96 ** 2 ) * 1e12 # 1e12 because decimal difference between WETH and USDC
-    if price < rangeLow: price = rangeLow
-    if price > rangeHigh: price = rangeHigh
-    priceSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(price)) * 2 / math.log(1.0001)))
-    priceLowSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeLow)) * 2 / math.log(1.0001)))
-    priceHighSqrt = math.sqrt( math.pow(1.0001, -math.log(math.sqrt(rangeHigh)) * 2 / math.log(1.0001)))
-    if priceSqrt == priceLowSqrt: return 0, 1e18 / rangeLow
-    relation = (priceSqrt-priceHighSqrt) / ( (1/priceSqrt) - (1/priceLowSqrt) )
-    lpAmount = 1
-    usdAmount = lpAmount / ( 1 + relation * price ) 
-    ethAmount = relation * usdAmount
-    return usdAmount * 1e6, ethAmount * 1e18
+def liquidityRatio(interface):
+  def liqRatio(tr):
+    sqrtPriceX96 = interface.IUniswapV3Pool(tr.uniswapPool()).slot0()[0]
+    sqrtRatioLowerX96, sqrtRatioUpperX96 = tr.sqrtRatioLowerX96(), tr.sqrtRatioUpperX96()
+    # value of a reference liquidity in USDC units, WETH valued at the pool price
+    amount0, amount1 = get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18)
+    value = amount0 + amount1 * 2**192 // sqrtPriceX96**2
+    return get_amounts_for_liquidity(sqrtPriceX96, sqrtRatioLowerX96, sqrtRatioUpperX96, 10**18 * 10**6 // value)
   yield liqRatio
 
 
@@ -192,10 +181,10 @@ def test_TT_tickerBelow(accounts, owner, lendingPool, weth, usdc, user, interfac
   
   
 # Create a Ranger range with price within boundaries (spot price: 1268, lower bound 500, higher bound 5000)
-def test_TR(accounts, owner, lendingPool, weth, usdc, user, interface, router, routerV3, oracle, TokenisableRange, liquidityRatio):
-  usdAmount, ethAmount = liquidityRatio(RANGE_LIMITS[0], RANGE_LIMITS[4]) 
+def test_TR(accounts, owner, lendingPool, weth, usdc, user, interface, router, routerV3, oracle, TokenisableRange, liquidityRatio, gas):
   tr = TokenisableRange.deploy({"from": owner})
   tr.initProxy(oracle, usdc, weth, RANGE_LIMITS[0]*1e10, RANGE_LIMITS[4]*1e10, "500", "5000", False)
+  usdAmount, ethAmount = liquidityRatio(tr)
   
   with brownie.reverts("!InitProxy"): 
     tr.initProxy(oracle, usdc, weth, 500*1e10, 5000*1e10, "500", "1500", True)
@@ -205,16 +194,21 @@ def test_TR(accounts, owner, lendingPool, weth, usdc, user, interface, router, r
   with brownie.reverts(): tr.init(0, 1e16, {"from": owner}) # Uniswap throws: unbalanced liquidity added
   tr.init(usdAmount, ethAmount, {"from": owner})
   
-  #test liquidity
-  liq0, liq1 = tr.getTokenAmounts(tr.balanceOf(owner))
-  assert abs(liq0 - usdAmount ) <= 10 and abs(liq1 - ethAmount) <= 1e13 # less than 10 unit diff from rounding, usd decimals = 6 and eth decimals = 18
+  #test liquidity, exact from the off-chain port of the range math
+  sqrtPriceX96 = interface.IUniswapV3Pool(tr.uniswapPool()).slot0()[0]
+  assert tr.liquidity() == get_liquidity_for_amounts(sqrtPriceX96, tr.sqrtRatioLowerX96(), tr.sqrtRatioUpperX96(), usdAmount, ethAmount)
+  assert tr.getTokenAmountsExcludingFees(tr.totalSupply()) == get_amounts_for_liquidity(sqrtPriceX96, tr.sqrtRatioLowerX96(), tr.sqrtRatioUpperX96(), tr.liquidity())
   
   with brownie.reverts(): tr.deposit(0, 1e16, {"from": owner})
-  tr.deposit(usdAmount, ethAmount, {"from": owner})
+  gas.record("TokenisableRange.deposit", tr.deposit(usdAmount, ethAmount, {"from": owner}))
 
   # withdraw with no fees in pool
-  tr.withdraw( tr.balanceOf(owner)/2, 0, 0, {"from": owner})
-  tr.claimFee()  #no fees to claim
+  gas.record("TokenisableRange.withdraw", tr.withdraw( tr.balanceOf(owner)/2, 0, 0, {"from": owner}))
+  tx = tr.claimFee()  #no fees to claim
+  assert tr.lastClaimBlock() == tx.block_number
+  # no vault in testing, fees go to treasury and nothing is cached
+  tr.refreshFeeVault()
+  assert tr.feeVault() == "0x0000000000000000000000000000000000000000"
   
   # create fees by swapping
   usdc.approve(routerV3, 2**256-1, {"from": owner} )
@@ -226,7 +220,7 @@ def test_TR(accounts, owner, lendingPool, weth, usdc, user, interface, router, r
   wethTreasuryBal = weth.balanceOf(treasury)
   print('treasury bals', usdcTreasuryBal, wethTreasuryBal)
   # check fees
-  tr.claimFee()
+  gas.record("TokenisableRange.claimFee", tr.claimFee())
   print(tr.fee0(), tr.fee1())
   usdcTreasuryBal = usdc.balanceOf(treasury)
   wethTreasuryBal = weth.balanceOf(treasury)
@@ -235,16 +229,126 @@ def test_TR(accounts, owner, lendingPool, weth, usdc, user, interface, router, r
   with brownie.reverts("ERC20: burn amount exceeds balance"): tr.withdraw( tr.balanceOf(owner)+1, 0, 0, {"from": owner})
   tr.withdraw( tr.balanceOf(owner)/2, 0, 0, {"from": owner})
   tr.withdraw( tr.balanceOf(owner), 0, 0, {"from": owner})
+  # withdrawals collect the removed liquidity and the fees at once: fees go to the treasury, nothing is left in the TR
+  assert usdc.balanceOf(tr) == 0 and weth.balanceOf(tr) == 0
   # should be left with very little, try compounding fees
   tr.claimFee()
 
 
 
+def test_TR_cached_parameters(owner, weth, usdc, interface, oracle, TokenisableRange, liquidityRatio):
+  tr = TokenisableRange.deploy({"from": owner})
+  with brownie.reverts("!InitProxy"): tr.cacheRangeParameters({"from": owner})
+  tr.initProxy(oracle, usdc, weth, RANGE_LIMITS[0]*1e10, RANGE_LIMITS[4]*1e10, "500", "5000", False)
+  assert tr.uniswapPool() == interface.IUniswapV3Factory(tr.V3_FACTORY()).getPool(usdc, weth, 500)
+  assert tr.sqrtRatioLowerX96() == get_sqrt_ratio_at_tick(tr.lowerTick())
+  assert tr.sqrtRatioUpperX96() == get_sqrt_ratio_at_tick(tr.upperTick())
+  
+  # recaching doesnt change values
+  lower = tr.sqrtRatioLowerX96()
+  tr.cacheRangeParameters({"from": owner})
+  assert tr.sqrtRatioLowerX96() == lower
+
+
+def test_TR_compounding(owner, user, weth, usdc, routerV3, oracle, TokenisableRange, liquidityRatio, chain):
+  tr = TokenisableRange.deploy({"from": owner})
+  tr.initProxy(oracle, usdc, weth, RANGE_LIMITS[0]*1e10, RANGE_LIMITS[4]*1e10, "500", "5000", False)
+  usdAmount, ethAmount = liquidityRatio(tr)
+  usdc.approve(tr, 2**256-1, {"from": owner})  
+  weth.approve(tr, 2**256-1, {"from": owner})
+  tr.init(usdAmount, ethAmount, {"from": owner})
+  tr.deposit(usdAmount * 1000, ethAmount * 1000, {"from": owner})
+  with brownie.reverts("Unallowed call"): tr.setCompounding(True, 3600, {"from": user})
+  tr.setCompounding(True, 3600, {"from": owner})
+  assert tr.isCompounding() == True
+  
+  # tokens sent to the TR aren't counted as fees, nor in its price
+  price = tr.latestAnswer()
+  usdc.transfer(tr, 1e6, {"from": owner})
+  tr.claimFee({"from": user})
+  assert tr.fee0() == 0 and tr.latestAnswer() == price
+  
+  # create fees by swapping
+  usdc.approve(routerV3, 2**256-1, {"from": owner} )
+  weth.approve(routerV3, 2**256-1, {"from": owner} )
+  swap = lambda: (
+    routerV3.exactInputSingle([usdc, weth, 500, owner, 2e20, 1e10, 0, 0], {"from": owner}),
+    routerV3.exactInputSingle([weth, usdc, 500, owner, 2e20, 1e18, 0, 0], {"from": owner})
+  )
+  swap()
+  
+  # fees are compounded into the liquidity, then held until the interval passed
+  liquidity = tr.liquidity()
+  tr.claimFee({"from": user})
+  assert tr.liquidity() > liquidity
+  liquidity = tr.liquidity()
+  swap()
+  tr.claimFee({"from": user})
+  assert tr.liquidity() == liquidity and tr.fee0() > 0
+  chain.sleep(3601)
+  tr.claimFee({"from": user})
+  assert tr.liquidity() > liquidity
+  
+  # withdrawing includes the share of held fees
+  fee0 = tr.fee0()
+  half = tr.balanceOf(owner) / 2
+  tr.withdraw(half, 0, 0, {"from": owner})
+  assert tr.fee0() <= fee0 / 2 + 1
+
+
+# RangeBatcher against one call per TR, on 5, 10 and 20 tickers around the price
+# GeVault.removeFromAllRanges withdraws tick by tick: its cost is recorded by GeVault.rebalance[ticks=n] in test_GeVault.py
+@pytest.mark.skip_coverage
+def test_range_batcher_gas(owner, weth, usdc, oracle, RangeBatcher, TokenisableRange, liquidityRatio, gas):
+  trs = []
+  for p in range(1170, 1370, 10):
+    t = TokenisableRange.deploy({"from": owner})
+    t.initProxy(oracle, usdc, weth, p * 1e10, p * 1.0001 * 1e10, p, p * 1.0001, True, {"from": owner})
+    usdAmount, ethAmount = liquidityRatio(t)
+    usdc.approve(t, 2**256-1, {"from": owner})
+    weth.approve(t, 2**256-1, {"from": owner})
+    t.init(usdAmount, ethAmount, {"from": owner})
+    trs.append(t)
+  batcher = RangeBatcher.deploy({"from": owner})
+  usdc.approve(batcher, 2**256-1, {"from": owner})
+  weth.approve(batcher, 2**256-1, {"from": owner})
+  for t in trs: t.approve(batcher, 2**256-1, {"from": owner})
+  
+  results = []
+  for n in [5, 10, 20]:
+    amounts = [t.getTokenAmountsExcludingFees(t.totalSupply() / 10) for t in trs[:n]]
+    n0 = [a[0] for a in amounts]
+    n1 = [a[1] for a in amounts]
+    # only execution gas is compared: the loop would otherwise pay 21k intrinsic gas per call that a contract caller doesnt
+    loopDeposit = 0
+    loopWithdraw = 0
+    for k in range(n): 
+      loopDeposit += gas_benchmark.execution_gas(trs[k].deposit(n0[k], n1[k], {"from": owner}))
+    for k in range(n):
+      loopWithdraw += gas_benchmark.execution_gas(trs[k].withdraw(trs[k].balanceOf(owner) - 10**18, 0, 0, {"from": owner}))
+    
+    tx = batcher.depositMany(trs[:n], n0, n1, {"from": owner})
+    lps = tx.return_value
+    batchDeposit = gas_benchmark.execution_gas(tx)
+    batchWithdraw = gas_benchmark.execution_gas(batcher.withdrawMany(trs[:n], lps, 0, 0, {"from": owner}))
+    # the batcher keeps nothing
+    assert all(t.balanceOf(batcher) == 0 for t in trs[:n])
+    assert usdc.balanceOf(batcher) == 0 and weth.balanceOf(batcher) == 0
+    gas.record(f"TokenisableRange.deposit[loop={n}]", loopDeposit)
+    gas.record(f"RangeBatcher.depositMany[n={n}]", batchDeposit)
+    gas.record(f"TokenisableRange.withdraw[loop={n}]", loopWithdraw)
+    gas.record(f"RangeBatcher.withdrawMany[n={n}]", batchWithdraw)
+    results.append((n, loopDeposit, batchDeposit, loopWithdraw, batchWithdraw))
+  
+  print("ticks | loop deposit | batch deposit | loop withdraw | batch withdraw (execution gas)")
+  for r in results: print(" | ".join(str(x) for x in r))
+
+
 # Check that token inflation isnt possible by depositing assets in the underlying NFT
 def test_TR_inflation(accounts, owner, lendingPool, weth, usdc, user, interface, router, routerV3, oracle, TokenisableRange, liquidityRatio):
-  usdAmount, ethAmount = liquidityRatio(RANGE_LIMITS[0], RANGE_LIMITS[4]) 
   tr = TokenisableRange.deploy({"from": owner})
   tr.initProxy(oracle, usdc, weth, RANGE_LIMITS[0]*1e10, RANGE_LIMITS[4]*1e10, "500", "5000", False)
+  usdAmount, ethAmount = liquidityRatio(tr)
         
   usdc.approve(tr, 2**256-1, {"from": owner})  
   weth.approve(tr, 2**256-1, {"from": owner})
@@ -286,7 +390,7 @@ def test_ranger_overlap(user, owner, RangeManager, lendingPool, usdc, weth, rout
 
 # Create tickers and rangers with various prices through the Range manager, and add them to the lending pool for further testing
 @pytest.fixture(scope="module", autouse=True)
-def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, config, contracts, TokenisableRange,seed_accounts,liquidityRatio):
+def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interface, router, oracle, config, contracts, TokenisableRange,seed_accounts,liquidityRatio, init_reserves):
   tr, trb, r = contracts
 
   ranges = [ [RANGE_LIMITS[0], RANGE_LIMITS[1]], [RANGE_LIMITS[1], RANGE_LIMITS[2]], [RANGE_LIMITS[2], RANGE_LIMITS[3]] ]
@@ -300,29 +404,20 @@ def prep_ranger(accounts, owner, timelock, lendingPool, weth, usdc, user, interf
   usdc.approve(r, 2**256-1, {"from": owner})
 
   for i in range(numRanges):
-    usdAmount, ethAmount = liquidityRatio( ranges[i][0], ranges[i][1])  
-    r.initRange(r.tokenisedRanges(i), usdAmount, ethAmount, {"from": owner})
-    usdAmount, ethAmount = liquidityRatio( (ranges[i][0]+ranges[i][1])/2,(ranges[i][0]+ranges[i][1])/2 + 1)
-    r.initRange(r.tokenisedTicker(i), usdAmount, ethAmount, {"from": owner})  
+    for t in [TokenisableRange.at(r.tokenisedRanges(i)), TokenisableRange.at(r.tokenisedTicker(i))]:
+      usdAmount, ethAmount = liquidityRatio(t)
+      r.initRange(t, usdAmount, ethAmount, {"from": owner})
+      sqrtPriceX96 = interface.IUniswapV3Pool(t.uniswapPool()).slot0()[0]
+      assert t.liquidity() == get_liquidity_for_amounts(sqrtPriceX96, t.sqrtRatioLowerX96(), t.sqrtRatioUpperX96(), usdAmount, ethAmount)
   
   # Load all into Oracle
   addresses = [r.tokenisedRanges(i) for i in range(3)] + [r.tokenisedTicker(i) for i in range(3)]
   oracle.setAssetSources( addresses, addresses, {"from": timelock}) 
 
   # Load all into Lending Pool
-  theta_A = "0x78b787C1533Acfb84b8C76B7e5CFdfe80231Ea2D" # matic "0xb54240e3F2180A0E14CE405A089f600dc2D8457c"
-  theta_stbDebt = "0x8B6Ab2f071b27AC1eEbFfA973D957A767b15b2DB" # matic "0x92ED25161bb90eb0026e579b60B8D96eE3b7A15F"
-  theta_varDebt = "0xB19Dd5DAD35af36CF2D80D1A9060f1949b11fCb0" # matic "0x51b89b9e24bc85d6756571032B8bf5660Bf6FbE5"
-  theta_100bps_fixed = "0xfAdB757A7BC3031285417d7114EFD58598E21d79" # "0xEdFbbeDdc3CB3271fd60E90E184B151C76Cd88aB"
-
-  reserves = []
-  for i in addresses:
-      sym = TokenisableRange.at(i).symbol()
-      name = TokenisableRange.at(i).name()
-      reserves.append( [theta_A, theta_stbDebt, theta_varDebt, 18, theta_100bps_fixed, i, owner.address, NULL, sym, "Roe " + name, "roe"+sym, "Roe variable debt bearing " + name, "vd"+sym, "Roe stable debt bearing " + name, "sd" + sym, ""] )
   lpadd = interface.ILendingPoolAddressesProvider(LENDING_POOL_ADDRESSES_PROVIDER)
   poolAdmin = accounts.at(lpadd.getPoolAdmin(), force=True)
-  for i in reserves: config.batchInitReserve([i], {"from": poolAdmin})
+  init_reserves(config, addresses, poolAdmin)
 
   # Enable as collateral
   for i in addresses:
@@ -351,6 +446,30 @@ def test_ranges_values(owner, lendingPool, weth, usdc, user, interface, oracle,
   assert TokenisableRange.at(r.tokenisedTicker(0)).returnExpectedBalance(1e8, 300e8)[0] == 0 
   
 
+# Batch valuation matches single valuations
+def test_ranges_values_batch(owner, oracle, contracts, TokenisableRange, RangeLens, prep_ranger):
+  tr, trb, r = contracts
+  trs = [r.tokenisedRanges(i) for i in range(3)] + [r.tokenisedTicker(i) for i in range(3)]
+  prices0 = [1e8, 1e8, 1e8, 0]
+  prices1 = [300e8, 1500e8, 4000e8, 0]
+  for t in trs:
+    t = TokenisableRange.at(t)
+    values, amounts0, amounts1 = t.getValuesPerLPAtPrices(prices0, prices1)
+    for k in range(3):
+      assert values[k] == t.getValuePerLPAtPrice(prices0[k], prices1[k])
+      (amt0, amt1) = t.returnExpectedBalance(prices0[k], prices1[k])
+      assert amounts0[k] == amt0 * 10**18 // t.totalSupply() and amounts1[k] == amt1 * 10**18 // t.totalSupply()
+    # zero prices default to oracle
+    assert values[3] == t.latestAnswer()
+  with brownie.reverts("Invalid lengths"): TokenisableRange.at(trs[0]).getValuesPerLPAtPrices([1e8], [])
+  
+  lens = RangeLens.deploy({"from": owner})
+  assert lens.getLatestAnswers(trs) == [TokenisableRange.at(t).latestAnswer() for t in trs]
+  values, amounts0, amounts1 = lens.getValuesPerLPAtPrices(trs, prices0, prices1)
+  for i in range(len(trs)):
+    assert values[i] == TokenisableRange.at(trs[i]).getValuesPerLPAtPrices(prices0, prices1)[0]
+
+
 # Test invalid step
 def test_ranger_invalidstep(owner, lendingPool, weth, usdc, user, interface, capsys, oracle, contracts, TokenisableRange, prep_ranger):
   tr, trb, r = contracts
@@ -358,20 +477,20 @@ def test_ranger_invalidstep(owner, lendingPool, weth, usdc, user, interface, cap
 
 
 # Test deposit/withdraw in ticker through RangeManager (which automatically deposits in the lendingPool)
-def test_deposit_withdraw_ticker(timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, prep_ranger):
+def test_deposit_withdraw_ticker(timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, prep_ranger, gas):
   tr, trb, r = contracts
   lendingPool.PMAssign(r, {"from": timelock})
   
   # Deposit/withdraw in ticker below 
   usdAmount = 10e6
-  r.transferAssetsIntoTickerStep(0, usdAmount, 0, {"from":user}) 
+  gas.record("RangeManager.transferAssetsIntoTickerStep", r.transferAssetsIntoTickerStep(0, usdAmount, 0, {"from":user}))
   t = interface.IAToken( lendingPool.getReserveData(r.tokenisedTicker(0))[7] )
   print( oracle.getAssetPrice(r.tokenisedTicker(0)) * t.balanceOf(user) / 1e18, oracle.getAssetPrice(usdc) * usdAmount / 1e6)
   assert nearlyEqual(
     oracle.getAssetPrice(r.tokenisedTicker(0)) * t.balanceOf(user) / 1e18, 
     oracle.getAssetPrice(usdc) * usdAmount / 1e6
   )
-  r.removeAssetsFromStep(0, {"from":user})
+  gas.record("RangeManager.removeAssetsFromStep[ticker]", r.removeAssetsFromStep(0, {"from":user}))
   assert t.balanceOf(user) == 0  
   
   # Deposit/withdraw in ticker above 
@@ -387,11 +506,11 @@ def test_deposit_withdraw_ticker(timelock, lendingPool, weth, usdc, user, interf
 
 
 # Test deposit/withdraw in ranger through RangeManager
-def test_deposit_withdraw_ranger(owner, timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, prep_ranger, liquidityRatio):
+def test_deposit_withdraw_ranger(owner, timelock, lendingPool, weth, usdc, user, interface, oracle, contracts, TokenisableRange, prep_ranger, liquidityRatio, gas):
   tr, trb, r = contracts
   lendingPool.PMAssign(r, {"from": timelock})
 
-  usdAmount, ethAmount = liquidityRatio(RANGE_LIMITS[1], RANGE_LIMITS[2])
+  usdAmount, ethAmount = liquidityRatio(TokenisableRange.at(r.tokenisedRanges(1)))
   print('test_ranger_deposit_withdraw, amounts', usdAmount, ethAmount)
   
   # Deposit/withdraw in ranger above
@@ -419,9 +538,10 @@ def test_deposit_withdraw_ranger(owner, timelock, lendingPool, weth, usdc, user,
   # Deposit/withdraw in active range
   step = 1
   t = interface.IAToken( lendingPool.getReserveData(r.tokenisedRanges(step))[7] )
-  r.transferAssetsIntoRangerStep(step, usdAmount, ethAmount, {"from":user})
+  gas.record("RangeManager.transferAssetsIntoRangerStep", r.transferAssetsIntoRangerStep(step, usdAmount, ethAmount, {"from":user}))
   ownerRoeBal = t.balanceOf(owner)
-  r.transferAssetsIntoRangerStep(step, usdAmount, ethAmount, {"from":user})
+  # second deposit first withdraws the existing position
+  gas.record("RangeManager.transferAssetsIntoRangerStep[existing]", r.transferAssetsIntoRangerStep(step, usdAmount, ethAmount, {"from":user}))
   # transferAssetsIntoRangerStep withdraws previously exisiting liquidity before adding new liquidity and owner balance shouldn't change
   assert ownerRoeBal == t.balanceOf(owner)
   
@@ -437,7 +557,7 @@ def test_deposit_withdraw_ranger(owner, timelock, lendingPool, weth, usdc, user,
 def test_proxy_upgrade(owner, timelock, lendingPool, weth, usdc, user, interface, contracts, TokenisableRange, prep_ranger, liquidityRatio):
   tr, trb, r = contracts
   lendingPool.PMAssign(r, {"from": timelock})
-  usdAmount, ethAmount = liquidityRatio(RANGE_LIMITS[1], RANGE_LIMITS[2])
+  usdAmount, ethAmount = liquidityRatio(TokenisableRange.at(r.tokenisedRanges(1)))
   r.transferAssetsIntoRangerStep(1, usdAmount, ethAmount, {"from":owner})
   ownerBal = TokenisableRange.at(r.tokenisedRanges(1)).balanceOf(owner)
   ownerRoeBal = interface.IAToken( lendingPool.getReserveData(r.tokenisedRanges(1))[7] ).balanceOf(owner)
@@ -105,13 +105,9 @@ def seed_accounts(interface, weth, wbtc, usdc, user, owner, lendingPool, account
     #print(e)
   
 @pytest.fixture(scope="module", autouse=True)
-def contracts(owner, Strings, TickMath, TokenisableRange, UpgradeableBeacon, RangeManager, lendingPool, router, wbtc, usdc):
-  Strings.deploy({"from": owner})
-  TickMath.deploy({"from": owner})
-  tr = TokenisableRange.deploy({"from": owner})
-  trb = UpgradeableBeacon.deploy(tr, {"from": owner})
+def contracts(owner, world, RangeManager, lendingPool, router, wbtc, usdc):
   r = RangeManager.deploy(lendingPool, wbtc, usdc, {"from": owner})
-  yield tr, trb, r
+  yield world.trImplementation, world.trBeacon, r
 
 
 # calc range values for uni v3: https://docs.google.com/spreadsheets/d/1EXqXeXysknbib3_WbUB-lGGknBjxJvt4/edit#gid=385415845
@@ -216,7 +212,7 @@ def test_ranger_overlap(owner, RangeManager, lendingPool, usdc, wbtc, router, To
 
 
 @pytest.fixture(scope="module", autouse=True)
-def prep_ranger(accounts, owner, timelock, lendingPool, wbtc, usdc, user, interface, router, oracle, config, contracts, TokenisableRange,seed_accounts,liquidityRatio):
+def prep_ranger(accounts, owner, timelock, lendingPool, wbtc, usdc, user, interface, router, oracle, config, contracts, TokenisableRange,seed_accounts,liquidityRatio, init_reserves):
   tr, trb, r = contracts
 
   ranges = [ [1/RANGE_LIMITS[3], 1/RANGE_LIMITS[2]], [1/RANGE_LIMITS[2], 1/RANGE_LIMITS[1]], [1/RANGE_LIMITS[1], 1/RANGE_LIMITS[0]] ]
@@ -238,18 +234,8 @@ def prep_ranger(accounts, owner, timelock, lendingPool, wbtc, usdc, user, interf
   oracle.setAssetSources( addresses, addresses, {"from": timelock}) 
 
   # Load all into Lending Pool
-  theta_A = "0x78b787C1533Acfb84b8C76B7e5CFdfe80231Ea2D" # matic "0xb54240e3F2180A0E14CE405A089f600dc2D8457c"
-  theta_stbDebt = "0x8B6Ab2f071b27AC1eEbFfA973D957A767b15b2DB" # matic "0x92ED25161bb90eb0026e579b60B8D96eE3b7A15F"
-  theta_varDebt = "0xB19Dd5DAD35af36CF2D80D1A9060f1949b11fCb0" # matic "0x51b89b9e24bc85d6756571032B8bf5660Bf6FbE5"
-  theta_100bps_fixed = "0xfAdB757A7BC3031285417d7114EFD58598E21d79" # "0xEdFbbeDdc3CB3271fd60E90E184B151C76Cd88aB"
-
-  reserves = []
-  for i in addresses:
-      sym = TokenisableRange.at(i).symbol()
-      name = TokenisableRange.at(i).name()
-      reserves.append( [theta_A, theta_stbDebt, theta_varDebt, 18, theta_100bps_fixed, i, owner.address, NULL, sym, "Roe " + name, "roe"+sym, "Roe variable debt bearing " + name, "vd"+sym, "Roe stable debt bearing " + name, "sd" + sym, ""] )
-
-  for i in reserves: config.batchInitReserve([i], {"from": timelock})
+
+  init_reserves(config, addresses, timelock)
 
   # Enable as collateral
   for i in addresses: config.configureReserveAsCollateral(i, 9250, 9500, 10300, {"from":owner, "required_confs":0})
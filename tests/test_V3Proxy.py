@@ -0,0 +1,76 @@
+import pytest, brownie
+
+
+# CONSTANTS
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+ROUTERV3 = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
+QUOTER = "0xb27308f9F90D607463bb33eA1BeBb41C27CE5AB6"
+UNISWAPPOOLV3 = "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640" # ETH univ3 ETH-USDC 0.05%
+
+
+@pytest.fixture(scope="module", autouse=True)
+def weth(interface, accounts):
+  # Claim WETH from MATIC-Aave pool
+  aaveWETH = accounts.at("0x28424507fefb6f7f8e9d3860f56504e4e5f5f390", force=True)
+  weth = interface.ERC20(WETH, owner=aaveWETH)
+  yield weth
+
+@pytest.fixture(scope="module", autouse=True)
+def usdc(interface, accounts):
+  # Claim USDC from Stargate stake account
+  stargate = accounts.at("0x1205f31718499dBf1fCa446663B532Ef87481fe1", force=True)
+  usdc  = interface.ERC20(USDC, owner=stargate)
+  yield usdc
+
+@pytest.fixture(scope="module", autouse=True)
+def proxy(V3Proxy, owner):
+  proxy = V3Proxy.deploy(ROUTERV3, QUOTER, 500, {"from": owner})
+  yield proxy
+
+@pytest.fixture(autouse=True)
+def isolation(fn_isolation):
+    pass
+
+
+# Check if 2 values are within 1%
+def nearlyEqual(value0, value1):
+  if (value1 == 0): return value1 == value0
+  else: return abs (value0-value1) / value1 < 0.01
+
+
+def test_estimate(proxy, usdc, weth):
+  # small amounts have negligible price impact: the estimate is close to the Quoter
+  quoted = proxy.getAmountsOut.call(1000e6, [usdc, weth])
+  assert nearlyEqual(proxy.estimateAmountsOut(1000e6, [usdc, weth])[1], quoted[1])
+  quoted = proxy.getAmountsOut.call(1e18, [weth, usdc])
+  assert nearlyEqual(proxy.estimateAmountsOut(1e18, [weth, usdc])[1], quoted[1])
+  quoted = proxy.getAmountsIn.call(1e18, [usdc, weth])
+  assert nearlyEqual(proxy.estimateAmountsIn(1e18, [usdc, weth])[0], quoted[0])
+  with brownie.reverts("Direct swap only"): proxy.estimateAmountsOut(1e6, [usdc, weth, usdc])
+  with brownie.reverts("Invalid pool"): proxy.estimateAmountsOut(1e6, [usdc, usdc])
+
+
+def test_swap_with_limit(proxy, usdc, weth, interface, user, chain, gas):
+  usdc.transfer(user, 1e10)
+  usdc.approve(proxy, 2**256-1, {"from": user})
+  usdcBal = usdc.balanceOf(user)
+  wethBal = weth.balanceOf(user)
+
+  # no limit: whole amount is swapped
+  tx = proxy.swapExactTokensForTokensWithLimit(1e9, 0, [usdc, weth], user, chain.time() + 100, 0, {"from": user})
+  gas.record("V3Proxy.swapExactTokensForTokensWithLimit", tx)
+  assert tx.return_value[0] == 1e9
+  assert usdc.balanceOf(user) == usdcBal - 1e9
+  assert weth.balanceOf(user) == wethBal + tx.return_value[1]
+  with brownie.reverts("Swap to self only"):
+    proxy.swapExactTokensForTokensWithLimit(1e9, 0, [usdc, weth], proxy, chain.time() + 100, 0, {"from": user})
+
+  # USDC to WETH lowers the pool price: a limit right below the current price stops the swap, the rest is sent back
+  usdcBal = usdc.balanceOf(user)
+  sqrtPriceX96 = interface.IUniswapV3Pool(UNISWAPPOOLV3).slot0()[0]
+  tx = proxy.swapExactTokensForTokensWithLimit(5e9, 0, [usdc, weth], user, chain.time() + 100, sqrtPriceX96 - 1, {"from": user})
+  assert tx.return_value[0] < 5e9
+  assert usdc.balanceOf(user) == usdcBal - tx.return_value[0]
+  assert usdc.balanceOf(proxy) == 0
+  assert interface.IUniswapV3Pool(UNISWAPPOOLV3).slot0()[0] >= sqrtPriceX96 - 1
@@ -0,0 +1,20 @@
+import pytest
+
+
+# EIP-170: deployed code is limited to 24576 bytes, with brownie's default optimizer settings (enabled, 200 runs)
+MAX_CODE_SIZE = 24576
+
+
+# Library placeholders in unlinked bytecode take the same 20 bytes as the linked address
+def codeSize(container):
+  code = container._build["deployedBytecode"]
+  if code.startswith("0x"): code = code[2:]
+  return len(code) // 2
+
+
+@pytest.mark.parametrize("name", ["GeVault", "TokenisableRange", "OptionsPositionManager", "RangeManager"])
+def test_contract_size(name, request):
+  container = request.getfixturevalue(name)
+  size = codeSize(container)
+  print(name, size, "bytes")
+  assert size <= MAX_CODE_SIZE
@@ -0,0 +1,47 @@
+import sys, pytest
+from scripts.gas_benchmark import main, GasReport, compare, regressions, new_entries, format_deltas, load, save, intrinsic_gas, execution_gas
+
+
+def test_compare():
+  baseline = {"a": 1000, "b": 1000, "c": 1000, "d": 1000}
+  current = {"a": 1010, "b": 1100, "c": 900, "e": 500}
+  deltas = {d.entry: d for d in compare(baseline, current, 0.02)}
+  assert deltas["a"].status == "ok"
+  assert deltas["b"].status == "regression" and abs(deltas["b"].delta - 0.1) < 1e-9
+  assert deltas["c"].status == "improvement"
+  assert deltas["d"].status == "removed"
+  assert deltas["e"].status == "new"
+  assert [d.entry for d in regressions(deltas.values())] == ["b"]
+  assert [d.entry for d in new_entries(deltas.values())] == ["e"]
+  assert "+10.00%" in format_deltas(list(deltas.values()))
+
+
+def test_report_roundtrip(tmp_path):
+  class Tx:
+    gas_used = 123456
+  report = GasReport()
+  report.record("GeVault.deposit[ticks=4]", Tx())
+  report.record("GeVault.withdraw[ticks=4]", 654321)
+  path = tmp_path / "gas.json"
+  save(path, report.entries)
+  assert load(path) == {"GeVault.deposit[ticks=4]": 123456, "GeVault.withdraw[ticks=4]": 654321}
+  assert load(tmp_path / "missing.json") == {}
+
+
+def test_intrinsic_gas():
+  assert intrinsic_gas("0x") == 21000
+  assert intrinsic_gas("0x00ff") == 21000 + 4 + 16
+  assert intrinsic_gas(bytes(3)) == 21000 + 3 * 4
+  class Tx:
+    gas_used = 50000
+    input = "0xa9059cbb00"
+  assert execution_gas(Tx()) == 50000 - 21000 - 4 * 16 - 4
+
+
+def test_strict(tmp_path, monkeypatch):
+  save(tmp_path / "base.json", {"a": 1000})
+  save(tmp_path / "head.json", {"a": 1000, "b": 500})
+  for strict, code in [([], 0), (["--strict"], 1)]:
+    monkeypatch.setattr(sys, "argv", ["gas_benchmark", str(tmp_path / "base.json"), str(tmp_path / "head.json")] + strict)
+    with pytest.raises(SystemExit) as e: main()
+    assert e.value.code == code
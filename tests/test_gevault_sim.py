@@ -0,0 +1,41 @@
+import pytest
+np = pytest.importorskip("numpy")
+from scripts.gevault_sim import *
+
+TICKS = [1000, 1100, 1200, 1300, 1400, 1500]
+LAYOUT = VaultLayout("TEST", TICKS, 500)
+
+
+def test_active_tick_index():
+  # same as getActiveTickIndex: first tick at or above price
+  assert list(get_active_tick_index(TICKS, [900, 1000, 1001, 1262, 1500, 1600])) == [0, 0, 1, 3, 5, 6]
+
+
+def test_adjusted_base_fee():
+  assert adjusted_base_fee(20, 1e6, 1e6, True) == 19
+  assert adjusted_base_fee(20, 1e6, 1e7, True) == 10
+  assert adjusted_base_fee(20, 1e6, 1e7, False) == 30
+
+
+def test_simulate_flat_price():
+  result = simulate(np.full(1000, 1262.), LAYOUT, tvl=1e6)
+  assert result.rebalances == 0 and result.fees_value == 0
+  assert np.allclose(result.tvl, 1e6)
+
+
+def test_simulate_rebalances(tmp_path):
+  prices = np.concatenate([np.linspace(1262, 1450, 500), np.linspace(1450, 1050, 1000)])
+  path = tmp_path / "prices.csv"
+  path.write_text("timestamp,price\n" + "\n".join(f"{k},{p}" for k, p in enumerate(prices)))
+  prices = load_prices(path)
+  
+  result = simulate(prices, LAYOUT, VaultParams(rebalance_mode="tick"))
+  # rebalances happen exactly when the active tick moves
+  assert result.rebalances == np.count_nonzero(np.diff(get_active_tick_index(TICKS, prices)))
+  assert result.fees_value > 0 and result.treasury_value > 0
+  assert result.gas > 0 and len(result.tvl) == len(prices)
+
+  # full range drift triggers more rebalances
+  needed = simulate(prices, LAYOUT, VaultParams(rebalance_mode="needed", full_range_threshold_x4=10))
+  assert needed.rebalances > result.rebalances
+  assert deposit_fee(result, VaultParams(), 0, 1e6, False) == 1e6 * 19 / 1e4
@@ -0,0 +1,79 @@
+import pytest
+import math
+import random
+from scripts.uniswap_math import *
+
+np = pytest.importorskip("numpy")
+
+
+# Sqrt price of a reserve ratio as a Q64.96, same as the Uniswap tests encodePriceSqrt
+def encodePriceSqrt(reserve1, reserve0):
+  return math.isqrt(reserve1 * 2**192 // reserve0)
+
+
+def test_full_math():
+  assert mul_div(2**255, 2, 4) == 2**254
+  assert mul_div(2**256 - 1, 2**256 - 1, 2**256 - 1) == 2**256 - 1
+  assert mul_div_rounding_up(Q96, 1, 3) == Q96 // 3 + 1
+  assert mul_div_rounding_up(Q96, 3, 3) == Q96
+  with pytest.raises(ValueError): mul_div(1, 1, 0)
+  with pytest.raises(ValueError): mul_div(2**256 - 1, 2, 1)
+  with pytest.raises(ValueError): mul_div_rounding_up(2**256 - 1, 2**256 - 1, 2**256 - 2)
+
+
+def test_tick_math():
+  assert get_sqrt_ratio_at_tick(0) == Q96
+  assert get_sqrt_ratio_at_tick(MIN_TICK) == MIN_SQRT_RATIO
+  assert get_sqrt_ratio_at_tick(MAX_TICK) == MAX_SQRT_RATIO
+  assert get_tick_at_sqrt_ratio(MIN_SQRT_RATIO) == MIN_TICK
+  assert get_tick_at_sqrt_ratio(MAX_SQRT_RATIO - 1) == MAX_TICK - 1
+  with pytest.raises(ValueError, match="T"): get_sqrt_ratio_at_tick(MAX_TICK + 1)
+  with pytest.raises(ValueError, match="R"): get_tick_at_sqrt_ratio(MAX_SQRT_RATIO)
+
+  random.seed(0)
+  ticks = [random.randint(MIN_TICK + 1, MAX_TICK - 1) for _ in range(1000)]
+  for t in ticks:
+    sqrtPriceX96 = get_sqrt_ratio_at_tick(t)
+    assert get_tick_at_sqrt_ratio(sqrtPriceX96) == t
+    assert get_tick_at_sqrt_ratio(sqrtPriceX96 - 1) == t - 1
+    assert abs(sqrtPriceX96 / Q96 - math.sqrt(1.0001 ** t)) <= 1e-9 * math.sqrt(1.0001 ** t)
+
+  # vectorised results are the same as scalar results
+  ticks = np.array(ticks, dtype=np.int64)
+  sqrtPrices = get_sqrt_ratio_at_tick(ticks)
+  assert list(sqrtPrices) == [get_sqrt_ratio_at_tick(int(t)) for t in ticks]
+  assert list(get_tick_at_sqrt_ratio(sqrtPrices)) == list(ticks)
+  with pytest.raises(ValueError): get_sqrt_ratio_at_tick(np.array([0, MAX_TICK + 1]))
+
+
+def test_liquidity_amounts():
+  sqrtPriceX96 = encodePriceSqrt(1, 1)
+  sqrtPriceAX96 = encodePriceSqrt(100, 110)
+  sqrtPriceBX96 = encodePriceSqrt(110, 100)
+  # price in range, below and above
+  assert get_liquidity_for_amounts(sqrtPriceX96, sqrtPriceAX96, sqrtPriceBX96, 100, 200) == 2148
+  assert get_liquidity_for_amounts(encodePriceSqrt(99, 110), sqrtPriceAX96, sqrtPriceBX96, 100, 200) == 1048
+  assert get_liquidity_for_amounts(encodePriceSqrt(111, 100), sqrtPriceAX96, sqrtPriceBX96, 100, 200) == 2097
+  assert get_amounts_for_liquidity(sqrtPriceX96, sqrtPriceAX96, sqrtPriceBX96, 2148) == (99, 99)
+  assert get_amounts_for_liquidity(encodePriceSqrt(99, 110), sqrtPriceAX96, sqrtPriceBX96, 1048) == (99, 0)
+  assert get_amounts_for_liquidity(encodePriceSqrt(111, 100), sqrtPriceAX96, sqrtPriceBX96, 2097) == (0, 199)
+  # bounds can be passed in any order
+  assert get_amounts_for_liquidity(sqrtPriceX96, sqrtPriceBX96, sqrtPriceAX96, 2148) == (99, 99)
+
+  # vectorised over prices, with uint64 liquidities
+  random.seed(0)
+  lower, upper = get_sqrt_ratio_at_tick(-1000), get_sqrt_ratio_at_tick(1000)
+  prices = [get_sqrt_ratio_at_tick(random.randint(-2000, 2000)) for _ in range(1000)]
+  liquidities = np.array([random.randint(1, 2**63) for _ in range(1000)], dtype=np.uint64)
+  amounts0, amounts1 = get_amounts_for_liquidity(np.array(prices, dtype=object), lower, upper, liquidities)
+  for k in range(1000):
+    assert (amounts0[k], amounts1[k]) == get_amounts_for_liquidity(prices[k], lower, upper, int(liquidities[k]))
+  liquidity = get_liquidity_for_amounts(np.array(prices, dtype=object), lower, upper, amounts0, amounts1)
+  for k in range(1000):
+    assert liquidity[k] == get_liquidity_for_amounts(prices[k], lower, upper, amounts0[k], amounts1[k])
+
+
+def test_benchmark():
+  rates = benchmark(1000)
+  assert set(rates) == {"get_sqrt_ratio_at_tick", "get_amounts_for_liquidity", "get_liquidity_for_amounts"}
+  assert all(r > 0 for r in rates.values())